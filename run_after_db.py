@@ -3,6 +3,7 @@
 database to be up and running.
 """
 import os
+import sys
 import time
 import argparse
 
@@ -34,4 +35,4 @@ for _ in range(MAX_RETRIES):
     time.sleep(1)
 
 print('Executing command: ', command)
-os.system(command)
+sys.exit(os.waitstatus_to_exitcode(os.system(command)))
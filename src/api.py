@@ -1,20 +1,57 @@
 """Definição das rotas, endpoints e seu comportamento na API.
 """
 
+import asyncio
+import logging
 import os
-from typing import Union, Optional
+from typing import Awaitable, Callable, Union, Optional
+from datetime import date, datetime
 import json
 
-from fastapi import Depends, FastAPI, HTTPException, status, Header, Response
+from fastapi import Depends, FastAPI, HTTPException, status, Header, Query, Response
+from fastapi import Request
 from fastapi.openapi.utils import get_openapi
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fief_client import FiefUserInfo, FiefAccessTokenInfo
+from pydantic import BaseModel
 from sqlalchemy.exc import IntegrityError
+import models
 import schemas
+import cache
 import crud
-from db_config import DbContextManager, create_db_and_tables
+import db_config
+import exportacao
+import lote
+import metricas
+import migracoes
+from util import (
+    codificar_cursor,
+    codificar_cursor_alteracoes,
+    content_hash,
+    decodificar_cursor,
+    decodificar_cursor_alteracoes,
+    etag_matches,
+    http_date,
+)
+from db_config import (
+    COOKIE_ULTIMA_ESCRITA,
+    READ_YOUR_WRITES_SECONDS,
+    SQLALCHEMY_DATABASE_URL,
+    DbContextManager,
+    cookie_escrita,
+    estatisticas_pool,
+    sessao_leitura,
+)
 from users import auth_backend
 
+# Quantidade padrão e máxima de itens por página das listagens
+LIMITE_PAGINA_PADRAO = 100
+LIMITE_PAGINA_MAXIMO = 1000
+# Tamanho máximo, em bytes, do conteúdo de um envio em lote assíncrono
+JOB_MAX_BYTES = int(os.environ.get("JOB_MAX_BYTES", str(100 * 1024 * 1024)))
+
+logger = logging.getLogger(__name__)
+
 with open("../docs/description.md", "r", encoding="utf-8") as f:
     description = f.read()
 
@@ -30,6 +67,47 @@ app = FastAPI(
 )
 
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Métricas da API no formato do Prometheus."""
+    conteudo, media_type = metricas.gerar_metricas()
+    return Response(content=conteudo, media_type=media_type)
+
+
+@app.middleware("http")
+async def registrar_escritas(request: Request, call_next):
+    """Registra as gravações bem-sucedidas de cada cliente em um cookie,
+    para que as suas consultas seguintes leiam do banco primário."""
+    response = await call_next(request)
+    if (
+        request.method not in ("GET", "HEAD", "OPTIONS")
+        and response.status_code < 400
+        and db_config.replica_session_makers
+    ):
+        response.set_cookie(**cookie_escrita())
+    return response
+
+
+# Adicionado por último, para medir também os demais middlewares
+app.add_middleware(metricas.MetricasMiddleware)
+
+
+def get_db_leitura(
+    request: Request,
+    x_ler_primario: Optional[bool] = Header(
+        default=None,
+        description="Faz a consulta no banco primário, e não em uma réplica "
+        "de leitura. Após uma gravação, isso é feito por "
+        f"{READ_YOUR_WRITES_SECONDS:g} segundos mesmo sem este cabeçalho.",
+    ),
+) -> DbContextManager:
+    """Dependência que fornece a sessão das consultas: em uma réplica de
+    leitura, se houver, ou no banco primário."""
+    return sessao_leitura(
+        request.cookies.get(COOKIE_ULTIMA_ESCRITA), bool(x_ler_primario)
+    )
+
+
 @app.get("/user", summary="Consulta usuário da API", tags=["api"])
 async def get_user(
     user: FiefUserInfo = Depends(auth_backend.current_user()),
@@ -38,9 +116,41 @@ async def get_user(
     return user
 
 
+@app.get(
+    "/estatisticas/pool",
+    summary="Consulta estatísticas do pool de conexões",
+    tags=["api"],
+)
+async def get_estatisticas_pool(
+    user: FiefUserInfo = Depends(auth_backend.current_user()),
+):
+    """Estado do pool de conexões ao banco de dados do processo que atende
+    a requisição: conexões livres, em uso e excedentes (overflow), e o
+    histograma do tempo de espera por uma conexão, em segundos."""
+    return estatisticas_pool()
+
+
 @app.on_event("startup")
 async def on_startup():
-    await create_db_and_tables()
+    # o esquema do banco é criado e alterado pelo comando migracoes.py
+    pendentes = await asyncio.to_thread(migracoes.migracoes_pendentes)
+    if pendentes:
+        logger.warning(
+            "Migrações pendentes no banco de dados: %s",
+            ", ".join(str(versao) for versao, _ in pendentes),
+        )
+    if cache.PLAN_CACHE_SIZE > 0:
+        app.state.escuta_cache = asyncio.create_task(
+            cache.escutar_notificacoes(SQLALCHEMY_DATABASE_URL)
+        )
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    escuta_cache = getattr(app.state, "escuta_cache", None)
+    if escuta_cache is not None:
+        escuta_cache.cancel()
+    metricas.encerrar_processo()
 
 
 @app.get("/", include_in_schema=False)
@@ -57,29 +167,183 @@ async def docs_redirect(accept: Union[str, None] = Header(default="text/html")):
     )
 
 
+def cabecalhos_versao(etag: Optional[str], data_modificacao: datetime) -> dict:
+    """Monta os cabeçalhos ETag e Last-Modified de um recurso.
+
+    Args:
+        etag (Optional[str]): ETag do recurso, se houver.
+        data_modificacao (datetime): Data da última modificação.
+
+    Returns:
+        dict: Os cabeçalhos.
+    """
+    headers = {"Last-Modified": http_date(data_modificacao)}
+    if etag:
+        headers["ETag"] = etag
+    return headers
+
+
+async def consultar_plano(
+    tipo: str,
+    cod_SIAPE_instituidora: int,
+    id_plano: int,
+    get_versao: Callable[[], Awaitable[Optional[tuple]]],
+    get_plano: Callable[[], Awaitable[Optional[models.Base]]],
+    schema: type,
+    db: DbContextManager,
+    if_none_match: Optional[str] = None,
+) -> Optional[tuple[dict, Optional[bytes]]]:
+    """Consulta um plano, usando o cache de consultas de planos.
+
+    Em caso de ausência no cache, a versão do plano é consultada primeiro:
+    se ela constar de if_none_match, o plano não é carregado e a resposta
+    não tem corpo. Caso contrário, o plano é carregado do banco de dados e
+    gravado no cache, inclusive quando não é encontrado. Se houver
+    réplicas de leitura, as consultas que precisam ler as próprias
+    gravações ignoram o cache e vão ao primário, e os planos lidos de uma
+    réplica, que pode estar atrasada, ficam no cache por no máximo
+    cache.PLAN_CACHE_REPLICA_TTL segundos.
+
+    Args:
+        tipo (str): plano_trabalho ou plano_entregas.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        id_plano (int): id do plano.
+        get_versao (Callable): Consulta a versão do plano no banco.
+        get_plano (Callable): Consulta o plano no banco.
+        schema (type): Esquema usado para serializar o plano.
+        db (DbContextManager): Sessão usada pelas consultas ao banco.
+        if_none_match (Optional[str]): Cabeçalho If-None-Match da
+            requisição.
+
+    Returns:
+        Optional[tuple[dict, Optional[bytes]]]: Os cabeçalhos de versão e
+            o corpo JSON da resposta, que pode ser None se a versão
+            constar de if_none_match, ou None se o plano não existir.
+    """
+    chave = (cod_SIAPE_instituidora, id_plano)
+    if db.replica or not db_config.replica_session_makers:
+        resultado = cache.caches[tipo].get(chave)
+        if resultado is not cache.AUSENTE:
+            return resultado
+
+    geracao = cache.caches[tipo].geracao
+    resultado = None
+    versao = await get_versao()
+    if versao and etag_matches(if_none_match, versao[0]):
+        return cabecalhos_versao(*versao), None
+    if versao:
+        db_plano = await get_plano()
+        if db_plano:
+            with metricas.medir_segmento("serializacao"):
+                corpo = schema.model_validate(db_plano.__dict__).model_dump_json()
+            resultado = (cabecalhos_versao(*versao), corpo.encode())
+    ttl = cache.PLAN_CACHE_REPLICA_TTL if db.replica else None
+    cache.caches[tipo].set(chave, resultado, geracao, ttl)
+    return resultado
+
+
+def ler_cursor(cursor: Optional[str]) -> Optional[tuple[datetime, int]]:
+    """Lê o cursor de uma listagem paginada.
+
+    Raises:
+        HTTPException: Se o cursor for inválido.
+    """
+    if cursor is None:
+        return None
+    try:
+        return decodificar_cursor(cursor)
+    except ValueError as exception:
+        raise HTTPException(
+            status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Cursor inválido"
+        ) from exception
+
+
+def validar_periodo(data_inicio: Optional[date], data_termino: Optional[date]):
+    """Verifica o período informado nos filtros de uma listagem.
+
+    Raises:
+        HTTPException: Se o início for posterior ao término.
+    """
+    if data_inicio is not None and data_termino is not None:
+        if data_inicio > data_termino:
+            raise HTTPException(
+                status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="data_termino deve ser maior ou igual que data_inicio.",
+            )
+
+
+def montar_pagina(
+    planos: list[tuple[BaseModel, datetime]], limite: int, campo_id: str
+) -> Response:
+    """Monta a resposta de uma página de uma listagem de planos.
+
+    Args:
+        planos (list[tuple[BaseModel, datetime]]): Planos consultados, com
+            até um plano além do limite, que indica a existência de uma
+            próxima página.
+        limite (int): Quantidade de planos da página.
+        campo_id (str): Nome do campo do id dos planos.
+
+    Returns:
+        Response: A página, com o cursor da próxima página, se houver.
+    """
+    proximo_cursor = None
+    if len(planos) > limite:
+        planos = planos[:limite]
+        ultimo, data_modificacao = planos[-1]
+        proximo_cursor = codificar_cursor(data_modificacao, getattr(ultimo, campo_id))
+    with metricas.medir_segmento("serializacao"):
+        corpo = schemas.PaginaSchema(
+            itens=[plano for plano, _ in planos], proximo_cursor=proximo_cursor
+        ).model_dump_json()
+    return Response(content=corpo, media_type="application/json")
+
+
 @app.get(
     "/organizacao/{cod_SIAPE_instituidora}/plano_trabalho/{id_plano_trabalho_participante}",
     summary="Consulta plano de trabalho",
     response_model=schemas.PlanoTrabalhoSchema,
     tags=["plano de trabalho"],
+    dependencies=[Depends(metricas.orcamento_consultas(2))],
 )
 async def get_plano_trabalho(
     id_plano_trabalho_participante: int,
-    db: DbContextManager = Depends(DbContextManager),
+    if_none_match: Optional[str] = Header(default=None),
+    db: DbContextManager = Depends(get_db_leitura),
     user: FiefUserInfo = Depends(auth_backend.current_user()),
 ):
-    "Consulta o plano de trabalho com o código especificado."
-    db_plano_trabalho = await crud.get_plano_trabalho(
-        db_session=db,
-        cod_SIAPE_instituidora=user["fields"]["cod_SIAPE_instituidora"],
-        id_plano_trabalho_participante=id_plano_trabalho_participante,
+    """Consulta o plano de trabalho com o código especificado.
+
+    A resposta informa a versão do plano nos cabeçalhos ETag e
+    Last-Modified. Se a ETag constar do cabeçalho If-None-Match, a
+    resposta tem o código 304, sem corpo."""
+    cod_SIAPE_instituidora = user["fields"]["cod_SIAPE_instituidora"]
+    resultado = await consultar_plano(
+        tipo="plano_trabalho",
+        cod_SIAPE_instituidora=cod_SIAPE_instituidora,
+        id_plano=id_plano_trabalho_participante,
+        get_versao=lambda: crud.get_versao_plano_trabalho(
+            db_session=db,
+            cod_SIAPE_instituidora=cod_SIAPE_instituidora,
+            id_plano_trabalho_participante=id_plano_trabalho_participante,
+        ),
+        get_plano=lambda: crud.get_plano_trabalho(
+            db_session=db,
+            cod_SIAPE_instituidora=cod_SIAPE_instituidora,
+            id_plano_trabalho_participante=id_plano_trabalho_participante,
+        ),
+        schema=schemas.PlanoTrabalhoSchema,
+        db=db,
+        if_none_match=if_none_match,
     )
-    if not db_plano_trabalho:
+    if not resultado:
         raise HTTPException(
             status.HTTP_404_NOT_FOUND, detail="Plano de trabalho não encontrado"
         )
-    # plano_trabalho = schemas.PlanoTrabalhoSchema.model_validate(db_plano_trabalho.__dict__)
-    return db_plano_trabalho.__dict__
+    headers, corpo = resultado
+    if corpo is None or etag_matches(if_none_match, headers.get("ETag")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=corpo, media_type="application/json", headers=headers)
 
 
 @app.put(
@@ -87,12 +351,14 @@ async def get_plano_trabalho(
     summary="Cria ou substitui plano de trabalho",
     response_model=schemas.PlanoTrabalhoSchema,
     tags=["plano de trabalho"],
+    dependencies=[Depends(metricas.orcamento_consultas(10))],
 )
 async def create_or_update_plano_trabalho(
     cod_SIAPE_instituidora: int,
     id_plano_trabalho_participante: int,
     plano_trabalho: schemas.PlanoTrabalhoSchema,
     response: Response,
+    if_match: Optional[str] = Header(default=None),
     db: DbContextManager = Depends(DbContextManager),
     user: FiefUserInfo = Depends(auth_backend.current_user()),
     # TODO: Obter meios de verificar permissão opcional. O código abaixo
@@ -102,7 +368,11 @@ async def create_or_update_plano_trabalho(
     # ),
 ):
     """Cria um novo plano de trabalho ou, se existente, substitui um
-    plano de trabalho por um novo com os dados informados."""
+    plano de trabalho por um novo com os dados informados.
+
+    Se for informado o cabeçalho If-Match, o plano só é gravado se a sua
+    ETag atual constar do cabeçalho; caso contrário, a resposta tem o
+    código 412."""
 
     # Validações de permissão
     if (
@@ -130,7 +400,10 @@ async def create_or_update_plano_trabalho(
 
     # Validações do esquema
     try:
-        novo_plano_trabalho = schemas.PlanoTrabalhoSchema.model_validate(plano_trabalho)
+        with metricas.medir_segmento("validacao"):
+            novo_plano_trabalho = schemas.PlanoTrabalhoSchema.model_validate(
+                plano_trabalho
+            )
     except Exception as exception:
         message = getattr(exception, "message", str(exception))
         if getattr(exception, "json", None):
@@ -139,52 +412,139 @@ async def create_or_update_plano_trabalho(
             status.HTTP_422_UNPROCESSABLE_ENTITY, detail=message
         ) from exception
 
-    # Verifica se há sobreposição da data de inicio e fim do plano
-    # com planos já existentes
-    conflicting_period = await crud.check_planos_trabalho_per_period(
-        db_session=db,
-        cod_SIAPE_instituidora=cod_SIAPE_instituidora,
-        cod_SIAPE_unidade_exercicio=plano_trabalho.cod_SIAPE_unidade_exercicio,
-        cpf_participante=plano_trabalho.cpf_participante,
-        id_plano_trabalho_participante=plano_trabalho.id_plano_trabalho_participante,
-        data_inicio_plano=plano_trabalho.data_inicio_plano,
-        data_termino_plano=plano_trabalho.data_termino_plano,
+    # Cria ou substitui o plano em uma única transação, verificando antes
+    # se há sobreposição da data de inicio e fim do plano com planos já
+    # existentes
+    novo_plano_trabalho, criado, linhas_alteradas = (
+        await crud.create_or_update_plano_trabalho(
+            db_session=db,
+            plano_trabalho=novo_plano_trabalho,
+            if_match=if_match,
+        )
     )
+    if criado:
+        response.status_code = status.HTTP_201_CREATED
+    response.headers["X-Linhas-Alteradas"] = str(linhas_alteradas)
+    response.headers["ETag"] = f'"{content_hash(novo_plano_trabalho)}"'
+
+    return novo_plano_trabalho
+
 
-    if conflicting_period and not plano_trabalho.cancelado:
-        detail_msg = (
-            "Já existe um plano de trabalho para este "
-            "cod_SIAPE_unidade_exercicio para este cpf_participante "
-            "no período informado."
+@app.post(
+    "/organizacao/{cod_SIAPE_instituidora}/planos_trabalho",
+    summary="Cria ou substitui planos de trabalho em lote",
+    response_model=schemas.ResultadoLoteSchema,
+    response_model_exclude_none=True,
+    tags=["plano de trabalho"],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/x-ndjson": {
+                    "schema": {"$ref": "#/components/schemas/PlanoTrabalhoSchema"}
+                }
+            },
+        }
+    },
+)
+async def create_or_update_planos_trabalho(
+    cod_SIAPE_instituidora: int,
+    request: Request,
+    db: DbContextManager = Depends(DbContextManager),
+    user: FiefUserInfo = Depends(auth_backend.current_user()),
+):
+    """Cria ou substitui vários planos de trabalho em um único envio.
+
+    O corpo da requisição deve conter um plano de trabalho por linha
+    (formato NDJSON), com o mesmo conteúdo aceito pelo envio individual.
+    Os planos são gravados em lotes, cada qual em uma única transação, e
+    o resultado de cada linha é informado na resposta."""
+
+    # Validações de permissão
+    if (
+        cod_SIAPE_instituidora
+        != user["fields"]["cod_SIAPE_instituidora"]
+        # TODO: Dar acesso ao superusuário em todas as unidades.
+        # and "all:write" not in access_token_info["permissions"]
+    ):
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED,
+            detail="Usuário não tem permissão na cod_SIAPE_instituidora informada",
         )
-        raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, detail=detail_msg)
 
-    # Verifica se já existe
-    db_plano_trabalho = await crud.get_plano_trabalho(
+    return await lote.processar_planos_trabalho(
         db_session=db,
         cod_SIAPE_instituidora=cod_SIAPE_instituidora,
-        id_plano_trabalho_participante=id_plano_trabalho_participante,
+        linhas=lote.ler_ndjson(request.stream()),
     )
 
-    try:
-        if not db_plano_trabalho:  # create
-            novo_plano_trabalho = await crud.create_plano_trabalho(
-                db_session=db,
-                plano_trabalho=novo_plano_trabalho,
-            )
-            response.status_code = status.HTTP_201_CREATED
-        else:  # update
-            novo_plano_trabalho = await crud.update_plano_trabalho(
-                db_session=db,
-                plano_trabalho=novo_plano_trabalho,
-            )
-    except IntegrityError as exception:
+
+@app.get(
+    "/organizacao/{cod_SIAPE_instituidora}/planos_trabalho",
+    summary="Lista planos de trabalho",
+    response_model=schemas.PaginaSchema[schemas.PlanoTrabalhoResumoSchema],
+    tags=["plano de trabalho"],
+    dependencies=[Depends(metricas.orcamento_consultas(3))],
+)
+async def list_planos_trabalho(
+    cod_SIAPE_instituidora: int,
+    cursor: Optional[str] = Query(
+        default=None, description="Cursor da página, informado na página anterior."
+    ),
+    limite: int = Query(default=LIMITE_PAGINA_PADRAO, ge=1, le=LIMITE_PAGINA_MAXIMO),
+    completo: bool = Query(
+        default=False,
+        description="Traz os planos completos, com contribuições e "
+        "consolidações, em vez de resumidos.",
+    ),
+    cod_SIAPE_unidade_exercicio: Optional[int] = None,
+    cpf_participante: Optional[str] = None,
+    data_inicio: Optional[date] = Query(
+        default=None,
+        description="Traz os planos vigentes em algum dia a partir desta data.",
+    ),
+    data_termino: Optional[date] = Query(
+        default=None,
+        description="Traz os planos vigentes em algum dia até esta data.",
+    ),
+    cancelado: Optional[bool] = None,
+    db: DbContextManager = Depends(get_db_leitura),
+    user: FiefUserInfo = Depends(auth_backend.current_user()),
+):
+    """Lista os planos de trabalho da unidade instituidora, em ordem de
+    data da última modificação, do mais antigo ao mais recente.
+
+    A listagem é paginada: se houver mais planos, a resposta informa em
+    proximo_cursor o valor do parâmetro cursor da próxima página. Os
+    planos gravados após o início da listagem aparecem nas últimas
+    páginas."""
+
+    # Validações de permissão
+    if (
+        cod_SIAPE_instituidora
+        != user["fields"]["cod_SIAPE_instituidora"]
+        # TODO: Dar acesso ao superusuário em todas as unidades.
+        # and "all:write" not in access_token_info["permissions"]
+    ):
         raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail=f"IntegrityError: {str(exception)}",
-        ) from exception
+            status.HTTP_401_UNAUTHORIZED,
+            detail="Usuário não tem permissão na cod_SIAPE_instituidora informada",
+        )
 
-    return novo_plano_trabalho
+    validar_periodo(data_inicio, data_termino)
+    planos = await crud.list_planos_trabalho(
+        db_session=db,
+        cod_SIAPE_instituidora=cod_SIAPE_instituidora,
+        limite=limite + 1,
+        apos=ler_cursor(cursor),
+        completo=completo,
+        cod_SIAPE_unidade_exercicio=cod_SIAPE_unidade_exercicio,
+        cpf_participante=cpf_participante,
+        data_inicio=data_inicio,
+        data_termino=data_termino,
+        cancelado=cancelado,
+    )
+    return montar_pagina(planos, limite, "id_plano_trabalho_participante")
 
 
 @app.get(
@@ -192,24 +552,46 @@ async def create_or_update_plano_trabalho(
     summary="Consulta plano de entregas",
     response_model=schemas.PlanoEntregasSchema,
     tags=["plano de entregas"],
+    dependencies=[Depends(metricas.orcamento_consultas(2))],
 )
 async def get_plano_entrega(
     id_plano_entrega_unidade: int,
-    db: DbContextManager = Depends(DbContextManager),
+    if_none_match: Optional[str] = Header(default=None),
+    db: DbContextManager = Depends(get_db_leitura),
     user: FiefUserInfo = Depends(auth_backend.current_user()),
 ):
-    "Consulta o plano de entregas com o código especificado."
-    db_plano_entrega = await crud.get_plano_entregas(
-        db_session=db,
-        cod_SIAPE_instituidora=user["fields"]["cod_SIAPE_instituidora"],
-        id_plano_entrega_unidade=id_plano_entrega_unidade,
+    """Consulta o plano de entregas com o código especificado.
+
+    A resposta informa a versão do plano nos cabeçalhos ETag e
+    Last-Modified. Se a ETag constar do cabeçalho If-None-Match, a
+    resposta tem o código 304, sem corpo."""
+    cod_SIAPE_instituidora = user["fields"]["cod_SIAPE_instituidora"]
+    resultado = await consultar_plano(
+        tipo="plano_entregas",
+        cod_SIAPE_instituidora=cod_SIAPE_instituidora,
+        id_plano=id_plano_entrega_unidade,
+        get_versao=lambda: crud.get_versao_plano_entregas(
+            db_session=db,
+            cod_SIAPE_instituidora=cod_SIAPE_instituidora,
+            id_plano_entrega_unidade=id_plano_entrega_unidade,
+        ),
+        get_plano=lambda: crud.get_plano_entregas(
+            db_session=db,
+            cod_SIAPE_instituidora=cod_SIAPE_instituidora,
+            id_plano_entrega_unidade=id_plano_entrega_unidade,
+        ),
+        schema=schemas.PlanoEntregasSchema,
+        db=db,
+        if_none_match=if_none_match,
     )
-    if not db_plano_entrega:
+    if not resultado:
         raise HTTPException(
             status.HTTP_404_NOT_FOUND, detail="Plano de entregas não encontrado"
         )
-    # plano_trabalho = schemas.PlanoTrabalhoSchema.model_validate(db_plano_trabalho.__dict__)
-    return db_plano_entrega.__dict__
+    headers, corpo = resultado
+    if corpo is None or etag_matches(if_none_match, headers.get("ETag")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=corpo, media_type="application/json", headers=headers)
 
 
 @app.put(
@@ -217,12 +599,14 @@ async def get_plano_entrega(
     summary="Cria ou substitui plano de entregas",
     response_model=schemas.PlanoEntregasSchema,
     tags=["plano de entregas"],
+    dependencies=[Depends(metricas.orcamento_consultas(10))],
 )
 async def create_or_update_plano_entregas(
     cod_SIAPE_instituidora: int,
     id_plano_entrega_unidade: int,
     plano_entregas: schemas.PlanoEntregasSchema,
     response: Response,
+    if_match: Optional[str] = Header(default=None),
     db: DbContextManager = Depends(DbContextManager),
     user: FiefUserInfo = Depends(auth_backend.current_user()),
     # TODO: Obter meios de verificar permissão opcional. O código abaixo
@@ -232,7 +616,11 @@ async def create_or_update_plano_entregas(
     # ),
 ):
     """Cria um novo plano de entregas ou, se existente, substitui um
-    plano de entregas por um novo com os dados informados."""
+    plano de entregas por um novo com os dados informados.
+
+    Se for informado o cabeçalho If-Match, o plano só é gravado se a sua
+    ETag atual constar do cabeçalho; caso contrário, a resposta tem o
+    código 412."""
 
     # Validações de permissão
     if (
@@ -260,7 +648,10 @@ async def create_or_update_plano_entregas(
 
     # Validações do esquema
     try:
-        novo_plano_entregas = schemas.PlanoEntregasSchema.model_validate(plano_entregas)
+        with metricas.medir_segmento("validacao"):
+            novo_plano_entregas = schemas.PlanoEntregasSchema.model_validate(
+                plano_entregas
+            )
     except Exception as exception:
         message = getattr(exception, "message", str(exception))
         if getattr(exception, "json", None):
@@ -269,49 +660,237 @@ async def create_or_update_plano_entregas(
             status.HTTP_422_UNPROCESSABLE_ENTITY, detail=message
         ) from exception
 
-    # Verifica se há sobreposição da data de inicio e fim do plano
-    # com planos já existentes
-    conflicting_period = await crud.check_planos_entregas_unidade_per_period(
+    # Cria ou atualiza o plano em uma única transação, verificando antes
+    # se há sobreposição da data de inicio e fim do plano com planos já
+    # existentes
+    try:
+        novo_plano_entregas, criado, linhas_alteradas = (
+            await crud.create_or_update_plano_entregas(
+                db_session=db,
+                plano_entregas=novo_plano_entregas,
+                if_match=if_match,
+            )
+        )
+    except IntegrityError as exception:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"IntegrityError: {str(exception)}",
+        ) from exception
+    if criado:
+        response.status_code = status.HTTP_201_CREATED
+    response.headers["X-Linhas-Alteradas"] = str(linhas_alteradas)
+    response.headers["ETag"] = f'"{content_hash(novo_plano_entregas)}"'
+
+    return novo_plano_entregas
+
+
+@app.post(
+    "/organizacao/{cod_SIAPE_instituidora}/planos_entregas",
+    summary="Cria ou atualiza planos de entregas em lote",
+    response_model=schemas.ResultadoLoteSchema,
+    response_model_exclude_none=True,
+    tags=["plano de entregas"],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/x-ndjson": {
+                    "schema": {"$ref": "#/components/schemas/PlanoEntregasSchema"}
+                }
+            },
+        }
+    },
+)
+async def create_or_update_planos_entregas(
+    cod_SIAPE_instituidora: int,
+    request: Request,
+    db: DbContextManager = Depends(DbContextManager),
+    user: FiefUserInfo = Depends(auth_backend.current_user()),
+):
+    """Cria ou atualiza vários planos de entregas em um único envio.
+
+    O corpo da requisição deve conter um plano de entregas por linha
+    (formato NDJSON), com o mesmo conteúdo aceito pelo envio individual.
+    Os planos e as suas entregas são gravados em lotes, cada qual em uma
+    única transação, e o resultado de cada linha é informado na
+    resposta."""
+
+    # Validações de permissão
+    if (
+        cod_SIAPE_instituidora
+        != user["fields"]["cod_SIAPE_instituidora"]
+        # TODO: Dar acesso ao superusuário em todas as unidades.
+        # and "all:write" not in access_token_info["permissions"]
+    ):
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED,
+            detail="Usuário não tem permissão na cod_SIAPE_instituidora informada",
+        )
+
+    return await lote.processar_planos_entregas(
         db_session=db,
         cod_SIAPE_instituidora=cod_SIAPE_instituidora,
-        cod_SIAPE_unidade_plano=plano_entregas.cod_SIAPE_unidade_plano,
-        id_plano_entrega_unidade=plano_entregas.id_plano_entrega_unidade,
-        data_inicio_plano_entregas=plano_entregas.data_inicio_plano_entregas,
-        data_termino_plano_entregas=plano_entregas.data_termino_plano_entregas,
+        linhas=lote.ler_ndjson(request.stream()),
     )
 
-    if conflicting_period and not plano_entregas.cancelado:
-        detail_msg = (
-            "Já existe um plano de entregas para este "
-            "cod_SIAPE_unidade_plano no período informado."
+
+@app.get(
+    "/organizacao/{cod_SIAPE_instituidora}/planos_entregas",
+    summary="Lista planos de entregas",
+    response_model=schemas.PaginaSchema[schemas.PlanoEntregasResumoSchema],
+    tags=["plano de entregas"],
+    dependencies=[Depends(metricas.orcamento_consultas(2))],
+)
+async def list_planos_entregas(
+    cod_SIAPE_instituidora: int,
+    cursor: Optional[str] = Query(
+        default=None, description="Cursor da página, informado na página anterior."
+    ),
+    limite: int = Query(default=LIMITE_PAGINA_PADRAO, ge=1, le=LIMITE_PAGINA_MAXIMO),
+    completo: bool = Query(
+        default=False,
+        description="Traz os planos completos, com as entregas, em vez de "
+        "resumidos.",
+    ),
+    cod_SIAPE_unidade_plano: Optional[int] = None,
+    data_inicio: Optional[date] = Query(
+        default=None,
+        description="Traz os planos vigentes em algum dia a partir desta data.",
+    ),
+    data_termino: Optional[date] = Query(
+        default=None,
+        description="Traz os planos vigentes em algum dia até esta data.",
+    ),
+    cancelado: Optional[bool] = None,
+    db: DbContextManager = Depends(get_db_leitura),
+    user: FiefUserInfo = Depends(auth_backend.current_user()),
+):
+    """Lista os planos de entregas da unidade instituidora, em ordem de
+    data da última modificação, do mais antigo ao mais recente.
+
+    A listagem é paginada: se houver mais planos, a resposta informa em
+    proximo_cursor o valor do parâmetro cursor da próxima página. Os
+    planos gravados após o início da listagem aparecem nas últimas
+    páginas."""
+
+    # Validações de permissão
+    if (
+        cod_SIAPE_instituidora
+        != user["fields"]["cod_SIAPE_instituidora"]
+        # TODO: Dar acesso ao superusuário em todas as unidades.
+        # and "all:write" not in access_token_info["permissions"]
+    ):
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED,
+            detail="Usuário não tem permissão na cod_SIAPE_instituidora informada",
         )
-        raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, detail=detail_msg)
 
-    # Verifica se já existe
-    db_plano_entregas = await crud.get_plano_entregas(
+    validar_periodo(data_inicio, data_termino)
+    planos = await crud.list_planos_entregas(
+        db_session=db,
+        cod_SIAPE_instituidora=cod_SIAPE_instituidora,
+        limite=limite + 1,
+        apos=ler_cursor(cursor),
+        completo=completo,
+        cod_SIAPE_unidade_plano=cod_SIAPE_unidade_plano,
+        data_inicio=data_inicio,
+        data_termino=data_termino,
+        cancelado=cancelado,
+    )
+    return montar_pagina(planos, limite, "id_plano_entrega_unidade")
+
+
+@app.get(
+    "/organizacao/{cod_SIAPE_instituidora}/plano_entregas/{id_plano_entrega_unidade}"
+    "/agregados",
+    summary="Consulta os totais de um plano de entregas",
+    response_model=schemas.AgregadosPlanoEntregasSchema,
+    tags=["plano de entregas"],
+    dependencies=[Depends(metricas.orcamento_consultas(2))],
+)
+async def get_agregados_plano_entregas(
+    cod_SIAPE_instituidora: int,
+    id_plano_entrega_unidade: int,
+    db: DbContextManager = Depends(get_db_leitura),
+    user: FiefUserInfo = Depends(auth_backend.current_user()),
+):
+    """Consulta a média do percentual de progresso realizado das entregas
+    de um plano de entregas e as horas vinculadas a cada entrega pelas
+    contribuições dos planos de trabalho não cancelados.
+
+    Os totais são mantidos a cada gravação de planos de entregas e de
+    planos de trabalho, então a consulta não depende da quantidade de
+    contribuições."""
+
+    # Validações de permissão
+    if (
+        cod_SIAPE_instituidora
+        != user["fields"]["cod_SIAPE_instituidora"]
+        # TODO: Dar acesso ao superusuário em todas as unidades.
+        # and "all:write" not in access_token_info["permissions"]
+    ):
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED,
+            detail="Usuário não tem permissão na cod_SIAPE_instituidora informada",
+        )
+
+    agregados = await crud.get_agregados_plano_entregas(
         db_session=db,
         cod_SIAPE_instituidora=cod_SIAPE_instituidora,
         id_plano_entrega_unidade=id_plano_entrega_unidade,
     )
+    if agregados is None:
+        raise HTTPException(
+            status.HTTP_404_NOT_FOUND, detail="Plano de entregas não encontrado"
+        )
+    return agregados
 
-    try:
-        if not db_plano_entregas:  # create
-            novo_plano_entregas = await crud.create_plano_entregas(
-                db_session=db,
-                plano_entregas=novo_plano_entregas,
-            )
-            response.status_code = status.HTTP_201_CREATED
-        else:  # update
-            novo_plano_entregas = await crud.update_plano_entregas(
-                db_session=db,
-                plano_entregas=novo_plano_entregas,
-            )
-        return novo_plano_entregas
-    except IntegrityError as exception:
+
+@app.get(
+    "/organizacao/{cod_SIAPE_instituidora}/agregados/horas",
+    summary="Consulta as horas vinculadas às entregas por unidade e mês",
+    response_model=list[schemas.HorasUnidadeSchema],
+    tags=["plano de entregas"],
+    dependencies=[Depends(metricas.orcamento_consultas(1))],
+)
+async def list_horas_unidades(
+    cod_SIAPE_instituidora: int,
+    cod_SIAPE_unidade_plano: Optional[int] = None,
+    data_inicio: Optional[date] = Query(
+        default=None,
+        description="Considera somente as entregas a partir desta data.",
+    ),
+    data_termino: Optional[date] = Query(
+        default=None,
+        description="Considera somente as entregas até esta data.",
+    ),
+    db: DbContextManager = Depends(get_db_leitura),
+    user: FiefUserInfo = Depends(auth_backend.current_user()),
+):
+    """Soma as horas vinculadas às entregas dos planos de entregas de cada
+    unidade de execução, por mês da data da entrega, a partir dos totais
+    mantidos para cada entrega."""
+
+    # Validações de permissão
+    if (
+        cod_SIAPE_instituidora
+        != user["fields"]["cod_SIAPE_instituidora"]
+        # TODO: Dar acesso ao superusuário em todas as unidades.
+        # and "all:write" not in access_token_info["permissions"]
+    ):
         raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail=f"IntegrityError: {str(exception)}",
-        ) from exception
+            status.HTTP_401_UNAUTHORIZED,
+            detail="Usuário não tem permissão na cod_SIAPE_instituidora informada",
+        )
+
+    validar_periodo(data_inicio, data_termino)
+    return await crud.list_horas_unidades(
+        db_session=db,
+        cod_SIAPE_instituidora=cod_SIAPE_instituidora,
+        cod_SIAPE_unidade_plano=cod_SIAPE_unidade_plano,
+        data_inicio=data_inicio,
+        data_termino=data_termino,
+    )
 
 
 @app.get(
@@ -319,14 +898,21 @@ async def create_or_update_plano_entregas(
     summary="Consulta Status do Participante",
     response_model=schemas.ListaStatusParticipanteSchema,
     tags=["status participante"],
+    dependencies=[Depends(metricas.orcamento_consultas(2))],
 )
 async def get_status_participante(
     cod_SIAPE_instituidora: int,
     cpf_participante: str,
-    db: DbContextManager = Depends(DbContextManager),
+    response: Response,
+    if_none_match: Optional[str] = Header(default=None),
+    db: DbContextManager = Depends(get_db_leitura),
     user: FiefUserInfo = Depends(auth_backend.current_user()),
 ) -> schemas.ListaStatusParticipanteSchema:
-    "Consulta o status do participante a partir da matricula SIAPE."
+    """Consulta o status do participante a partir da matricula SIAPE.
+
+    A resposta informa a versão da lista de status nos cabeçalhos ETag e
+    Last-Modified. Se a ETag constar do cabeçalho If-None-Match, a
+    resposta tem o código 304, sem corpo."""
 
      # Validações de permissão
     if (
@@ -340,6 +926,20 @@ async def get_status_participante(
             detail="Usuário não tem permissão na cod_SIAPE_instituidora informada",
         )
 
+    versao = await crud.get_versao_status_participante(
+        db_session=db,
+        cod_SIAPE_instituidora=user["fields"]["cod_SIAPE_instituidora"],
+        cpf_participante=cpf_participante,
+    )
+    if not versao:
+        raise HTTPException(
+            status.HTTP_404_NOT_FOUND, detail="Status de Participante não encontrado"
+        )
+    headers = cabecalhos_versao(*versao)
+    if etag_matches(if_none_match, versao[0]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+
     lista_status_participante = await crud.get_status_participante(
         db_session=db,
         cod_SIAPE_instituidora=user["fields"]["cod_SIAPE_instituidora"],
@@ -358,6 +958,7 @@ async def get_status_participante(
     summary="Envia o status de um participante",
     response_model=schemas.ListaStatusParticipanteSchema,
     tags=["status participante"],
+    dependencies=[Depends(metricas.orcamento_consultas(2))],
 )
 async def create_status_participante(
     cod_SIAPE_instituidora: int,
@@ -394,11 +995,12 @@ async def create_status_participante(
 
     # Validações do esquema
     try:
-        nova_lista_status_participante = (
-            schemas.ListaStatusParticipanteSchema.model_validate(
-                lista_status_participante
+        with metricas.medir_segmento("validacao"):
+            nova_lista_status_participante = (
+                schemas.ListaStatusParticipanteSchema.model_validate(
+                    lista_status_participante
+                )
             )
-        )
     except Exception as exception:
         message = getattr(exception, "message", str(exception))
         if getattr(exception, "json", None):
@@ -410,13 +1012,10 @@ async def create_status_participante(
     # Gravar no banco de dados e retornar os dados gravados como Pydantic
     lista_gravada = schemas.ListaStatusParticipanteSchema.model_validate(
         {
-            "lista_status": [
-                await crud.create_status_participante(
-                    db_session=db,
-                    status_participante=status_participante,
-                )
-                for status_participante in nova_lista_status_participante.lista_status
-            ]
+            "lista_status": await crud.create_lista_status_participante(
+                db_session=db,
+                lista_status_participante=nova_lista_status_participante.lista_status,
+            )
         }
     )
 
@@ -424,6 +1023,381 @@ async def create_status_participante(
     return lista_gravada
 
 
+@app.post(
+    "/organizacao/{cod_SIAPE_instituidora}/participantes",
+    summary="Envia os status de vários participantes",
+    response_model=schemas.ListaStatusParticipanteSchema,
+    status_code=status.HTTP_201_CREATED,
+    tags=["status participante"],
+    dependencies=[Depends(metricas.orcamento_consultas(2))],
+)
+async def create_status_participantes(
+    cod_SIAPE_instituidora: int,
+    lista_status_participante: schemas.ListaStatusParticipanteSchema,
+    db: DbContextManager = Depends(DbContextManager),
+    user: FiefUserInfo = Depends(auth_backend.current_user()),
+) -> schemas.ListaStatusParticipanteSchema:
+    """Envia status de Programa de Gestão de um ou mais participantes da
+    mesma unidade instituidora em uma única requisição.
+
+    Todos os status são gravados em uma única transação: se algum deles
+    for inválido, nenhum é gravado."""
+
+    # Validações de permissão
+    if (
+        cod_SIAPE_instituidora
+        != user["fields"]["cod_SIAPE_instituidora"]
+        # TODO: Dar acesso ao superusuário em todas as unidades.
+        # and "all:write" not in access_token_info["permissions"]
+    ):
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED,
+            detail="Usuário não tem permissão na cod_SIAPE_instituidora informada",
+        )
+    if any(
+        cod_SIAPE_instituidora != status_participante.cod_SIAPE_instituidora
+        for status_participante in lista_status_participante.lista_status
+    ):
+        raise HTTPException(
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Parâmetro cod_SIAPE_instituidora na URL e no JSON devem ser iguais",
+        )
+
+    # Validações do esquema
+    try:
+        with metricas.medir_segmento("validacao"):
+            nova_lista_status_participante = (
+                schemas.ListaStatusParticipanteSchema.model_validate(
+                    lista_status_participante
+                )
+            )
+    except Exception as exception:
+        message = getattr(exception, "message", str(exception))
+        if getattr(exception, "json", None):
+            message = json.loads(getattr(exception, "json"))
+        raise HTTPException(
+            status.HTTP_422_UNPROCESSABLE_ENTITY, detail=message
+        ) from exception
+
+    return {
+        "lista_status": await crud.create_lista_status_participante(
+            db_session=db,
+            lista_status_participante=nova_lista_status_participante.lista_status,
+        )
+    }
+
+
+@app.get(
+    "/organizacao/{cod_SIAPE_instituidora}/alteracoes",
+    summary="Consulta o feed de alterações",
+    response_model=schemas.FeedAlteracoesSchema,
+    tags=["alterações"],
+    dependencies=[Depends(metricas.orcamento_consultas(1))],
+)
+async def list_alteracoes(
+    cod_SIAPE_instituidora: int,
+    desde: Optional[str] = Query(
+        default=None,
+        description="Cursor informado em proximo_cursor na consulta anterior. "
+        "Se omitido, o feed é lido desde o início.",
+    ),
+    limite: int = Query(default=LIMITE_PAGINA_PADRAO, ge=1, le=LIMITE_PAGINA_MAXIMO),
+    db: DbContextManager = Depends(DbContextManager),
+    user: FiefUserInfo = Depends(auth_backend.current_user()),
+):
+    """Lista as alterações de planos de trabalho, planos de entregas e
+    status de participantes da unidade instituidora, em ordem de
+    gravação, com o identificador e a versão (ETag) de cada recurso
+    alterado.
+
+    Cada gravação é registrada na mesma transação que a realiza, então
+    o feed não perde alterações. A resposta sempre informa em
+    proximo_cursor o valor do parâmetro desde para a consulta seguinte,
+    que pode ser repetida periodicamente para acompanhar novas
+    alterações."""
+
+    # Validações de permissão
+    if (
+        cod_SIAPE_instituidora
+        != user["fields"]["cod_SIAPE_instituidora"]
+        # TODO: Dar acesso ao superusuário em todas as unidades.
+        # and "all:write" not in access_token_info["permissions"]
+    ):
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED,
+            detail="Usuário não tem permissão na cod_SIAPE_instituidora informada",
+        )
+
+    apos = None
+    if desde is not None:
+        try:
+            apos = decodificar_cursor_alteracoes(desde)
+        except ValueError as exception:
+            raise HTTPException(
+                status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Cursor inválido"
+            ) from exception
+    alteracoes = await crud.list_alteracoes(
+        db_session=db,
+        cod_SIAPE_instituidora=cod_SIAPE_instituidora,
+        limite=limite + 1,
+        apos=apos,
+    )
+    tem_mais = len(alteracoes) > limite
+    alteracoes = alteracoes[:limite]
+    if alteracoes:
+        apos = alteracoes[-1][1]
+    with metricas.medir_segmento("serializacao"):
+        corpo = schemas.FeedAlteracoesSchema(
+            itens=[alteracao for alteracao, _ in alteracoes],
+            proximo_cursor=codificar_cursor_alteracoes(*(apos or (0, 0))),
+            tem_mais=tem_mais,
+        ).model_dump_json()
+    return Response(content=corpo, media_type="application/json")
+
+
+@app.get(
+    "/organizacao/{cod_SIAPE_instituidora}/resumo",
+    summary="Consulta o resumo da organização",
+    response_model=schemas.ResumoOrganizacaoSchema,
+    tags=["resumo"],
+    dependencies=[Depends(metricas.orcamento_consultas(6))],
+)
+async def get_resumo_organizacao(
+    cod_SIAPE_instituidora: int,
+    db: DbContextManager = Depends(get_db_leitura),
+    user: FiefUserInfo = Depends(auth_backend.current_user()),
+):
+    """Consulta as quantidades de planos ativos e cancelados, de
+    participantes por modalidade de execução, de horas por tipo de
+    contribuição e de avaliações, e a distribuição da carga horária dos
+    planos de trabalho da unidade instituidora.
+
+    O resumo fica em cache até a próxima gravação de planos ou de status
+    de participantes da unidade, verificada a cada consulta no feed de
+    alterações."""
+
+    # Validações de permissão
+    if (
+        cod_SIAPE_instituidora
+        != user["fields"]["cod_SIAPE_instituidora"]
+        # TODO: Dar acesso ao superusuário em todas as unidades.
+        # and "all:write" not in access_token_info["permissions"]
+    ):
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED,
+            detail="Usuário não tem permissão na cod_SIAPE_instituidora informada",
+        )
+
+    entrada = cache.caches["resumo"].get(cod_SIAPE_instituidora)
+    if entrada is not cache.AUSENTE:
+        horizonte, corpo = entrada
+        if not await crud.houve_alteracao(
+            db_session=db,
+            cod_SIAPE_instituidora=cod_SIAPE_instituidora,
+            horizonte=horizonte,
+        ):
+            return Response(content=corpo, media_type="application/json")
+
+    geracao = cache.caches["resumo"].geracao
+    horizonte, resumo = await crud.get_resumo_organizacao(
+        db_session=db, cod_SIAPE_instituidora=cod_SIAPE_instituidora
+    )
+    with metricas.medir_segmento("serializacao"):
+        corpo = resumo.model_dump_json().encode()
+    cache.caches["resumo"].set(cod_SIAPE_instituidora, (horizonte, corpo), geracao)
+    return Response(content=corpo, media_type="application/json")
+
+
+# Esquema dos itens exportados de cada tipo
+SCHEMAS_EXPORTACAO = {
+    models.TipoTarefa.planos_trabalho: schemas.PlanoTrabalhoSchema,
+    models.TipoTarefa.planos_entregas: schemas.PlanoEntregasSchema,
+    models.TipoTarefa.participantes: schemas.StatusParticipanteSchema,
+}
+
+
+@app.get(
+    "/organizacao/{cod_SIAPE_instituidora}/exportacao/{tipo}",
+    summary="Exporta todos os dados de um tipo da organização",
+    tags=["exportação"],
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {
+                tipo_conteudo: {"schema": {"type": "string"}}
+                for tipo_conteudo in exportacao.TIPOS_CONTEUDO.values()
+            }
+        }
+    },
+)
+async def exportar(
+    cod_SIAPE_instituidora: int,
+    tipo: models.TipoTarefa,
+    formato: exportacao.FormatoExportacao = exportacao.FormatoExportacao.ndjson,
+    db: DbContextManager = Depends(get_db_leitura),
+    user: FiefUserInfo = Depends(auth_backend.current_user()),
+):
+    """Exporta todos os planos de trabalho, planos de entregas ou status
+    de participantes da unidade instituidora, completos, em NDJSON ou
+    CSV.
+
+    O conteúdo é enviado à medida que é lido do banco de dados, com um
+    cursor no servidor, sem ser montado inteiro em memória. As linhas em
+    NDJSON têm o mesmo formato dos envios em lote. Em CSV, os itens
+    filhos de cada plano são informados em JSON na coluna de mesmo
+    nome."""
+
+    # Validações de permissão
+    if (
+        cod_SIAPE_instituidora
+        != user["fields"]["cod_SIAPE_instituidora"]
+        # TODO: Dar acesso ao superusuário em todas as unidades.
+        # and "all:write" not in access_token_info["permissions"]
+    ):
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED,
+            detail="Usuário não tem permissão na cod_SIAPE_instituidora informada",
+        )
+
+    lotes = crud.stream_exportacao(
+        db_session=db, tipo=tipo, cod_SIAPE_instituidora=cod_SIAPE_instituidora
+    )
+    if formato == exportacao.FormatoExportacao.csv:
+        conteudo = exportacao.gerar_csv(
+            lotes, list(SCHEMAS_EXPORTACAO[tipo].model_fields)
+        )
+    else:
+        conteudo = exportacao.gerar_ndjson(lotes)
+    return StreamingResponse(
+        conteudo,
+        media_type=exportacao.TIPOS_CONTEUDO[formato],
+        headers={
+            "Content-Disposition": f'attachment; filename="{tipo.value}_'
+            f'{cod_SIAPE_instituidora}.{formato.value}"'
+        },
+    )
+
+
+async def ler_corpo_limitado(request: Request, limite: int) -> bytes:
+    """Lê o corpo da requisição à medida que é recebido, interrompendo a
+    leitura assim que ele ultrapassar o limite.
+
+    Args:
+        request (Request): Requisição cujo corpo será lido.
+        limite (int): Tamanho máximo do corpo, em bytes.
+
+    Raises:
+        HTTPException: Com o código 413, se o corpo ultrapassar o limite.
+
+    Returns:
+        bytes: O corpo da requisição.
+    """
+    excedido = HTTPException(
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"O conteúdo ultrapassa o limite de {limite} bytes",
+    )
+    tamanho_declarado = request.headers.get("Content-Length", "")
+    if tamanho_declarado.isdigit() and int(tamanho_declarado) > limite:
+        raise excedido
+    partes = bytearray()
+    async for parte in request.stream():
+        partes.extend(parte)
+        if len(partes) > limite:
+            raise excedido
+    return bytes(partes)
+
+
+@app.post(
+    "/organizacao/{cod_SIAPE_instituidora}/tarefas/{tipo}",
+    summary="Enfileira um envio em lote para processamento assíncrono",
+    response_model=schemas.TarefaSchema,
+    response_model_exclude_none=True,
+    status_code=status.HTTP_202_ACCEPTED,
+    tags=["tarefas"],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/x-ndjson": {"schema": {"type": "string"}}},
+        }
+    },
+)
+async def create_tarefa(
+    cod_SIAPE_instituidora: int,
+    tipo: models.TipoTarefa,
+    request: Request,
+    response: Response,
+    db: DbContextManager = Depends(DbContextManager),
+    user: FiefUserInfo = Depends(auth_backend.current_user()),
+):
+    """Recebe um envio em lote no formato NDJSON, com um item por linha,
+    e o enfileira para processamento em segundo plano.
+
+    A resposta é imediata e indica, no cabeçalho Location, o endereço
+    onde pode ser acompanhado o progresso da tarefa e consultados os
+    erros de cada linha rejeitada. Envios maiores que JOB_MAX_BYTES são
+    recusados com o código 413."""
+
+    # Validações de permissão
+    if (
+        cod_SIAPE_instituidora
+        != user["fields"]["cod_SIAPE_instituidora"]
+        # TODO: Dar acesso ao superusuário em todas as unidades.
+        # and "all:write" not in access_token_info["permissions"]
+    ):
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED,
+            detail="Usuário não tem permissão na cod_SIAPE_instituidora informada",
+        )
+
+    tarefa = await crud.create_tarefa(
+        db_session=db,
+        cod_SIAPE_instituidora=cod_SIAPE_instituidora,
+        tipo=tipo,
+        conteudo=await ler_corpo_limitado(request, JOB_MAX_BYTES),
+    )
+    response.headers["Location"] = (
+        f"/organizacao/{cod_SIAPE_instituidora}/tarefa/{tarefa.id}"
+    )
+    return tarefa
+
+
+@app.get(
+    "/organizacao/{cod_SIAPE_instituidora}/tarefa/{id_tarefa}",
+    summary="Consulta o progresso de um envio em lote",
+    response_model=schemas.TarefaSchema,
+    response_model_exclude_none=True,
+    tags=["tarefas"],
+)
+async def get_tarefa(
+    cod_SIAPE_instituidora: int,
+    id_tarefa: int,
+    db: DbContextManager = Depends(DbContextManager),
+    user: FiefUserInfo = Depends(auth_backend.current_user()),
+):
+    "Consulta a situação, o progresso e os erros de uma tarefa."
+    # Validações de permissão
+    if (
+        cod_SIAPE_instituidora
+        != user["fields"]["cod_SIAPE_instituidora"]
+        # TODO: Dar acesso ao superusuário em todas as unidades.
+        # and "all:write" not in access_token_info["permissions"]
+    ):
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED,
+            detail="Usuário não tem permissão na cod_SIAPE_instituidora informada",
+        )
+
+    tarefa = await crud.get_tarefa(
+        db_session=db,
+        cod_SIAPE_instituidora=cod_SIAPE_instituidora,
+        id_tarefa=id_tarefa,
+    )
+    if not tarefa:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Tarefa não encontrada"
+        )
+    return tarefa
+
 # @app.patch(
 #     "/plano_trabalho/{cod_plano}",
 #     summary="Atualiza plano de trabalho",
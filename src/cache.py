@@ -0,0 +1,172 @@
+"""Caches em memória das respostas das consultas de planos e das
+informações de usuários obtidas do Fief.
+
+Cada processo da API mantém o seu próprio cache. As gravações de planos
+enviam uma notificação pelo canal CANAL do Postgres (NOTIFY), na mesma
+transação da gravação, e todos os processos que escutam o canal
+(LISTEN) removem as entradas correspondentes do seu cache.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import psycopg
+from sqlalchemy.engine import make_url
+
+# Quantidade máxima de respostas em cada cache. Zero desativa o cache.
+PLAN_CACHE_SIZE = int(os.environ.get("PLAN_CACHE_SIZE", "10000"))
+# Tempo de vida, em segundos, das respostas encontradas e das não
+# encontradas (404)
+PLAN_CACHE_TTL = float(os.environ.get("PLAN_CACHE_TTL", "60"))
+PLAN_CACHE_NEGATIVE_TTL = float(os.environ.get("PLAN_CACHE_NEGATIVE_TTL", "5"))
+# Tempo de vida máximo, em segundos, das respostas lidas de uma réplica
+# de leitura, que podem estar atrasadas em relação ao banco primário
+PLAN_CACHE_REPLICA_TTL = float(os.environ.get("PLAN_CACHE_REPLICA_TTL", "5"))
+# Tempo de vida, em segundos, dos resumos das unidades instituidoras, que
+# são validados a cada consulta pelas alterações registradas
+RESUMO_CACHE_TTL = float(os.environ.get("RESUMO_CACHE_TTL", "3600"))
+
+CANAL = "api_pgd_cache"
+
+# Valor retornado por CacheLRU.get quando a chave não está no cache
+AUSENTE = object()
+
+logger = logging.getLogger(__name__)
+
+
+class CacheLRU:
+    """Cache limitado em quantidade de entradas, que descarta as usadas há
+    mais tempo, e em tempo de vida de cada entrada.
+
+    O valor None representa um recurso não encontrado e usa o tempo de
+    vida ttl_negativo.
+    """
+
+    def __init__(self, tamanho_maximo: int, ttl: float, ttl_negativo: float):
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+        self.geracao = 0
+        self._entradas: OrderedDict = OrderedDict()
+
+    def get(self, chave: Hashable) -> Any:
+        """Traz o valor de uma chave, ou AUSENTE se não houver entrada
+        válida."""
+        entrada = self._entradas.get(chave)
+        if entrada is None:
+            return AUSENTE
+        expiracao, valor = entrada
+        if expiracao < time.monotonic():
+            del self._entradas[chave]
+            return AUSENTE
+        self._entradas.move_to_end(chave)
+        return valor
+
+    def set(
+        self, chave: Hashable, valor: Any, geracao: int, ttl: Optional[float] = None
+    ):
+        """Grava o valor de uma chave, carregado quando o cache estava na
+        geração informada.
+
+        Se alguma entrada tiver sido invalidada desde então, o valor pode
+        estar desatualizado e não é gravado. Um ttl informado substitui o
+        tempo de vida padrão, se for menor.
+        """
+        if self.tamanho_maximo <= 0 or geracao != self.geracao:
+            return
+        ttl_padrao = self.ttl if valor is not None else self.ttl_negativo
+        ttl = ttl_padrao if ttl is None else min(ttl, ttl_padrao)
+        if ttl <= 0:
+            return
+        self._entradas[chave] = (time.monotonic() + ttl, valor)
+        self._entradas.move_to_end(chave)
+        while len(self._entradas) > self.tamanho_maximo:
+            self._entradas.popitem(last=False)
+
+    def invalidar(self, chave: Hashable):
+        "Remove a entrada de uma chave."
+        self.geracao += 1
+        self._entradas.pop(chave, None)
+
+    def limpar(self):
+        "Remove todas as entradas."
+        self.geracao += 1
+        self._entradas.clear()
+
+
+caches = {
+    "plano_trabalho": CacheLRU(
+        PLAN_CACHE_SIZE, PLAN_CACHE_TTL, PLAN_CACHE_NEGATIVE_TTL
+    ),
+    "plano_entregas": CacheLRU(
+        PLAN_CACHE_SIZE, PLAN_CACHE_TTL, PLAN_CACHE_NEGATIVE_TTL
+    ),
+    "resumo": CacheLRU(PLAN_CACHE_SIZE, RESUMO_CACHE_TTL, 0),
+}
+
+
+def chave_notificacao(tipo: str, cod_SIAPE_instituidora: int, id_plano: int) -> str:
+    """Monta o conteúdo da notificação de alteração de um plano.
+
+    Args:
+        tipo (str): plano_trabalho ou plano_entregas.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        id_plano (int): id do plano.
+
+    Returns:
+        str: conteúdo da notificação.
+    """
+    return f"{tipo}:{cod_SIAPE_instituidora}:{id_plano}"
+
+
+def processar_notificacao(conteudo: str):
+    """Remove do cache a entrada indicada em uma notificação, ou todas as
+    entradas se o conteúdo for "*".
+
+    Args:
+        conteudo (str): conteúdo montado por chave_notificacao.
+    """
+    if conteudo == "*":
+        limpar()
+        return
+    tipo, cod_SIAPE_instituidora, id_plano = conteudo.split(":")
+    if tipo in caches:
+        caches[tipo].invalidar((int(cod_SIAPE_instituidora), int(id_plano)))
+
+
+def limpar():
+    "Remove todas as entradas de todos os caches."
+    for cache in caches.values():
+        cache.limpar()
+
+
+async def escutar_notificacoes(database_url: str):
+    """Escuta as notificações de alteração de planos enquanto a API
+    estiver em execução, reconectando em caso de falha.
+
+    Como notificações podem ter sido perdidas enquanto a conexão esteve
+    interrompida, os caches são esvaziados a cada conexão.
+
+    Args:
+        database_url (str): URL de conexão do SQL Alchemy.
+    """
+    conninfo = make_url(database_url).set(drivername="postgresql")
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(
+                conninfo.render_as_string(hide_password=False), autocommit=True
+            ) as connection:
+                await connection.execute(f"LISTEN {CANAL}")
+                limpar()
+                async for notificacao in connection.notifies():
+                    processar_notificacao(notificacao.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Falha ao escutar o canal %s", CANAL)
+            limpar()
+            await asyncio.sleep(5)
@@ -0,0 +1,174 @@
+"""Registro das consultas lentas ao banco de dados.
+
+Os comandos SQL que demoram mais que SLOW_QUERY_THRESHOLD_MS são
+registrados no log consultas_lentas, em formato JSON, com os parâmetros
+(CPFs mascarados), a duração e a função do módulo crud que os executou.
+Uma amostra das consultas (SELECT) lentas é executada novamente com
+EXPLAIN (ANALYZE, BUFFERS), em segundo plano e em uma transação desfeita
+ao final, e o plano de execução é incluído no registro.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import time
+from typing import Any, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from metricas import funcao_crud_atual, medicao_atual
+
+# Duração, em milissegundos, a partir da qual um comando é registrado.
+# Zero desativa o registro.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", "500"))
+# Fração das consultas lentas que são executadas novamente com EXPLAIN
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(
+    os.environ.get("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", "0.1")
+)
+# Quantidade máxima, por minuto e por processo, de registros e de EXPLAIN
+SLOW_QUERY_LOG_MAX_PER_MINUTE = int(
+    os.environ.get("SLOW_QUERY_LOG_MAX_PER_MINUTE", "60")
+)
+SLOW_QUERY_EXPLAIN_MAX_PER_MINUTE = int(
+    os.environ.get("SLOW_QUERY_EXPLAIN_MAX_PER_MINUTE", "5")
+)
+
+# Sequências de 11 dígitos, que podem ser CPFs, inclusive dentro de
+# textos como os filtros dos planos de execução
+CPF = re.compile(r"(?<!\d)\d{9}(\d{2})(?!\d)")
+
+logger = logging.getLogger("consultas_lentas")
+
+
+class LimiteTaxa:
+    "Limita a quantidade de eventos por janela de um minuto."
+
+    def __init__(self, maximo_por_minuto: int):
+        self.maximo_por_minuto = maximo_por_minuto
+        self.inicio_janela = time.monotonic()
+        self.quantidade = 0
+
+    def permitir(self) -> bool:
+        "Registra um evento, se ainda houver espaço na janela atual."
+        agora = time.monotonic()
+        if agora - self.inicio_janela >= 60:
+            self.inicio_janela = agora
+            self.quantidade = 0
+        if self.quantidade >= self.maximo_por_minuto:
+            return False
+        self.quantidade += 1
+        return True
+
+
+limite_registros = LimiteTaxa(SLOW_QUERY_LOG_MAX_PER_MINUTE)
+limite_explain = LimiteTaxa(SLOW_QUERY_EXPLAIN_MAX_PER_MINUTE)
+# Referências às tarefas de EXPLAIN em execução
+tarefas_explain: set[asyncio.Task] = set()
+
+
+def mascarar_cpfs(valor: Any, chave: str = "") -> Any:
+    """Mascara os CPFs dos parâmetros ou do plano de execução de um
+    comando, mantendo apenas os dois últimos dígitos.
+
+    São mascarados os valores cujo nome contém "cpf" e todas as
+    sequências de 11 dígitos em textos, inclusive dentro de listas e
+    dicionários.
+
+    Args:
+        valor (Any): Parâmetros, plano de execução ou um dos seus valores.
+        chave (str): Nome do valor.
+
+    Returns:
+        Any: O valor com os CPFs mascarados.
+    """
+    if isinstance(valor, dict):
+        return {nome: mascarar_cpfs(item, str(nome)) for nome, item in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [mascarar_cpfs(item, chave) for item in valor]
+    if isinstance(valor, str):
+        if "cpf" in chave.lower():
+            return "*" * max(len(valor) - 2, 0) + valor[-2:]
+        return CPF.sub(r"*********\1", valor)
+    return valor
+
+
+def _pode_explicar(statement: str) -> bool:
+    "Somente consultas sem efeitos e sem bloqueios são executadas de novo."
+    comando = statement.lstrip().upper()
+    return comando.startswith("SELECT") and "FOR UPDATE" not in comando
+
+
+async def _registrar_com_explain(
+    engine: AsyncEngine, registro: dict, statement: str, parameters: Any
+):
+    """Executa o comando com EXPLAIN (ANALYZE, BUFFERS) em uma transação
+    desfeita ao final e registra a consulta lenta com o plano obtido."""
+    # A tarefa herda o contexto da requisição; o EXPLAIN não é atribuído a
+    # ela nem à função do módulo crud
+    medicao_atual.set(None)
+    funcao_crud_atual.set("explain")
+    try:
+        async with engine.connect() as connection:
+            resultado = await connection.exec_driver_sql(
+                f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}", parameters
+            )
+            registro["plano"] = mascarar_cpfs(resultado.scalar())
+            await connection.rollback()
+    except Exception as exception:  # pylint: disable=broad-except
+        registro["erro_plano"] = str(exception)
+    logger.warning(json.dumps(registro, default=str, ensure_ascii=False))
+
+
+def registrar_consultas_lentas(engine: AsyncEngine):
+    """Registra os eventos que identificam as consultas lentas de uma
+    engine.
+
+    Args:
+        engine (AsyncEngine): Engine cujos comandos são observados.
+    """
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def antes_comando(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("inicio_consulta_lenta", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def depois_comando(conn, cursor, statement, parameters, context, executemany):
+        duracao_ms = (
+            time.perf_counter() - conn.info["inicio_consulta_lenta"].pop()
+        ) * 1000
+        if (
+            SLOW_QUERY_THRESHOLD_MS <= 0
+            or duracao_ms < SLOW_QUERY_THRESHOLD_MS
+            or statement.lstrip().upper().startswith("EXPLAIN")
+            or not limite_registros.permitir()
+        ):
+            return
+        registro = {
+            "funcao": funcao_crud_atual.get(),
+            "duracao_ms": round(duracao_ms, 3),
+            "statement": mascarar_cpfs(statement),
+            "parametros": mascarar_cpfs(parameters),
+        }
+        loop: Optional[asyncio.AbstractEventLoop]
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if (
+            loop is not None
+            and not executemany
+            and _pode_explicar(statement)
+            and random.random() < SLOW_QUERY_EXPLAIN_SAMPLE_RATE
+            and limite_explain.permitir()
+        ):
+            tarefa = loop.create_task(
+                _registrar_com_explain(engine, registro, statement, parameters)
+            )
+            tarefas_explain.add(tarefa)
+            tarefa.add_done_callback(tarefas_explain.discard)
+        else:
+            logger.warning(json.dumps(registro, default=str, ensure_ascii=False))
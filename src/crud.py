@@ -1,16 +1,47 @@
 """Funções para ler, gravar, atualizar ou apagar dados no banco de dados.
 """
-from datetime import datetime, date
-from typing import Optional
+import os
+import uuid
+from datetime import datetime, date, timedelta
+from typing import AsyncIterator, Awaitable, Callable, Optional
 
-from sqlalchemy import select, and_, or_, func
+from psycopg import sql
+from pydantic import BaseModel
+
+from sqlalchemy import (
+    select,
+    update,
+    delete,
+    and_,
+    or_,
+    func,
+    tuple_,
+    literal,
+    exists,
+    union_all,
+    BigInteger,
+    Date,
+    String,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert, JSONB
+from sqlalchemy.orm import defer, selectinload
 from sqlalchemy.sql import text
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
 import models, schemas
+import cache
 from db_config import DbContextManager, SyncSession
+from metricas import medir_crud
+from util import content_hash, etag_matches
 from fastapi import HTTPException
 
+# Função chamada pelas gravações em lote com a sessão e os resultados
+# dos itens, antes do commit, para gravar dados na mesma transação
+AntesCommit = Callable[[AsyncSession, list[tuple[int, Optional[str]]]], Awaitable[None]]
+
 
+@medir_crud
 async def get_plano_trabalho(
     db_session: DbContextManager,
     cod_SIAPE_instituidora: int,
@@ -42,152 +73,992 @@ async def get_plano_trabalho(
     return None
 
 
-async def check_planos_trabalho_per_period(
+@medir_crud
+async def get_versao_plano_trabalho(
     db_session: DbContextManager,
     cod_SIAPE_instituidora: int,
-    cod_SIAPE_unidade_exercicio: int,
-    cpf_participante: str,
     id_plano_trabalho_participante: int,
-    data_inicio_plano: date,
-    data_termino_plano: date,
-) -> bool:
-    """Verifica se há outros Planos de Trabalho no período informado,
-    para a mesma unidade instituidora, mesma unidade de exercício e mesmo
-    participante, gerando um conflito de sobreposição de datas entre os
-    planos de trabalho.
+) -> Optional[tuple[Optional[str], datetime]]:
+    """Traz a versão de um plano de trabalho, sem carregar os seus dados, para
+    a validação de requisições condicionais.
 
     Args:
         db_session (DbContextManager): Context manager para a sessão async
             do SQL Alchemy.
         cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
-        cod_SIAPE_unidade_exercicio (int): Código SIAPE da unidade de
-            exercício do participante.
-        cpf_participante (str): CPF do participante.
         id_plano_trabalho_participante (int): id do Plano de Trabalho do
             participante.
-        data_inicio_plano (date): Data de início do Plano de Trabalho.
-        data_termino_plano (date): Data de término do Plano de Trabalho.
 
     Returns:
-        bool: True se há conflito; False caso contrário.
+        Optional[tuple[Optional[str], datetime]]: A ETag, derivada do hash
+            do conteúdo, e a data da última modificação, ou None se o
+            plano não existir.
     """
     async with db_session as session:
-        query = (
-            select(func.count())
-            .select_from(models.PlanoTrabalho)
-            .filter_by(cod_SIAPE_instituidora=cod_SIAPE_instituidora)
-            .filter_by(cod_SIAPE_unidade_exercicio=cod_SIAPE_unidade_exercicio)
-            .filter_by(cpf_participante=cpf_participante)
-            .filter_by(cancelado=False)
-            .where(
-                and_(
-                    (
-                        # exclui o próprio plano de trabalho da verificação para
-                        # não conflitar com ele mesmo
-                        models.PlanoTrabalho.id_plano_trabalho_participante
-                        != id_plano_trabalho_participante
-                    ),
-                    (models.PlanoTrabalho.data_inicio_plano <= data_termino_plano),
-                    (models.PlanoTrabalho.data_termino_plano >= data_inicio_plano),
-                )
+        result = await session.execute(
+            select(
+                models.PlanoTrabalho.hash_conteudo,
+                func.coalesce(
+                    models.PlanoTrabalho.data_atualizacao,
+                    models.PlanoTrabalho.data_insercao,
+                ),
             )
+            .filter_by(cod_SIAPE_instituidora=cod_SIAPE_instituidora)
+            .filter_by(id_plano_trabalho_participante=id_plano_trabalho_participante)
         )
-        result = await session.execute(query)
-        count_plano_trabalho = result.scalar()
-    if count_plano_trabalho > 0:
-        return True
-    return False
+        row = result.one_or_none()
+    if row is None:
+        return None
+    hash_conteudo, data_modificacao = row
+    return (f'"{hash_conteudo}"' if hash_conteudo else None), data_modificacao
 
 
-async def create_plano_trabalho(
+@medir_crud
+async def create_or_update_plano_trabalho(
     db_session: DbContextManager,
     plano_trabalho: schemas.PlanoTrabalhoSchema,
-) -> schemas.PlanoTrabalhoSchema:
-    """Cria um plano de trabalho definido pelos dados do schema Pydantic
-    plano_trabalho.
+    if_match: Optional[str] = None,
+) -> tuple[schemas.PlanoTrabalhoSchema, bool, int]:
+    """Cria um plano de trabalho ou, se existente, o substitui pelos
+    dados recebidos, em uma única transação.
+
+    A sobreposição de período com outros planos de trabalho da mesma
+    unidade de exercício e participante é impedida pela restrição de
+    exclusão _plano_trabalho_periodo_excl do banco de dados, inclusive
+    entre requisições simultâneas. Somente as diferenças em relação aos
+    dados existentes são gravadas, como em _upsert_planos_trabalho.
+
+    Se o hash do conteúdo recebido for igual ao da última gravação, o
+    plano é retornado sem qualquer verificação ou gravação.
 
     Args:
         db_session (DbContextManager): Context manager para a sessão
             async do SQL Alchemy.
         plano_trabalho (schemas.PlanoTrabalhoSchema): Dados do plano
             de trabalho como um esquema Pydantic.
+        if_match (Optional[str]): Valor do cabeçalho If-Match, se
+            informado. O plano de trabalho só é gravado se a sua ETag atual
+            constar do cabeçalho.
+
+    Raises:
+        HTTPException: Se a condição de If-Match não for atendida, se
+            houver sobreposição de período ou referência a entrega
+            inexistente.
 
     Returns:
-        schemas.PlanoEntregasSchema: Esquema Pydantic do Plano de Trabalho
-            com os dados que foram gravados no banco.
+        tuple[schemas.PlanoTrabalhoSchema, bool, int]: Esquema Pydantic
+            do Plano de Trabalho gravado, se ele foi criado e a
+            quantidade de linhas inseridas, atualizadas ou apagadas.
     """
-    creation_timestamp = datetime.now()
-    contribuicoes = [
-        models.Contribuicao(**contribuicao.model_dump())
-        for contribuicao in plano_trabalho.contribuicoes
-    ]
-
-    consolidacoes = [
-        models.Consolidacao(**consolidacao.model_dump())
-        for consolidacao in plano_trabalho.consolidacoes
-    ]
-    plano_trabalho.contribuicoes = []
-    plano_trabalho.consolidacoes = []
-    db_plano_trabalho = models.PlanoTrabalho(**plano_trabalho.model_dump())
-    db_plano_trabalho.data_insercao = creation_timestamp
+    cod_SIAPE_instituidora = plano_trabalho.cod_SIAPE_instituidora
+    id_plano = plano_trabalho.id_plano_trabalho_participante
     async with db_session as session:
-        for contribuicao in contribuicoes:
-            contribuicao.data_insercao = creation_timestamp
-            contribuicao.id_plano_entrega_unidade = (
-                plano_trabalho.id_plano_entrega_unidade
-            )
-            session.add(contribuicao)
-            db_plano_trabalho.contribuicoes.append(contribuicao)
-            db_plano_trabalho.contribuicoes = contribuicoes
-        for consolidacao in consolidacoes:
-            consolidacao.data_insercao = creation_timestamp
-            session.add(consolidacao)
-            db_plano_trabalho.consolidacoes.append(consolidacao)
-        session.add(db_plano_trabalho)
+        # bloqueia o plano até o fim da transação, para que a versão
+        # verificada em If-Match e o cancelamento usado na atualização
+        # dos agregados sejam os mesmos que serão substituídos
+        result = await session.execute(
+            select(models.PlanoTrabalho.hash_conteudo, models.PlanoTrabalho.cancelado)
+            .filter_by(cod_SIAPE_instituidora=cod_SIAPE_instituidora)
+            .filter_by(id_plano_trabalho_participante=id_plano)
+            .with_for_update()
+        )
+        row = result.one_or_none()
+        if if_match is not None:
+            etag = None
+            if row is not None:
+                etag = f'"{row.hash_conteudo}"' if row.hash_conteudo else ""
+            if not etag_matches(if_match, etag, weak=False):
+                raise HTTPException(
+                    status_code=412,
+                    detail="O plano de trabalho foi alterado ou não existe na versão "
+                    "informada em If-Match",
+                )
+        # reenvio sem alteração: nada a verificar nem a gravar
+        if row is not None and row.hash_conteudo == content_hash(plano_trabalho):
+            return plano_trabalho, False, 0
         try:
+            rowcount = await _upsert_planos_trabalho(
+                session,
+                cod_SIAPE_instituidora,
+                [plano_trabalho],
+                datetime.now(),
+                {} if row is None else {id_plano: row.cancelado},
+            )
+            await _registrar_alteracoes(
+                session,
+                models.TipoAlteracao.plano_trabalho,
+                cod_SIAPE_instituidora,
+                [id_plano],
+            )
+            await _notificar_alteracao(
+                session, "plano_trabalho", cod_SIAPE_instituidora, [id_plano]
+            )
             await session.commit()
+            _invalidar_cache("plano_trabalho", cod_SIAPE_instituidora, [id_plano])
         except IntegrityError as e:
+            await session.rollback()
             raise HTTPException(
-                status_code=422, detail="Referência a tabela entrega não encontrada"
+                status_code=422,
+                detail=_mensagem_sobreposicao(e)
+                or "Referência a tabela entrega não encontrada",
             ) from e
-        await session.refresh(db_plano_trabalho)
-    return schemas.PlanoTrabalhoSchema.model_validate(db_plano_trabalho)
+    return plano_trabalho, row is None, rowcount
+
+
+# Quantidade máxima de parâmetros aceitos pelo Postgres em um comando
+POSTGRES_MAX_PARAMETERS = 65535
+# Quantidade de linhas a partir da qual os status de participantes são
+# gravados com COPY em vez de INSERT
+STATUS_PARTICIPANTE_COPY_THRESHOLD = int(
+    os.environ.get("STATUS_PARTICIPANTE_COPY_THRESHOLD", "500")
+)
+
+
+async def _insert_multirow(
+    session: AsyncSession,
+    model: type,
+    rows: list[dict],
+    index_elements: Optional[list[str]] = None,
+) -> int:
+    """Insere as linhas informadas usando comandos INSERT de múltiplas
+    linhas, divididos conforme o limite de parâmetros do Postgres.
+
+    Se index_elements for informado, as linhas que já existirem com a
+    mesma chave são atualizadas (INSERT ... ON CONFLICT DO UPDATE), mas
+    somente quando algum valor tiver sido alterado. Nesse caso, a
+    data_insercao original é mantida e a data_atualizacao recebe a
+    data_insercao da nova linha.
+
+    Args:
+        session (AsyncSession): Sessão async do SQL Alchemy.
+        model (type): Classe do modelo SQL Alchemy.
+        rows (list[dict]): Linhas a inserir, todas com as mesmas colunas.
+        index_elements (Optional[list[str]]): Colunas da chave única
+            usada para identificar as linhas existentes.
+
+    Returns:
+        int: Quantidade de linhas inseridas ou atualizadas.
+    """
+    if not rows:
+        return 0
+    columns = list(rows[0])
+    updated_columns = [
+        column
+        for column in columns
+        if column not in (index_elements or [])
+        and column not in ("data_insercao", "data_atualizacao")
+    ]
+    batch_size = POSTGRES_MAX_PARAMETERS // len(columns)
+    rowcount = 0
+    for start in range(0, len(rows), batch_size):
+        statement = pg_insert(model.__table__).values(rows[start : start + batch_size])
+        if index_elements:
+            statement = statement.on_conflict_do_update(
+                index_elements=index_elements,
+                set_={
+                    **{
+                        column: statement.excluded[column] for column in updated_columns
+                    },
+                    "data_atualizacao": statement.excluded["data_insercao"],
+                },
+                where=tuple_(
+                    *(model.__table__.c[column] for column in updated_columns)
+                ).is_distinct_from(
+                    tuple_(*(statement.excluded[column] for column in updated_columns))
+                ),
+            )
+        # o rowcount não é informado para INSERT com RETURNING implícito da
+        # chave primária, então as linhas gravadas são contadas pelo RETURNING
+        result = await session.execute(
+            statement.returning(*model.__table__.primary_key.columns)
+        )
+        rowcount += len(result.all())
+    return rowcount
+
+
+async def _copy_rows(session: AsyncSession, model: type, rows: list[dict]) -> int:
+    """Insere as linhas informadas com o comando COPY FROM STDIN do
+    Postgres, na transação corrente da sessão.
+
+    Adequado somente para tabelas em que as linhas são apenas
+    acrescentadas, pois o COPY não trata conflitos de chave.
+
+    Args:
+        session (AsyncSession): Sessão async do SQL Alchemy.
+        model (type): Classe do modelo SQL Alchemy.
+        rows (list[dict]): Linhas a inserir, todas com as mesmas colunas.
+
+    Returns:
+        int: Quantidade de linhas inseridas.
+    """
+    if not rows:
+        return 0
+    columns = list(rows[0])
+    statement = sql.SQL("COPY {} ({}) FROM STDIN").format(
+        sql.Identifier(model.__tablename__),
+        sql.SQL(", ").join(sql.Identifier(column) for column in columns),
+    )
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    async with raw_connection.driver_connection.cursor() as cursor:
+        async with cursor.copy(statement) as copy:
+            for row in rows:
+                await copy.write_row([row[column] for column in columns])
+    return len(rows)
+
+
+# Mensagens de erro das violações das restrições de exclusão que impedem
+# a sobreposição de períodos de planos, pelo nome da restrição
+MENSAGENS_SOBREPOSICAO = {
+    "_plano_trabalho_periodo_excl": "Já existe um plano de trabalho para este "
+    "cod_SIAPE_unidade_exercicio para este cpf_participante "
+    "no período informado.",
+    "_plano_entregas_periodo_excl": "Já existe um plano de entregas para este "
+    "cod_SIAPE_unidade_plano no período informado.",
+}
+
+
+def _mensagem_sobreposicao(exception: IntegrityError) -> Optional[str]:
+    """Traz a mensagem de erro de sobreposição de períodos de planos, se a
+    exceção for a violação de uma das restrições de exclusão de
+    MENSAGENS_SOBREPOSICAO.
+
+    Args:
+        exception (IntegrityError): Exceção lançada pelo SQL Alchemy.
+
+    Returns:
+        Optional[str]: A mensagem de erro, ou None se a exceção tiver
+            outra causa.
+    """
+    diag = getattr(exception.orig, "diag", None)
+    return MENSAGENS_SOBREPOSICAO.get(getattr(diag, "constraint_name", None))
+
+
+async def _notificar_alteracao(
+    session: AsyncSession,
+    tipo: str,
+    cod_SIAPE_instituidora: int,
+    ids: list[int],
+):
+    """Notifica todos os processos da API, pelo canal cache.CANAL, para
+    que removam os planos informados dos seus caches.
+
+    A notificação só é entregue quando a transação corrente é confirmada
+    (commit). Como ela pode demorar a chegar, quem grava também deve
+    remover os planos do cache local após o commit, com _invalidar_cache.
+
+    Args:
+        session (AsyncSession): Sessão async do SQL Alchemy.
+        tipo (str): plano_trabalho ou plano_entregas.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        ids (list[int]): ids dos planos alterados.
+    """
+    await session.execute(
+        text(
+            "SELECT pg_notify(:canal, chave) "
+            "FROM unnest(CAST(:chaves AS text[])) AS chave"
+        ),
+        {
+            "canal": cache.CANAL,
+            "chaves": [
+                cache.chave_notificacao(tipo, cod_SIAPE_instituidora, id_plano)
+                for id_plano in ids
+            ],
+        },
+    )
+
+
+async def _registrar_alteracoes(
+    session: AsyncSession,
+    tipo: models.TipoAlteracao,
+    cod_SIAPE_instituidora: int,
+    chaves: list,
+):
+    """Registra no feed de alterações (tabela alteracao) os recursos
+    gravados na transação corrente, com a versão (ETag) resultante da
+    gravação, em um único comando INSERT ... SELECT.
+
+    Por ser gravado na mesma transação, o registro só se torna visível
+    se a gravação for confirmada (commit).
+
+    Args:
+        session (AsyncSession): Sessão async do SQL Alchemy.
+        tipo (models.TipoAlteracao): Tipo dos recursos gravados.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        chaves (list): ids dos planos ou CPFs dos participantes gravados.
+    """
+    if not chaves:
+        return
+    if tipo == models.TipoAlteracao.participante:
+        model = models.StatusParticipante
+        coluna_chave = model.cpf_participante
+        # mesma versão de get_versao_status_participante
+        versao = (
+            literal('"')
+            + func.max(model.id).cast(String)
+            + "-"
+            + func.count().cast(String)
+            + '"'
+        )
+        agrupamento = [coluna_chave]
+    else:
+        model = (
+            models.PlanoTrabalho
+            if tipo == models.TipoAlteracao.plano_trabalho
+            else models.PlanoEntregas
+        )
+        coluna_chave = (
+            model.id_plano_trabalho_participante
+            if tipo == models.TipoAlteracao.plano_trabalho
+            else model.id_plano_entrega_unidade
+        )
+        versao = literal('"') + func.coalesce(model.hash_conteudo, "") + '"'
+        agrupamento = []
+    consulta = (
+        select(
+            literal(cod_SIAPE_instituidora),
+            literal(tipo.value),
+            coluna_chave.cast(String),
+            versao,
+            func.localtimestamp(),
+        )
+        .where(model.cod_SIAPE_instituidora == cod_SIAPE_instituidora)
+        .where(coluna_chave.in_(chaves))
+        .group_by(*agrupamento)
+    )
+    await session.execute(
+        models.Alteracao.__table__.insert().from_select(
+            [
+                "cod_SIAPE_instituidora",
+                "tipo",
+                "chave",
+                "versao",
+                "data_alteracao",
+            ],
+            consulta,
+        )
+    )
+
+
+def _invalidar_cache(tipo: str, cod_SIAPE_instituidora: int, ids: list[int]):
+    """Remove os planos informados do cache deste processo.
+
+    Args:
+        tipo (str): plano_trabalho ou plano_entregas.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        ids (list[int]): ids dos planos alterados.
+    """
+    for id_plano in ids:
+        cache.caches[tipo].invalidar((cod_SIAPE_instituidora, id_plano))
+
+
+async def _somar_horas_entregas(
+    session: AsyncSession,
+    cod_SIAPE_instituidora: int,
+    variacoes: dict[tuple[int, int], list[int]],
+):
+    """Soma às horas vinculadas e à quantidade de contribuições das
+    entregas, em agregado_entrega, as variações provocadas por uma
+    gravação de planos de trabalho.
+
+    As linhas são atualizadas em ordem de chave, para evitar impasses
+    (deadlocks) entre gravações simultâneas, e por soma, e não por novo
+    cálculo, de modo que gravações simultâneas não percam as variações
+    uma da outra.
+
+    Args:
+        session (AsyncSession): Sessão async do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        variacoes (dict[tuple[int, int], list[int]]): Para cada entrega,
+            identificada pelo id do plano de entregas e pelo id da
+            entrega, a variação das horas e da quantidade de
+            contribuições.
+    """
+    chaves = sorted(chave for chave, variacao in variacoes.items() if any(variacao))
+    if not chaves:
+        return
+    await session.execute(
+        text(
+            "UPDATE agregado_entrega AS agregado SET "
+            "horas_vinculadas = agregado.horas_vinculadas + variacao.horas, "
+            "quantidade_contribuicoes = "
+            "agregado.quantidade_contribuicoes + variacao.quantidade "
+            "FROM unnest(CAST(:planos AS integer[]), CAST(:entregas AS integer[]), "
+            "CAST(:horas AS bigint[]), CAST(:quantidades AS integer[])) "
+            "AS variacao(id_plano_entrega_unidade, id_entrega, horas, quantidade) "
+            'WHERE agregado."cod_SIAPE_instituidora" = :cod_SIAPE_instituidora '
+            "AND agregado.id_plano_entrega_unidade = "
+            "variacao.id_plano_entrega_unidade "
+            "AND agregado.id_entrega = variacao.id_entrega"
+        ),
+        {
+            "cod_SIAPE_instituidora": cod_SIAPE_instituidora,
+            "planos": [chave[0] for chave in chaves],
+            "entregas": [chave[1] for chave in chaves],
+            "horas": [variacoes[chave][0] for chave in chaves],
+            "quantidades": [variacoes[chave][1] for chave in chaves],
+        },
+    )
+
+
+async def _atualizar_agregados_planos_entregas(
+    session: AsyncSession, cod_SIAPE_instituidora: int, ids: list[int]
+):
+    """Atualiza os agregados dos planos de entregas informados e das suas
+    entregas a partir das linhas gravadas na transação corrente.
+
+    As horas vinculadas de agregado_entrega são mantidas, pois dependem
+    somente dos planos de trabalho; as entregas novas começam sem horas,
+    pois as contribuições só podem referenciar entregas já gravadas. Os
+    agregados das entregas removidas são apagados em cascata.
+
+    Args:
+        session (AsyncSession): Sessão async do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        ids (list[int]): ids dos planos de entregas gravados.
+    """
+    plano = models.PlanoEntregas
+    entrega = models.Entrega
+    agregado_entrega = pg_insert(models.AgregadoEntrega.__table__).from_select(
+        [
+            "cod_SIAPE_instituidora",
+            "id_plano_entrega_unidade",
+            "id_entrega",
+            "cod_SIAPE_unidade_plano",
+            "data_entrega",
+            "horas_vinculadas",
+            "quantidade_contribuicoes",
+        ],
+        select(
+            entrega.cod_SIAPE_instituidora,
+            entrega.id_plano_entrega_unidade,
+            entrega.id_entrega,
+            plano.cod_SIAPE_unidade_plano,
+            entrega.data_entrega,
+            literal(0),
+            literal(0),
+        )
+        .join(
+            plano,
+            and_(
+                plano.cod_SIAPE_instituidora == entrega.cod_SIAPE_instituidora,
+                plano.id_plano_entrega_unidade == entrega.id_plano_entrega_unidade,
+            ),
+        )
+        .where(entrega.cod_SIAPE_instituidora == cod_SIAPE_instituidora)
+        .where(entrega.id_plano_entrega_unidade.in_(ids)),
+    )
+    await session.execute(
+        agregado_entrega.on_conflict_do_update(
+            index_elements=[
+                "cod_SIAPE_instituidora",
+                "id_plano_entrega_unidade",
+                "id_entrega",
+            ],
+            set_={
+                "cod_SIAPE_unidade_plano": agregado_entrega.excluded[
+                    "cod_SIAPE_unidade_plano"
+                ],
+                "data_entrega": agregado_entrega.excluded["data_entrega"],
+            },
+        )
+    )
+    agregado_plano = pg_insert(models.AgregadoPlanoEntregas.__table__).from_select(
+        [
+            "cod_SIAPE_instituidora",
+            "id_plano_entrega_unidade",
+            "cod_SIAPE_unidade_plano",
+            "cancelado",
+            "quantidade_entregas",
+            "quantidade_entregas_com_progresso",
+            "soma_percentual_progresso_realizado",
+        ],
+        select(
+            plano.cod_SIAPE_instituidora,
+            plano.id_plano_entrega_unidade,
+            plano.cod_SIAPE_unidade_plano,
+            plano.cancelado,
+            func.count(entrega.id_entrega),
+            func.count(entrega.percentual_progresso_realizado),
+            func.coalesce(func.sum(entrega.percentual_progresso_realizado), 0),
+        )
+        .outerjoin(
+            entrega,
+            and_(
+                entrega.cod_SIAPE_instituidora == plano.cod_SIAPE_instituidora,
+                entrega.id_plano_entrega_unidade == plano.id_plano_entrega_unidade,
+            ),
+        )
+        .where(plano.cod_SIAPE_instituidora == cod_SIAPE_instituidora)
+        .where(plano.id_plano_entrega_unidade.in_(ids))
+        .group_by(plano.cod_SIAPE_instituidora, plano.id_plano_entrega_unidade),
+    )
+    await session.execute(
+        agregado_plano.on_conflict_do_update(
+            index_elements=["cod_SIAPE_instituidora", "id_plano_entrega_unidade"],
+            set_={
+                coluna: agregado_plano.excluded[coluna]
+                for coluna in (
+                    "cod_SIAPE_unidade_plano",
+                    "cancelado",
+                    "quantidade_entregas",
+                    "quantidade_entregas_com_progresso",
+                    "soma_percentual_progresso_realizado",
+                )
+            },
+        )
+    )
+
+
+def _linhas_a_manter(existentes: list, novas: list[dict], colunas: list[str]):
+    """Compara as linhas filhas existentes de um plano com as recebidas,
+    para filhas que não têm chave própria além do id sequencial.
+
+    Cada linha recebida é associada a uma linha existente com o mesmo
+    conteúdo, que é mantida sem alteração.
+
+    Args:
+        existentes (list): Linhas existentes, com id e as colunas
+            informadas.
+        novas (list[dict]): Linhas recebidas.
+        colunas (list[str]): Colunas comparadas.
+
+    Returns:
+        tuple[list[int], list[dict]]: ids das linhas existentes a apagar
+            e linhas recebidas a inserir.
+    """
+    disponiveis = {}
+    for existente in existentes:
+        conteudo = tuple(getattr(existente, coluna) for coluna in colunas)
+        disponiveis.setdefault(conteudo, []).append(existente.id)
+    inserir = []
+    for nova in novas:
+        ids = disponiveis.get(tuple(nova[coluna] for coluna in colunas))
+        if ids:
+            ids.pop()
+        else:
+            inserir.append(nova)
+    apagar = [id_linha for ids in disponiveis.values() for id_linha in ids]
+    return apagar, inserir
+
+
+async def _sync_filhas_plano_trabalho(
+    session: AsyncSession,
+    model: type,
+    cod_SIAPE_instituidora: int,
+    ids_planos: list[int],
+    novas: list[dict],
+) -> tuple[int, list]:
+    """Aplica às contribuições ou consolidações dos planos de trabalho
+    informados somente as diferenças em relação às linhas recebidas:
+    apaga as que deixaram de existir e insere as novas ou alteradas.
+
+    Args:
+        session (AsyncSession): Sessão async do SQL Alchemy.
+        model (type): models.Contribuicao ou models.Consolidacao.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        ids_planos (list[int]): ids dos planos de trabalho.
+        novas (list[dict]): Linhas recebidas para esses planos.
+
+    Returns:
+        tuple[int, list]: Quantidade de linhas apagadas ou inseridas e as
+            linhas que existiam antes da gravação.
+    """
+    colunas = [
+        coluna.name
+        for coluna in model.__table__.columns
+        if coluna.name not in ("id", "data_insercao", "data_atualizacao")
+    ]
+    result = await session.execute(
+        select(model.id, *(model.__table__.c[coluna] for coluna in colunas))
+        .where(model.cod_SIAPE_instituidora == cod_SIAPE_instituidora)
+        .where(model.id_plano_trabalho_participante.in_(ids_planos))
+    )
+    existentes = result.all()
+    apagar, inserir = _linhas_a_manter(existentes, novas, colunas)
+    if apagar:
+        await session.execute(delete(model).where(model.id.in_(apagar)))
+    await _insert_multirow(session, model, inserir)
+    return len(apagar) + len(inserir), existentes
+
+
+async def _upsert_planos_trabalho(
+    session: AsyncSession,
+    cod_SIAPE_instituidora: int,
+    planos_trabalho: list[schemas.PlanoTrabalhoSchema],
+    creation_timestamp: datetime,
+    cancelados_anteriores: dict[int, Optional[bool]],
+) -> int:
+    """Grava os planos de trabalho informados com INSERT ... ON CONFLICT
+    DO UPDATE e aplica às suas contribuições e consolidações somente as
+    diferenças em relação ao que já está gravado.
+
+    As horas vinculadas às entregas em agregado_entrega são atualizadas
+    pela variação provocada pela gravação. Para isso, os planos
+    existentes devem estar bloqueados (FOR UPDATE) desde a leitura de
+    cancelados_anteriores.
+
+    A transação não é confirmada (commit) por esta função.
+
+    Args:
+        session (AsyncSession): Sessão async do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        planos_trabalho (list[schemas.PlanoTrabalhoSchema]): Planos de
+            trabalho a gravar.
+        creation_timestamp (datetime): Data de inserção dos registros.
+        cancelados_anteriores (dict[int, Optional[bool]]): Valor de
+            cancelado de cada plano já existente, antes da gravação.
+
+    Returns:
+        int: Quantidade de linhas inseridas, atualizadas ou apagadas.
+    """
+    ids = [plano.id_plano_trabalho_participante for plano in planos_trabalho]
+    rowcount = await _insert_multirow(
+        session,
+        models.PlanoTrabalho,
+        [
+            {
+                **plano.model_dump(exclude={"contribuicoes", "consolidacoes"}),
+                "hash_conteudo": content_hash(plano),
+                "data_insercao": creation_timestamp,
+            }
+            for plano in planos_trabalho
+        ],
+        index_elements=["cod_SIAPE_instituidora", "id_plano_trabalho_participante"],
+    )
+
+    def chave_plano(plano: schemas.PlanoTrabalhoSchema) -> dict:
+        return {
+            "cod_SIAPE_instituidora": cod_SIAPE_instituidora,
+            "id_plano_trabalho_participante": plano.id_plano_trabalho_participante,
+            "data_insercao": creation_timestamp,
+        }
+
+    contribuicoes = [
+        {
+            **contribuicao.model_dump(),
+            **chave_plano(plano),
+            "id_plano_entrega_unidade": plano.id_plano_entrega_unidade,
+        }
+        for plano in planos_trabalho
+        for contribuicao in plano.contribuicoes or []
+    ]
+    consolidacoes = [
+        {**consolidacao.model_dump(), **chave_plano(plano)}
+        for plano in planos_trabalho
+        for consolidacao in plano.consolidacoes or []
+    ]
+    alteradas, anteriores = await _sync_filhas_plano_trabalho(
+        session, models.Contribuicao, cod_SIAPE_instituidora, ids, contribuicoes
+    )
+    rowcount += alteradas
+    alteradas, _ = await _sync_filhas_plano_trabalho(
+        session, models.Consolidacao, cod_SIAPE_instituidora, ids, consolidacoes
+    )
+    rowcount += alteradas
+
+    # variação das horas vinculadas a cada entrega: as contribuições dos
+    # planos não cancelados substituem as que eles tinham antes
+    cancelados = {
+        plano.id_plano_trabalho_participante: plano.cancelado
+        for plano in planos_trabalho
+    }
+    variacoes: dict[tuple[int, int], list[int]] = {}
+    for contribuicoes_plano, cancelado_plano, sinal in (
+        ([linha._asdict() for linha in anteriores], cancelados_anteriores.get, -1),
+        (contribuicoes, cancelados.get, 1),
+    ):
+        for contribuicao in contribuicoes_plano:
+            id_plano = contribuicao["id_plano_trabalho_participante"]
+            if contribuicao["id_entrega"] is None or cancelado_plano(id_plano, True):
+                continue
+            variacao = variacoes.setdefault(
+                (contribuicao["id_plano_entrega_unidade"], contribuicao["id_entrega"]),
+                [0, 0],
+            )
+            variacao[0] += sinal * contribuicao["horas_vinculadas"]
+            variacao[1] += sinal
+    await _somar_horas_entregas(session, cod_SIAPE_instituidora, variacoes)
+    return rowcount
 
 
-async def update_plano_trabalho(
+@medir_crud
+async def create_or_update_planos_trabalho(
     db_session: DbContextManager,
-    plano_trabalho: schemas.PlanoTrabalhoSchema,
-) -> schemas.PlanoTrabalhoSchema:
-    """Atualiza um plano de trabalho conforme os dados recebidos no
-    esquema Pydantic em plano_trabalho.
+    cod_SIAPE_instituidora: int,
+    planos_trabalho: list[schemas.PlanoTrabalhoSchema],
+    antes_commit: Optional[AntesCommit] = None,
+) -> list[tuple[int, Optional[str]]]:
+    """Cria ou substitui um lote de planos de trabalho de uma mesma
+    unidade instituidora em uma única transação.
 
-    Os dados existentes são primeiro apagados do banco para depois
-    inserir os dados recebidos.
+    Os planos de trabalho com sobreposição de período são rejeitados
+    sem impedir a gravação dos demais. Se a gravação do lote violar
+    alguma restrição de integridade, como a de exclusão que impede a
+    sobreposição, os planos são gravados um a um, na ordem recebida e
+    cada qual em um savepoint, para identificar os que falharam.
 
     Args:
         db_session (DbContextManager): Context manager para a sessão
             async do SQL Alchemy.
-        plano_trabalho (schemas.PlanoTrabalhoSchema): Dados do plano
-            de trabalho como um esquema Pydantic.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        planos_trabalho (list[schemas.PlanoTrabalhoSchema]): Planos de
+            trabalho como esquemas Pydantic, com ids distintos.
+        antes_commit (Optional[AntesCommit]): Função chamada com a sessão
+            e os resultados antes do commit, como o registro do progresso
+            de uma tarefa.
 
     Returns:
-        schemas.PlanoEntregasSchema: Esquema Pydantic do Plano de Trabalho
-            com o retorno de create_plano_trabalho.
+        list[tuple[int, Optional[str]]]: Para cada plano de trabalho, na
+            mesma ordem recebida, o código de status HTTP do resultado e
+            a mensagem de erro, se houver.
     """
+    creation_timestamp = datetime.now()
+    ids = [plano.id_plano_trabalho_participante for plano in planos_trabalho]
     async with db_session as session:
+        # bloqueia os planos existentes, em ordem de id, até o fim da
+        # transação, como em create_or_update_plano_trabalho
         result = await session.execute(
-            select(models.PlanoTrabalho)
-            .filter_by(cod_SIAPE_instituidora=plano_trabalho.cod_SIAPE_instituidora)
-            .filter_by(
-                id_plano_trabalho_participante=plano_trabalho.id_plano_trabalho_participante
+            select(
+                models.PlanoTrabalho.id_plano_trabalho_participante,
+                models.PlanoTrabalho.hash_conteudo,
+                models.PlanoTrabalho.cancelado,
             )
+            .filter_by(cod_SIAPE_instituidora=cod_SIAPE_instituidora)
+            .where(models.PlanoTrabalho.id_plano_trabalho_participante.in_(ids))
+            .order_by(models.PlanoTrabalho.id_plano_trabalho_participante)
+            .with_for_update()
         )
-        db_plano_trabalho = result.unique().scalar_one()
-        await session.delete(db_plano_trabalho)
+        linhas = result.all()
+        existentes = {
+            linha.id_plano_trabalho_participante: linha.hash_conteudo
+            for linha in linhas
+        }
+        cancelados_anteriores = {
+            linha.id_plano_trabalho_participante: linha.cancelado for linha in linhas
+        }
+        # reenvios sem alteração não são verificados nem gravados
+        inalterados = {
+            plano.id_plano_trabalho_participante
+            for plano in planos_trabalho
+            if existentes.get(plano.id_plano_trabalho_participante)
+            == content_hash(plano)
+        }
+
+        resultados = {}
+        for plano in planos_trabalho:
+            id_plano = plano.id_plano_trabalho_participante
+            resultados[id_plano] = (200 if id_plano in existentes else 201, None)
+        validos = [
+            plano
+            for plano in planos_trabalho
+            if plano.id_plano_trabalho_participante not in inalterados
+        ]
+
+        if validos:
+            try:
+                async with session.begin_nested():
+                    await _upsert_planos_trabalho(
+                        session,
+                        cod_SIAPE_instituidora,
+                        validos,
+                        creation_timestamp,
+                        cancelados_anteriores,
+                    )
+            except IntegrityError:
+                for plano in validos:
+                    try:
+                        async with session.begin_nested():
+                            await _upsert_planos_trabalho(
+                                session,
+                                cod_SIAPE_instituidora,
+                                [plano],
+                                creation_timestamp,
+                                cancelados_anteriores,
+                            )
+                    except IntegrityError as exception:
+                        resultados[plano.id_plano_trabalho_participante] = (
+                            422,
+                            _mensagem_sobreposicao(exception)
+                            or f"IntegrityError: {str(exception)}",
+                        )
+            gravados = [
+                plano.id_plano_trabalho_participante
+                for plano in validos
+                if resultados[plano.id_plano_trabalho_participante][0] != 422
+            ]
+            await _registrar_alteracoes(
+                session,
+                models.TipoAlteracao.plano_trabalho,
+                cod_SIAPE_instituidora,
+                gravados,
+            )
+            await _notificar_alteracao(
+                session,
+                "plano_trabalho",
+                cod_SIAPE_instituidora,
+                [plano.id_plano_trabalho_participante for plano in validos],
+            )
+        if antes_commit is not None:
+            await antes_commit(session, [resultados[id_plano] for id_plano in ids])
         await session.commit()
-    return await create_plano_trabalho(db_session, plano_trabalho)
+        if validos:
+            _invalidar_cache(
+                "plano_trabalho",
+                cod_SIAPE_instituidora,
+                [plano.id_plano_trabalho_participante for plano in validos],
+            )
+    return [resultados[id_plano] for id_plano in ids]
+
+
+def _pagina(
+    query: Select,
+    model: type,
+    coluna_id,
+    apos: Optional[tuple[datetime, int]],
+    limite: int,
+) -> Select:
+    """Ordena uma consulta de planos pela data da última modificação e
+    pelo id e a limita aos planos posteriores à posição informada
+    (paginação por chave, sem OFFSET).
+
+    Args:
+        query (Select): Consulta dos planos.
+        model (type): models.PlanoTrabalho ou models.PlanoEntregas.
+        coluna_id: Coluna do id do plano.
+        apos (Optional[tuple[datetime, int]]): Data da última modificação
+            e id do último plano da página anterior, se houver.
+        limite (int): Quantidade máxima de planos.
+
+    Returns:
+        Select: A consulta paginada.
+    """
+    modificacao = func.coalesce(model.data_atualizacao, model.data_insercao)
+    if apos is not None:
+        query = query.where(tuple_(modificacao, coluna_id) > tuple_(*apos))
+    return query.order_by(modificacao, coluna_id).limit(limite)
+
+
+def _filtros_planos(
+    model: type,
+    coluna_periodo,
+    data_inicio: Optional[date],
+    data_termino: Optional[date],
+    cancelado: Optional[bool],
+) -> list:
+    """Monta os filtros de período e de cancelamento das listagens de
+    planos.
+
+    Args:
+        model (type): models.PlanoTrabalho ou models.PlanoEntregas.
+        coluna_periodo: Coluna do período de vigência do plano.
+        data_inicio (Optional[date]): Início do período consultado.
+        data_termino (Optional[date]): Término do período consultado.
+        cancelado (Optional[bool]): Se informado, traz somente os planos
+            cancelados ou somente os não cancelados.
+
+    Returns:
+        list: Condições da cláusula WHERE.
+    """
+    filtros = []
+    if data_inicio is not None or data_termino is not None:
+        filtros.append(
+            coluna_periodo.op("&&")(func.daterange(data_inicio, data_termino, "[]"))
+        )
+    if cancelado is not None:
+        filtros.append(
+            model.cancelado.is_(True) if cancelado else model.cancelado.isnot(True)
+        )
+    return filtros
+
+
+@medir_crud
+async def list_planos_trabalho(
+    db_session: DbContextManager,
+    cod_SIAPE_instituidora: int,
+    limite: int,
+    apos: Optional[tuple[datetime, int]] = None,
+    completo: bool = False,
+    cod_SIAPE_unidade_exercicio: Optional[int] = None,
+    cpf_participante: Optional[str] = None,
+    data_inicio: Optional[date] = None,
+    data_termino: Optional[date] = None,
+    cancelado: Optional[bool] = None,
+) -> list[tuple[BaseModel, datetime]]:
+    """Lista os planos de trabalho de uma unidade instituidora, em ordem
+    de data da última modificação e de id.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão async
+            do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        limite (int): Quantidade máxima de planos de trabalho.
+        apos (Optional[tuple[datetime, int]]): Data da última modificação
+            e id do plano a partir do qual a listagem continua.
+        completo (bool): Se os planos são trazidos completos, com as
+            contribuições e consolidações, em vez de resumidos.
+        cod_SIAPE_unidade_exercicio (Optional[int]): Filtro pela unidade
+            de exercício.
+        cpf_participante (Optional[str]): Filtro pelo participante.
+        data_inicio (Optional[date]): Início do período de vigência
+            consultado; traz os planos que o interceptam.
+        data_termino (Optional[date]): Término do período de vigência
+            consultado.
+        cancelado (Optional[bool]): Filtro pelo cancelamento.
+
+    Returns:
+        list[tuple[BaseModel, datetime]]: Para cada plano, o
+            esquema Pydantic, resumido ou completo, e a data da sua última
+            modificação.
+    """
+    model = models.PlanoTrabalho
+    modificacao = func.coalesce(model.data_atualizacao, model.data_insercao)
+    if completo:
+        query = select(model, modificacao).options(
+            selectinload(model.contribuicoes).lazyload(
+                models.Contribuicao.plano_trabalho
+            ),
+            selectinload(model.consolidacoes).lazyload(
+                models.Consolidacao.plano_trabalho
+            ),
+        )
+    else:
+        query = select(
+            *(
+                model.__table__.c[campo]
+                for campo in schemas.PlanoTrabalhoResumoSchema.model_fields
+                if campo != "data_modificacao"
+            ),
+            modificacao.label("data_modificacao"),
+        )
+    query = query.where(
+        model.cod_SIAPE_instituidora == cod_SIAPE_instituidora,
+        *_filtros_planos(
+            model, model.periodo_plano, data_inicio, data_termino, cancelado
+        ),
+    )
+    if cod_SIAPE_unidade_exercicio is not None:
+        query = query.where(
+            model.cod_SIAPE_unidade_exercicio == cod_SIAPE_unidade_exercicio
+        )
+    if cpf_participante is not None:
+        query = query.where(model.cpf_participante == cpf_participante)
+    query = _pagina(query, model, model.id_plano_trabalho_participante, apos, limite)
+    async with db_session as session:
+        result = await session.execute(query)
+        rows = result.all()
+    if completo:
+        return [
+            (schemas.PlanoTrabalhoSchema.model_validate(plano), data_modificacao)
+            for plano, data_modificacao in rows
+        ]
+    return [
+        (schemas.PlanoTrabalhoResumoSchema.model_validate(row), row.data_modificacao)
+        for row in rows
+    ]
 
 
+@medir_crud
 async def get_plano_entregas(
     db_session: DbContextManager,
     cod_SIAPE_instituidora: int,
@@ -218,134 +1089,412 @@ async def get_plano_entregas(
     return None
 
 
-async def check_planos_entregas_unidade_per_period(
+@medir_crud
+async def get_versao_plano_entregas(
     db_session: DbContextManager,
     cod_SIAPE_instituidora: int,
-    cod_SIAPE_unidade_plano: int,
     id_plano_entrega_unidade: int,
-    data_inicio_plano_entregas: date,
-    data_termino_plano_entregas: date,
-) -> bool:
-    """Verifica se há outros Planos de Entrega no período informado,
-    para a mesma unidade instituidora e mesma unidade do plano, gerando
-    um conflito de sobreposição de datas entre os planos de entregas.
+) -> Optional[tuple[Optional[str], datetime]]:
+    """Traz a versão de um plano de entregas, sem carregar os seus dados, para
+    a validação de requisições condicionais.
 
     Args:
         db_session (DbContextManager): Context manager para a sessão async
             do SQL Alchemy.
         cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
-        cod_SIAPE_unidade_plano (int): Código SIAPE da unidade do Plano
-            de Entregas.
-        id_plano_entrega_unidade (int): id do Plano de Entregas da unidade.
-        data_inicio_plano_entregas (date): Data de início do Plano de
-            Entregas.
-        data_termino_plano_entregas (date): Data de término do Plano de
-            Entregas.
+        id_plano_entrega_unidade (int): id do Plano de Entregas da Unidade.
 
     Returns:
-        bool: True se há conflito; False caso contrário.
+        Optional[tuple[Optional[str], datetime]]: A ETag, derivada do hash
+            do conteúdo, e a data da última modificação, ou None se o
+            plano não existir.
     """
     async with db_session as session:
-        query = (
-            select(func.count())
-            .select_from(models.PlanoEntregas)
-            .filter_by(cod_SIAPE_instituidora=cod_SIAPE_instituidora)
-            .filter_by(cod_SIAPE_unidade_plano=cod_SIAPE_unidade_plano)
-            .filter_by(cancelado=False)
-            .where(
-                and_(
-                    (
-                        # exclui o próprio plano de entregas da verificação
-                        # para não conflitar com ele mesmo
-                        models.PlanoEntregas.id_plano_entrega_unidade
-                        != id_plano_entrega_unidade
-                    ),
-                    (
-                        models.PlanoEntregas.data_inicio_plano_entregas
-                        <= data_termino_plano_entregas
-                    ),
-                    (
-                        models.PlanoEntregas.data_termino_plano_entregas
-                        >= data_inicio_plano_entregas
-                    ),
-                )
+        result = await session.execute(
+            select(
+                models.PlanoEntregas.hash_conteudo,
+                func.coalesce(
+                    models.PlanoEntregas.data_atualizacao,
+                    models.PlanoEntregas.data_insercao,
+                ),
             )
+            .filter_by(cod_SIAPE_instituidora=cod_SIAPE_instituidora)
+            .filter_by(id_plano_entrega_unidade=id_plano_entrega_unidade)
         )
-        result = await session.execute(query)
-        count_plano_entregas = result.scalar()
-    if count_plano_entregas > 0:
-        return True
-    return False
+        row = result.one_or_none()
+    if row is None:
+        return None
+    hash_conteudo, data_modificacao = row
+    return (f'"{hash_conteudo}"' if hash_conteudo else None), data_modificacao
 
 
-async def create_plano_entregas(
+@medir_crud
+async def create_or_update_plano_entregas(
     db_session: DbContextManager,
     plano_entregas: schemas.PlanoEntregasSchema,
-) -> schemas.PlanoEntregasSchema:
-    """Cria um plano de trabalho definido pelos dados do schema Pydantic
-    plano_entregas.
+    if_match: Optional[str] = None,
+) -> tuple[schemas.PlanoEntregasSchema, bool, int]:
+    """Cria um plano de entregas ou, se existente, o atualiza com os
+    dados recebidos, em uma única transação.
+
+    A sobreposição de período com outros planos de entregas da mesma
+    unidade é impedida pela restrição de exclusão
+    _plano_entregas_periodo_excl do banco de dados, inclusive entre
+    requisições simultâneas. Somente as diferenças em relação aos dados
+    existentes são gravadas, como em _upsert_planos_entregas.
+
+    Se o hash do conteúdo recebido for igual ao da última gravação, o
+    plano é retornado sem qualquer verificação ou gravação.
 
     Args:
         db_session (DbContextManager): Context manager para a sessão
             async do SQL Alchemy.
         plano_entregas (schemas.PlanoEntregasSchema): Dados do plano
             de entregas como um esquema Pydantic.
+        if_match (Optional[str]): Valor do cabeçalho If-Match, se
+            informado. O plano de entregas só é gravado se a sua ETag atual
+            constar do cabeçalho.
+
+    Raises:
+        HTTPException: Se a condição de If-Match não for atendida ou se
+            houver sobreposição de período.
 
     Returns:
-        schemas.PlanoEntregasSchema: Esquema Pydantic do Plano de Entregas
-            com os dados que foram gravados no banco.
+        tuple[schemas.PlanoEntregasSchema, bool, int]: Esquema Pydantic
+            do Plano de Entregas gravado, se ele foi criado e a
+            quantidade de linhas inseridas, atualizadas ou apagadas.
     """
-    creation_timestamp = datetime.now()
-    entregas = [
-        models.Entrega(**entrega.model_dump()) for entrega in plano_entregas.entregas
-    ]
-    plano_entregas.entregas = []
-    db_plano_entregas = models.PlanoEntregas(**plano_entregas.model_dump())
-    db_plano_entregas.data_insercao = creation_timestamp
+    cod_SIAPE_instituidora = plano_entregas.cod_SIAPE_instituidora
+    id_plano = plano_entregas.id_plano_entrega_unidade
     async with db_session as session:
-        for entrega in entregas:
-            entrega.data_insercao = creation_timestamp
-            session.add(entrega)
-            db_plano_entregas.entregas.append(entrega)
-            db_plano_entregas.entregas = entregas
-        session.add(db_plano_entregas)
-        await session.commit()
-        await session.refresh(db_plano_entregas)
-    return schemas.PlanoEntregasSchema.model_validate(db_plano_entregas)
+        query = (
+            select(models.PlanoEntregas.hash_conteudo)
+            .filter_by(cod_SIAPE_instituidora=cod_SIAPE_instituidora)
+            .filter_by(id_plano_entrega_unidade=id_plano)
+        )
+        if if_match is not None:
+            # bloqueia o plano até o fim da transação, para que a versão
+            # verificada seja a mesma que será substituída
+            query = query.with_for_update()
+        result = await session.execute(query)
+        row = result.one_or_none()
+        if if_match is not None:
+            etag = None
+            if row is not None:
+                etag = f'"{row.hash_conteudo}"' if row.hash_conteudo else ""
+            if not etag_matches(if_match, etag, weak=False):
+                raise HTTPException(
+                    status_code=412,
+                    detail="O plano de entregas foi alterado ou não existe na versão "
+                    "informada em If-Match",
+                )
+        # reenvio sem alteração: nada a verificar nem a gravar
+        if row is not None and row.hash_conteudo == content_hash(plano_entregas):
+            return plano_entregas, False, 0
+        try:
+            rowcount = await _upsert_planos_entregas(
+                session, cod_SIAPE_instituidora, [plano_entregas], datetime.now()
+            )
+            await _registrar_alteracoes(
+                session,
+                models.TipoAlteracao.plano_entregas,
+                cod_SIAPE_instituidora,
+                [id_plano],
+            )
+            await _notificar_alteracao(
+                session, "plano_entregas", cod_SIAPE_instituidora, [id_plano]
+            )
+            await session.commit()
+            _invalidar_cache("plano_entregas", cod_SIAPE_instituidora, [id_plano])
+        except IntegrityError as e:
+            await session.rollback()
+            mensagem = _mensagem_sobreposicao(e)
+            if mensagem is None:
+                raise
+            raise HTTPException(status_code=422, detail=mensagem) from e
+    return plano_entregas, row is None, rowcount
 
 
-async def update_plano_entregas(
-    db_session: DbContextManager,
-    plano_entregas: schemas.PlanoEntregasSchema,
-) -> schemas.PlanoEntregasSchema:
-    """Atualiza um plano de entregas conforme os dados recebidos no
-    esquema Pydantic em plano_entregas.
+async def _upsert_planos_entregas(
+    session: AsyncSession,
+    cod_SIAPE_instituidora: int,
+    planos_entregas: list[schemas.PlanoEntregasSchema],
+    creation_timestamp: datetime,
+) -> int:
+    """Grava os planos de entregas informados e suas entregas com
+    comandos INSERT ... ON CONFLICT DO UPDATE de múltiplas linhas,
+    apaga as entregas existentes que não constam mais nos planos e
+    atualiza os agregados dos planos e das entregas.
 
-    Os dados existentes são primeiro apagados do banco para depois
-    inserir os dados recebidos.
+    A transação não é confirmada (commit) por esta função.
 
     Args:
-        db_session (DbContextManager): Context manager para a sessão
-            async do SQL Alchemy.
-        plano_entregas (schemas.PlanoEntregasSchema): Dados do plano
-            de entregas como um esquema Pydantic.
+        session (AsyncSession): Sessão async do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        planos_entregas (list[schemas.PlanoEntregasSchema]): Planos de
+            entregas a gravar.
+        creation_timestamp (datetime): Data de inserção dos registros.
+
+    Returns:
+        int: Quantidade de linhas inseridas, atualizadas ou apagadas.
+    """
+    rowcount = await _insert_multirow(
+        session,
+        models.PlanoEntregas,
+        [
+            {
+                **plano.model_dump(exclude={"entregas"}),
+                "hash_conteudo": content_hash(plano),
+                "data_insercao": creation_timestamp,
+            }
+            for plano in planos_entregas
+        ],
+        index_elements=["cod_SIAPE_instituidora", "id_plano_entrega_unidade"],
+    )
+
+    result = await session.execute(
+        select(models.Entrega.id_plano_entrega_unidade, models.Entrega.id_entrega)
+        .filter_by(cod_SIAPE_instituidora=cod_SIAPE_instituidora)
+        .where(
+            models.Entrega.id_plano_entrega_unidade.in_(
+                [plano.id_plano_entrega_unidade for plano in planos_entregas]
+            )
+        )
+    )
+    removidas = set(result.tuples().all()) - {
+        (plano.id_plano_entrega_unidade, entrega.id_entrega)
+        for plano in planos_entregas
+        for entrega in plano.entregas
+    }
+    removidas = list(removidas)
+    # cada entrega removida usa dois parâmetros na cláusula IN
+    batch_size = POSTGRES_MAX_PARAMETERS // 2 - 1
+    for start in range(0, len(removidas), batch_size):
+        result = await session.execute(
+            delete(models.Entrega)
+            .where(models.Entrega.cod_SIAPE_instituidora == cod_SIAPE_instituidora)
+            .where(
+                tuple_(
+                    models.Entrega.id_plano_entrega_unidade, models.Entrega.id_entrega
+                ).in_(removidas[start : start + batch_size])
+            )
+        )
+        rowcount += result.rowcount
+
+    rowcount += await _insert_multirow(
+        session,
+        models.Entrega,
+        [
+            {
+                **entrega.model_dump(),
+                "cod_SIAPE_instituidora": cod_SIAPE_instituidora,
+                "id_plano_entrega_unidade": plano.id_plano_entrega_unidade,
+                "data_insercao": creation_timestamp,
+            }
+            for plano in planos_entregas
+            for entrega in plano.entregas
+        ],
+        index_elements=[
+            "cod_SIAPE_instituidora",
+            "id_plano_entrega_unidade",
+            "id_entrega",
+        ],
+    )
+    await _atualizar_agregados_planos_entregas(
+        session,
+        cod_SIAPE_instituidora,
+        [plano.id_plano_entrega_unidade for plano in planos_entregas],
+    )
+    return rowcount
+
+
+@medir_crud
+async def create_or_update_planos_entregas(
+    db_session: DbContextManager,
+    cod_SIAPE_instituidora: int,
+    planos_entregas: list[schemas.PlanoEntregasSchema],
+    antes_commit: Optional[AntesCommit] = None,
+) -> list[tuple[int, Optional[str]]]:
+    """Cria ou atualiza um lote de planos de entregas de uma mesma
+    unidade instituidora em uma única transação.
+
+    Os planos de entregas com sobreposição de período são rejeitados
+    sem impedir a gravação dos demais. Se a gravação do lote violar
+    alguma restrição de integridade, como a de exclusão que impede a
+    sobreposição, os planos são gravados um a um, na ordem recebida e
+    cada qual em um savepoint, para identificar os que falharam.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão
+            async do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        planos_entregas (list[schemas.PlanoEntregasSchema]): Planos de
+            entregas como esquemas Pydantic, com ids distintos.
+        antes_commit (Optional[AntesCommit]): Função chamada com a sessão
+            e os resultados antes do commit, como o registro do progresso
+            de uma tarefa.
 
     Returns:
-        schemas.PlanoEntregasSchema: Esquema Pydantic do Plano de Entregas
-            com o retorno de create_plano_entregas.
+        list[tuple[int, Optional[str]]]: Para cada plano de entregas, na
+            mesma ordem recebida, o código de status HTTP do resultado e
+            a mensagem de erro, se houver.
     """
+    creation_timestamp = datetime.now()
+    ids = [plano.id_plano_entrega_unidade for plano in planos_entregas]
     async with db_session as session:
         result = await session.execute(
-            select(models.PlanoEntregas)
-            .filter_by(cod_SIAPE_instituidora=plano_entregas.cod_SIAPE_instituidora)
-            .filter_by(id_plano_entrega_unidade=plano_entregas.id_plano_entrega_unidade)
+            select(
+                models.PlanoEntregas.id_plano_entrega_unidade,
+                models.PlanoEntregas.hash_conteudo,
+            )
+            .filter_by(cod_SIAPE_instituidora=cod_SIAPE_instituidora)
+            .where(models.PlanoEntregas.id_plano_entrega_unidade.in_(ids))
         )
-        db_plano_entregas = result.unique().scalar_one()
-        await session.delete(db_plano_entregas)
+        existentes = dict(result.tuples().all())
+        # reenvios sem alteração não são verificados nem gravados
+        inalterados = {
+            plano.id_plano_entrega_unidade
+            for plano in planos_entregas
+            if existentes.get(plano.id_plano_entrega_unidade) == content_hash(plano)
+        }
+
+        resultados = {}
+        for plano in planos_entregas:
+            id_plano = plano.id_plano_entrega_unidade
+            resultados[id_plano] = (200 if id_plano in existentes else 201, None)
+        validos = [
+            plano
+            for plano in planos_entregas
+            if plano.id_plano_entrega_unidade not in inalterados
+        ]
+
+        if validos:
+            try:
+                async with session.begin_nested():
+                    await _upsert_planos_entregas(
+                        session, cod_SIAPE_instituidora, validos, creation_timestamp
+                    )
+            except IntegrityError:
+                for plano in validos:
+                    try:
+                        async with session.begin_nested():
+                            await _upsert_planos_entregas(
+                                session,
+                                cod_SIAPE_instituidora,
+                                [plano],
+                                creation_timestamp,
+                            )
+                    except IntegrityError as exception:
+                        resultados[plano.id_plano_entrega_unidade] = (
+                            422,
+                            _mensagem_sobreposicao(exception)
+                            or f"IntegrityError: {str(exception)}",
+                        )
+            gravados = [
+                plano.id_plano_entrega_unidade
+                for plano in validos
+                if resultados[plano.id_plano_entrega_unidade][0] != 422
+            ]
+            await _registrar_alteracoes(
+                session,
+                models.TipoAlteracao.plano_entregas,
+                cod_SIAPE_instituidora,
+                gravados,
+            )
+            await _notificar_alteracao(
+                session,
+                "plano_entregas",
+                cod_SIAPE_instituidora,
+                [plano.id_plano_entrega_unidade for plano in validos],
+            )
+        if antes_commit is not None:
+            await antes_commit(session, [resultados[id_plano] for id_plano in ids])
         await session.commit()
-    return await create_plano_entregas(db_session, plano_entregas)
+        if validos:
+            _invalidar_cache(
+                "plano_entregas",
+                cod_SIAPE_instituidora,
+                [plano.id_plano_entrega_unidade for plano in validos],
+            )
+    return [resultados[id_plano] for id_plano in ids]
 
 
+@medir_crud
+async def list_planos_entregas(
+    db_session: DbContextManager,
+    cod_SIAPE_instituidora: int,
+    limite: int,
+    apos: Optional[tuple[datetime, int]] = None,
+    completo: bool = False,
+    cod_SIAPE_unidade_plano: Optional[int] = None,
+    data_inicio: Optional[date] = None,
+    data_termino: Optional[date] = None,
+    cancelado: Optional[bool] = None,
+) -> list[tuple[BaseModel, datetime]]:
+    """Lista os planos de entregas de uma unidade instituidora, em ordem
+    de data da última modificação e de id.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão async
+            do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        limite (int): Quantidade máxima de planos de entregas.
+        apos (Optional[tuple[datetime, int]]): Data da última modificação
+            e id do plano a partir do qual a listagem continua.
+        completo (bool): Se os planos são trazidos completos, com as
+            entregas, em vez de resumidos.
+        cod_SIAPE_unidade_plano (Optional[int]): Filtro pela unidade do
+            plano de entregas.
+        data_inicio (Optional[date]): Início do período de vigência
+            consultado; traz os planos que o interceptam.
+        data_termino (Optional[date]): Término do período de vigência
+            consultado.
+        cancelado (Optional[bool]): Filtro pelo cancelamento.
+
+    Returns:
+        list[tuple[BaseModel, datetime]]: Para cada plano, o
+            esquema Pydantic, resumido ou completo, e a data da sua última
+            modificação.
+    """
+    model = models.PlanoEntregas
+    modificacao = func.coalesce(model.data_atualizacao, model.data_insercao)
+    if completo:
+        query = select(model, modificacao).options(
+            selectinload(model.entregas).lazyload(models.Entrega.plano_entregas)
+        )
+    else:
+        query = select(
+            *(
+                model.__table__.c[campo]
+                for campo in schemas.PlanoEntregasResumoSchema.model_fields
+                if campo != "data_modificacao"
+            ),
+            modificacao.label("data_modificacao"),
+        )
+    query = query.where(
+        model.cod_SIAPE_instituidora == cod_SIAPE_instituidora,
+        *_filtros_planos(
+            model, model.periodo_plano_entregas, data_inicio, data_termino, cancelado
+        ),
+    )
+    if cod_SIAPE_unidade_plano is not None:
+        query = query.where(model.cod_SIAPE_unidade_plano == cod_SIAPE_unidade_plano)
+    query = _pagina(query, model, model.id_plano_entrega_unidade, apos, limite)
+    async with db_session as session:
+        result = await session.execute(query)
+        rows = result.all()
+    if completo:
+        return [
+            (schemas.PlanoEntregasSchema.model_validate(plano), data_modificacao)
+            for plano, data_modificacao in rows
+        ]
+    return [
+        (schemas.PlanoEntregasResumoSchema.model_validate(row), row.data_modificacao)
+        for row in rows
+    ]
+
+
+@medir_crud
 async def get_status_participante(
     db_session: DbContextManager,
     cod_SIAPE_instituidora: int,
@@ -382,6 +1531,48 @@ async def get_status_participante(
     return None
 
 
+@medir_crud
+async def get_versao_status_participante(
+    db_session: DbContextManager,
+    cod_SIAPE_instituidora: int,
+    cpf_participante: str,
+) -> Optional[tuple[str, datetime]]:
+    """Traz a versão da lista de status do participante, sem carregar os
+    seus dados, para a validação de requisições condicionais.
+
+    Como os status são apenas acrescentados, a lista é identificada pelo
+    maior id e pela quantidade de status.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão async
+            do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        cpf_participante (str): CPF do participante.
+
+    Returns:
+        Optional[tuple[str, datetime]]: A ETag e a data de inserção do
+            último status, ou None se não houver status.
+    """
+    async with db_session as session:
+        result = await session.execute(
+            select(
+                func.count(),
+                func.max(models.StatusParticipante.id),
+                func.max(models.StatusParticipante.data_insercao),
+            )
+            .where(
+                models.StatusParticipante.cod_SIAPE_instituidora
+                == cod_SIAPE_instituidora
+            )
+            .where(models.StatusParticipante.cpf_participante == cpf_participante)
+        )
+        quantidade, id_maximo, data_insercao = result.one()
+    if not quantidade:
+        return None
+    return f'"{id_maximo}-{quantidade}"', data_insercao
+
+
+@medir_crud
 async def create_status_participante(
     db_session: DbContextManager,
     status_participante: schemas.StatusParticipanteSchema,
@@ -406,11 +1597,783 @@ async def create_status_participante(
     db_status_participante.data_insercao = datetime.now()
     async with db_session as session:
         session.add(db_status_participante)
+        await session.flush()
+        await _registrar_alteracoes(
+            session,
+            models.TipoAlteracao.participante,
+            status_participante.cod_SIAPE_instituidora,
+            [status_participante.cpf_participante],
+        )
         await session.commit()
         await session.refresh(db_status_participante)
     return schemas.StatusParticipanteSchema.model_validate(db_status_participante)
 
 
+@medir_crud
+async def create_lista_status_participante(
+    db_session: DbContextManager,
+    lista_status_participante: list[schemas.StatusParticipanteSchema],
+    antes_commit: Optional[AntesCommit] = None,
+) -> list[schemas.StatusParticipanteSchema]:
+    """Cria os status de participantes informados, que podem se referir
+    a diversos participantes, em uma única transação.
+
+    As listas com pelo menos STATUS_PARTICIPANTE_COPY_THRESHOLD itens
+    são gravadas com COPY; as demais, com inserções de múltiplas linhas.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão async
+            do SQL Alchemy.
+        lista_status_participante (list[schemas.StatusParticipanteSchema]):
+            Lista de esquemas do Pydantic de Status de Participante.
+        antes_commit (Optional[AntesCommit]): Função chamada com a sessão
+            e os resultados antes do commit, como o registro do progresso
+            de uma tarefa.
+
+    Returns:
+        list[schemas.StatusParticipanteSchema]: Lista de esquemas do
+            Pydantic de Status de Participante dos dados inseridos.
+    """
+    creation_timestamp = datetime.now()
+    rows = [
+        {
+            **status_participante.model_dump(),
+            "data_insercao": creation_timestamp,
+        }
+        for status_participante in lista_status_participante
+    ]
+    async with db_session as session:
+        if len(rows) >= STATUS_PARTICIPANTE_COPY_THRESHOLD:
+            await _copy_rows(session, models.StatusParticipante, rows)
+        else:
+            await _insert_multirow(session, models.StatusParticipante, rows)
+        por_instituidora: dict[int, set[str]] = {}
+        for row in rows:
+            cpfs = por_instituidora.setdefault(row["cod_SIAPE_instituidora"], set())
+            cpfs.add(row["cpf_participante"])
+        for cod_SIAPE_instituidora, cpfs in por_instituidora.items():
+            await _registrar_alteracoes(
+                session,
+                models.TipoAlteracao.participante,
+                cod_SIAPE_instituidora,
+                sorted(cpfs),
+            )
+        if antes_commit is not None:
+            await antes_commit(session, [(201, None)] * len(rows))
+        await session.commit()
+    return lista_status_participante
+
+
+def _xmin_snapshot():
+    """Expressão do id da transação mais antiga em andamento no snapshot
+    da consulta, comparável com Alteracao.transacao."""
+    return (
+        func.pg_snapshot_xmin(func.pg_current_snapshot()).cast(String).cast(BigInteger)
+    )
+
+
+@medir_crud
+async def list_alteracoes(
+    db_session: DbContextManager,
+    cod_SIAPE_instituidora: int,
+    limite: int,
+    apos: Optional[tuple[int, int]] = None,
+) -> list[tuple[schemas.AlteracaoSchema, tuple[int, int]]]:
+    """Lista as alterações de recursos de uma unidade instituidora, em
+    ordem de transação e de id, pelo índice ix_alteracao_feed.
+
+    Como as transações podem ser confirmadas fora da ordem em que
+    começaram, somente são trazidas as alterações de transações
+    anteriores à mais antiga ainda em andamento (xmin do snapshot). Assim,
+    uma alteração confirmada depois nunca fica antes da posição de um
+    cursor já informado, e nenhuma alteração é perdida. Por isso, a
+    consulta é feita no banco primário.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão async
+            do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        limite (int): Quantidade máxima de alterações.
+        apos (Optional[tuple[int, int]]): Transação e id da alteração a
+            partir da qual a listagem continua.
+
+    Returns:
+        list[tuple[schemas.AlteracaoSchema, tuple[int, int]]]: Para cada
+            alteração, o esquema Pydantic e a sua posição no feed
+            (transação e id).
+    """
+    model = models.Alteracao
+    query = (
+        select(model)
+        .where(model.cod_SIAPE_instituidora == cod_SIAPE_instituidora)
+        .where(model.transacao < _xmin_snapshot())
+        .order_by(model.transacao, model.id)
+        .limit(limite)
+    )
+    if apos is not None:
+        query = query.where(tuple_(model.transacao, model.id) > tuple_(*apos))
+    async with db_session as session:
+        result = await session.execute(query)
+        alteracoes = result.scalars().all()
+    return [
+        (
+            schemas.AlteracaoSchema.model_validate(alteracao),
+            (alteracao.transacao, alteracao.id),
+        )
+        for alteracao in alteracoes
+    ]
+
+
+@medir_crud
+async def get_agregados_plano_entregas(
+    db_session: DbContextManager,
+    cod_SIAPE_instituidora: int,
+    id_plano_entrega_unidade: int,
+) -> Optional[schemas.AgregadosPlanoEntregasSchema]:
+    """Traz os totais de um plano de entregas e as horas vinculadas a cada
+    uma das suas entregas, das tabelas de agregados mantidas a cada
+    gravação, sem percorrer as contribuições dos planos de trabalho.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão async
+            do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        id_plano_entrega_unidade (int): Id do plano de entregas.
+
+    Returns:
+        Optional[schemas.AgregadosPlanoEntregasSchema]: Os totais, ou None
+            se o plano de entregas não existir.
+    """
+    async with db_session as session:
+        plano = await session.get(
+            models.AgregadoPlanoEntregas,
+            (cod_SIAPE_instituidora, id_plano_entrega_unidade),
+        )
+        if plano is None:
+            return None
+        result = await session.execute(
+            select(models.AgregadoEntrega)
+            .where(
+                models.AgregadoEntrega.cod_SIAPE_instituidora == cod_SIAPE_instituidora
+            )
+            .where(
+                models.AgregadoEntrega.id_plano_entrega_unidade
+                == id_plano_entrega_unidade
+            )
+            .order_by(models.AgregadoEntrega.id_entrega)
+        )
+        entregas = result.scalars().all()
+    return schemas.AgregadosPlanoEntregasSchema(
+        id_plano_entrega_unidade=plano.id_plano_entrega_unidade,
+        cod_SIAPE_unidade_plano=plano.cod_SIAPE_unidade_plano,
+        cancelado=plano.cancelado,
+        quantidade_entregas=plano.quantidade_entregas,
+        media_percentual_progresso_realizado=(
+            plano.soma_percentual_progresso_realizado
+            / plano.quantidade_entregas_com_progresso
+            if plano.quantidade_entregas_com_progresso
+            else None
+        ),
+        horas_vinculadas=sum(entrega.horas_vinculadas for entrega in entregas),
+        entregas=[
+            schemas.HorasEntregaSchema.model_validate(entrega) for entrega in entregas
+        ],
+    )
+
+
+@medir_crud
+async def list_horas_unidades(
+    db_session: DbContextManager,
+    cod_SIAPE_instituidora: int,
+    cod_SIAPE_unidade_plano: Optional[int] = None,
+    data_inicio: Optional[date] = None,
+    data_termino: Optional[date] = None,
+) -> list[schemas.HorasUnidadeSchema]:
+    """Soma as horas vinculadas às entregas de cada unidade de execução,
+    por mês da data da entrega, pelo índice ix_agregado_entrega_unidade.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão async
+            do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        cod_SIAPE_unidade_plano (Optional[int]): Traz somente esta
+            unidade de execução.
+        data_inicio (Optional[date]): Traz somente as entregas a partir
+            desta data.
+        data_termino (Optional[date]): Traz somente as entregas até esta
+            data.
+
+    Returns:
+        list[schemas.HorasUnidadeSchema]: Os totais, em ordem de unidade
+            e de mês.
+    """
+    model = models.AgregadoEntrega
+    mes = func.date_trunc("month", model.data_entrega).cast(Date).label("mes")
+    query = (
+        select(
+            model.cod_SIAPE_unidade_plano,
+            mes,
+            func.count().label("quantidade_entregas"),
+            func.sum(model.horas_vinculadas).label("horas_vinculadas"),
+            func.sum(model.quantidade_contribuicoes).label("quantidade_contribuicoes"),
+        )
+        .where(model.cod_SIAPE_instituidora == cod_SIAPE_instituidora)
+        .group_by(model.cod_SIAPE_unidade_plano, mes)
+        .order_by(model.cod_SIAPE_unidade_plano, mes)
+    )
+    if cod_SIAPE_unidade_plano is not None:
+        query = query.where(model.cod_SIAPE_unidade_plano == cod_SIAPE_unidade_plano)
+    if data_inicio is not None:
+        query = query.where(model.data_entrega >= data_inicio)
+    if data_termino is not None:
+        query = query.where(model.data_entrega <= data_termino)
+    async with db_session as session:
+        result = await session.execute(query)
+        linhas = result.all()
+    return [schemas.HorasUnidadeSchema.model_validate(linha) for linha in linhas]
+
+
+@medir_crud
+async def houve_alteracao(
+    db_session: DbContextManager, cod_SIAPE_instituidora: int, horizonte: int
+) -> bool:
+    """Verifica se há alterações registradas de uma unidade instituidora
+    em transações a partir do horizonte informado, pelo índice
+    ix_alteracao_feed.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão async
+            do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        horizonte (int): Horizonte de um resumo, trazido por
+            get_resumo_organizacao.
+
+    Returns:
+        bool: True se houver alguma alteração confirmada a partir do
+            horizonte.
+    """
+    model = models.Alteracao
+    query = select(
+        exists()
+        .where(model.cod_SIAPE_instituidora == cod_SIAPE_instituidora)
+        .where(model.transacao >= horizonte)
+    )
+    async with db_session as session:
+        return await session.scalar(query)
+
+
+@medir_crud
+async def get_resumo_organizacao(
+    db_session: DbContextManager, cod_SIAPE_instituidora: int
+) -> tuple[int, schemas.ResumoOrganizacaoSchema]:
+    """Calcula o resumo dos planos e dos participantes de uma unidade
+    instituidora.
+
+    As contagens, somas e medidas são calculadas pelo banco de dados, com
+    agregações que leem somente as colunas necessárias e trazem poucas
+    linhas, sem carregar os planos.
+
+    O resumo vem acompanhado do seu horizonte: a transação mais antiga
+    em andamento quando o cálculo começou. Todas as gravações não
+    refletidas no resumo são de transações a partir do horizonte, então o
+    resumo continua atual enquanto houve_alteracao for falso. Enquanto
+    uma transação longa estiver em andamento, o horizonte não avança e os
+    resumos deixam de valer a cada nova gravação da unidade.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão async
+            do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+
+    Returns:
+        tuple[int, schemas.ResumoOrganizacaoSchema]: O horizonte e o
+            resumo.
+    """
+    plano_trabalho = models.PlanoTrabalho
+    plano_entregas = models.PlanoEntregas
+    status = models.StatusParticipante
+    contribuicao = models.Contribuicao
+    consolidacao = models.Consolidacao
+    pt_ativo = and_(
+        plano_trabalho.cod_SIAPE_instituidora == cod_SIAPE_instituidora,
+        plano_trabalho.cancelado.is_not(True),
+    )
+
+    def contagem(model, cancelado: bool):
+        return (
+            select(func.count())
+            .where(model.cod_SIAPE_instituidora == cod_SIAPE_instituidora)
+            .where(
+                model.cancelado.is_(True) if cancelado else model.cancelado.is_not(True)
+            )
+            .scalar_subquery()
+        )
+
+    def filhas_pt_ativo(model):
+        return (
+            select(model)
+            .join(
+                plano_trabalho,
+                and_(
+                    plano_trabalho.cod_SIAPE_instituidora
+                    == model.cod_SIAPE_instituidora,
+                    plano_trabalho.id_plano_trabalho_participante
+                    == model.id_plano_trabalho_participante,
+                ),
+            )
+            .where(pt_ativo)
+        )
+
+    carga_horaria = plano_trabalho.carga_horaria_total_periodo_plano
+    ultimos_status = (
+        select(status.participante_ativo_inativo_pgd, status.modalidade_execucao)
+        .where(status.cod_SIAPE_instituidora == cod_SIAPE_instituidora)
+        .distinct(status.cpf_participante)
+        .order_by(status.cpf_participante, status.id.desc())
+        .subquery()
+    )
+    avaliacoes = union_all(
+        filhas_pt_ativo(consolidacao)
+        .with_only_columns(
+            literal("plano_trabalho"),
+            consolidacao.avaliacao_plano_trabalho,
+            func.count(),
+        )
+        .where(consolidacao.avaliacao_plano_trabalho.is_not(None))
+        .group_by(consolidacao.avaliacao_plano_trabalho),
+        select(
+            literal("plano_entregas"),
+            plano_entregas.avaliacao_plano_entregas,
+            func.count(),
+        )
+        .where(plano_entregas.cod_SIAPE_instituidora == cod_SIAPE_instituidora)
+        .where(plano_entregas.cancelado.is_not(True))
+        .where(plano_entregas.avaliacao_plano_entregas.is_not(None))
+        .group_by(plano_entregas.avaliacao_plano_entregas),
+    )
+
+    async with db_session as session:
+        horizonte, *planos = (
+            await session.execute(
+                select(
+                    _xmin_snapshot(),
+                    contagem(plano_trabalho, False),
+                    contagem(plano_trabalho, True),
+                    contagem(plano_entregas, False),
+                    contagem(plano_entregas, True),
+                )
+            )
+        ).one()
+        distribuicao = (
+            await session.execute(
+                select(
+                    func.count(carga_horaria),
+                    func.min(carga_horaria),
+                    func.percentile_cont(0.25).within_group(carga_horaria),
+                    func.percentile_cont(0.5).within_group(carga_horaria),
+                    func.percentile_cont(0.75).within_group(carga_horaria),
+                    func.max(carga_horaria),
+                    func.avg(carga_horaria),
+                ).where(pt_ativo)
+            )
+        ).one()
+        participantes = (
+            await session.execute(
+                select(
+                    ultimos_status.c.participante_ativo_inativo_pgd,
+                    ultimos_status.c.modalidade_execucao,
+                    func.count(),
+                ).group_by(
+                    ultimos_status.c.participante_ativo_inativo_pgd,
+                    ultimos_status.c.modalidade_execucao,
+                )
+            )
+        ).all()
+        horas = (
+            await session.execute(
+                filhas_pt_ativo(contribuicao)
+                .with_only_columns(
+                    contribuicao.tipo_contribuicao,
+                    func.sum(contribuicao.horas_vinculadas),
+                )
+                .group_by(contribuicao.tipo_contribuicao)
+            )
+        ).all()
+        notas = (await session.execute(avaliacoes)).all()
+
+    # os códigos válidos das avaliações vão de 1 (excepcional) a 5 (não
+    # executado)
+    avaliacoes_por_tipo = {
+        tipo: {nota: 0 for nota in range(1, 6)}
+        for tipo in ("plano_trabalho", "plano_entregas")
+    }
+    for tipo, nota, quantidade in notas:
+        avaliacoes_por_tipo[tipo][nota] = quantidade
+    por_modalidade = {modalidade.value: 0 for modalidade in models.ModalidadesExecucao}
+    inativos = 0
+    for ativo, modalidade, quantidade in participantes:
+        if ativo:
+            por_modalidade[modalidade] = quantidade
+        else:
+            inativos += quantidade
+    por_tipo_contribuicao = {tipo.value: 0 for tipo in models.TipoContribuicao}
+    por_tipo_contribuicao.update(horas)
+    quantidade, minimo, *quartis, maximo, media = distribuicao
+    resumo = schemas.ResumoOrganizacaoSchema(
+        planos_trabalho=schemas.QuantidadePlanosSchema(
+            ativos=planos[0], cancelados=planos[1]
+        ),
+        planos_entregas=schemas.QuantidadePlanosSchema(
+            ativos=planos[2], cancelados=planos[3]
+        ),
+        participantes_ativos_por_modalidade_execucao=por_modalidade,
+        participantes_inativos=inativos,
+        carga_horaria_total_periodo_plano=schemas.DistribuicaoSchema(
+            quantidade=quantidade,
+            minimo=minimo,
+            primeiro_quartil=quartis[0],
+            mediana=quartis[1],
+            terceiro_quartil=quartis[2],
+            maximo=maximo,
+            media=media,
+        ),
+        horas_por_tipo_contribuicao=por_tipo_contribuicao,
+        avaliacoes_planos_trabalho=avaliacoes_por_tipo["plano_trabalho"],
+        avaliacoes_planos_entregas=avaliacoes_por_tipo["plano_entregas"],
+    )
+    return horizonte, resumo
+
+
+# Quantidade de linhas lidas do cursor do banco a cada vez nas
+# exportações
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+
+
+async def stream_exportacao(
+    db_session: DbContextManager,
+    tipo: models.TipoTarefa,
+    cod_SIAPE_instituidora: int,
+) -> AsyncIterator[list[BaseModel]]:
+    """Lê todos os planos de trabalho, planos de entregas ou status de
+    participantes de uma unidade instituidora com um cursor no servidor
+    do banco de dados, em lotes de EXPORT_BATCH_SIZE itens.
+
+    Os itens filhos de cada lote de planos (contribuições, consolidações
+    ou entregas) são carregados em uma consulta por lote. Como a sessão
+    só mantém referências fracas aos objetos lidos, cada lote é
+    descartado após o seu uso, e a memória usada não depende da
+    quantidade de itens exportados.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão async
+            do SQL Alchemy.
+        tipo (models.TipoTarefa): Tipo dos itens exportados.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+
+    Yields:
+        list[BaseModel]: Lote de itens como esquemas Pydantic, completos
+            como na consulta individual.
+    """
+    if tipo == models.TipoTarefa.planos_trabalho:
+        model = models.PlanoTrabalho
+        schema = schemas.PlanoTrabalhoSchema
+        query = (
+            select(model)
+            .options(
+                selectinload(model.contribuicoes).lazyload(
+                    models.Contribuicao.plano_trabalho
+                ),
+                selectinload(model.consolidacoes).lazyload(
+                    models.Consolidacao.plano_trabalho
+                ),
+            )
+            .order_by(model.id_plano_trabalho_participante)
+        )
+    elif tipo == models.TipoTarefa.planos_entregas:
+        model = models.PlanoEntregas
+        schema = schemas.PlanoEntregasSchema
+        query = (
+            select(model)
+            .options(
+                selectinload(model.entregas).lazyload(models.Entrega.plano_entregas)
+            )
+            .order_by(model.id_plano_entrega_unidade)
+        )
+    else:
+        model = models.StatusParticipante
+        schema = schemas.StatusParticipanteSchema
+        query = select(model).order_by(model.cpf_participante, model.id)
+    query = query.where(
+        model.cod_SIAPE_instituidora == cod_SIAPE_instituidora
+    ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    async with db_session as session:
+        result = await session.stream(query)
+        async for lote in result.scalars().partitions():
+            yield [schema.model_validate(item) for item in lote]
+
+
+@medir_crud
+async def create_tarefa(
+    db_session: DbContextManager,
+    cod_SIAPE_instituidora: int,
+    tipo: models.TipoTarefa,
+    conteudo: bytes,
+) -> schemas.TarefaSchema:
+    """Enfileira uma tarefa de processamento de um envio em lote.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão async
+            do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        tipo (models.TipoTarefa): Tipo dos itens enviados.
+        conteudo (bytes): Corpo do envio em lote, no formato NDJSON.
+
+    Returns:
+        schemas.TarefaSchema: Esquema Pydantic da tarefa criada.
+    """
+    db_tarefa = models.Tarefa(
+        cod_SIAPE_instituidora=cod_SIAPE_instituidora,
+        tipo=tipo.value,
+        situacao=models.SituacaoTarefa.pendente.value,
+        conteudo=conteudo,
+        quantidade_total=sum(1 for linha in conteudo.split(b"\n") if linha.strip()),
+        quantidade_processada=0,
+        quantidade_rejeitada=0,
+        ultima_linha_processada=0,
+        erros=[],
+        data_insercao=datetime.now(),
+    )
+    async with db_session as session:
+        session.add(db_tarefa)
+        await session.commit()
+    return schemas.TarefaSchema.model_validate(db_tarefa)
+
+
+@medir_crud
+async def get_tarefa(
+    db_session: DbContextManager,
+    cod_SIAPE_instituidora: int,
+    id_tarefa: int,
+) -> Optional[schemas.TarefaSchema]:
+    """Traz a situação de uma tarefa, sem o conteúdo do envio.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão async
+            do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        id_tarefa (int): id da tarefa.
+
+    Returns:
+        Optional[schemas.TarefaSchema]: Esquema Pydantic da tarefa
+            encontrada ou None.
+    """
+    async with db_session as session:
+        result = await session.execute(
+            select(models.Tarefa)
+            .options(defer(models.Tarefa.conteudo))
+            .filter_by(cod_SIAPE_instituidora=cod_SIAPE_instituidora)
+            .filter_by(id=id_tarefa)
+        )
+        db_tarefa = result.scalar_one_or_none()
+    if db_tarefa:
+        return schemas.TarefaSchema.model_validate(db_tarefa)
+    return None
+
+
+@medir_crud
+async def claim_tarefa(
+    db_session: DbContextManager,
+    lease_seconds: int,
+) -> Optional[models.Tarefa]:
+    """Reserva a próxima tarefa a processar para o processo chamador.
+
+    A consulta usa FOR UPDATE SKIP LOCKED para que vários processos
+    possam reservar tarefas ao mesmo tempo sem disputar a mesma linha.
+    Também são reservadas as tarefas em processamento cuja última
+    atualização tenha ocorrido há mais de lease_seconds segundos, o que
+    indica que o processo que as reservou foi interrompido.
+
+    Cada reserva recebe um novo token_reserva, exigido nas atualizações
+    do progresso e no encerramento da tarefa, de modo que o processo cuja
+    reserva expirou não consegue mais alterá-la.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão async
+            do SQL Alchemy.
+        lease_seconds (int): Tempo máximo, em segundos, sem atualização
+            de uma tarefa em processamento.
+
+    Returns:
+        Optional[models.Tarefa]: A tarefa reservada, com o conteúdo do
+            envio, ou None se não houver tarefa a processar.
+    """
+    now = datetime.now()
+    async with db_session as session:
+        result = await session.execute(
+            select(models.Tarefa.id)
+            .where(
+                or_(
+                    models.Tarefa.situacao == models.SituacaoTarefa.pendente.value,
+                    and_(
+                        models.Tarefa.situacao
+                        == models.SituacaoTarefa.em_processamento.value,
+                        models.Tarefa.data_atualizacao
+                        < now - timedelta(seconds=lease_seconds),
+                    ),
+                )
+            )
+            .order_by(models.Tarefa.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        id_tarefa = result.scalar_one_or_none()
+        if id_tarefa is None:
+            await session.rollback()
+            return None
+        result = await session.execute(
+            update(models.Tarefa)
+            .where(models.Tarefa.id == id_tarefa)
+            .values(
+                situacao=models.SituacaoTarefa.em_processamento.value,
+                data_inicio_processamento=func.coalesce(
+                    models.Tarefa.data_inicio_processamento, now
+                ),
+                data_atualizacao=now,
+                token_reserva=uuid.uuid4().hex,
+            )
+            .returning(models.Tarefa)
+        )
+        db_tarefa = result.scalar_one()
+        await session.commit()
+    return db_tarefa
+
+
+class TarefaPerdida(Exception):
+    """A reserva da tarefa expirou e ela pode ter sido reservada por outro
+    processo."""
+
+
+def _filtro_reserva(id_tarefa: int, token_reserva: str):
+    "Condição das atualizações de uma tarefa pelo processo que a reservou."
+    return and_(
+        models.Tarefa.id == id_tarefa,
+        models.Tarefa.token_reserva == token_reserva,
+        models.Tarefa.situacao == models.SituacaoTarefa.em_processamento.value,
+    )
+
+
+async def registrar_progresso_tarefa(
+    session: AsyncSession,
+    id_tarefa: int,
+    token_reserva: str,
+    resultados: list[dict],
+):
+    """Registra o resultado dos itens processados de uma tarefa desde a
+    última atualização, na transação corrente.
+
+    Chamada na mesma transação que grava os itens, antes do commit, de
+    modo que os itens gravados e o progresso são confirmados juntos e
+    uma tarefa retomada não grava novamente os mesmos itens.
+
+    A transação não é confirmada (commit) por esta função.
+
+    Args:
+        session (AsyncSession): Sessão async do SQL Alchemy.
+        id_tarefa (int): id da tarefa.
+        token_reserva (str): token_reserva da tarefa reservada.
+        resultados (list[dict]): Resultados dos itens processados, no
+            formato de schemas.ResultadoItemLoteSchema.
+
+    Raises:
+        TarefaPerdida: Se a tarefa não estiver mais reservada com o token
+            informado.
+    """
+    if not resultados:
+        return
+    erros = [resultado for resultado in resultados if resultado["status_code"] >= 400]
+    result = await session.execute(
+        update(models.Tarefa)
+        .where(_filtro_reserva(id_tarefa, token_reserva))
+        .values(
+            quantidade_processada=models.Tarefa.quantidade_processada + len(resultados),
+            quantidade_rejeitada=models.Tarefa.quantidade_rejeitada + len(erros),
+            ultima_linha_processada=max(resultado["linha"] for resultado in resultados),
+            erros=models.Tarefa.erros.op("||")(literal(erros, JSONB)),
+            data_atualizacao=datetime.now(),
+        )
+    )
+    if result.rowcount == 0:
+        raise TarefaPerdida(f"A reserva da tarefa {id_tarefa} expirou")
+
+
+@medir_crud
+async def update_progresso_tarefa(
+    db_session: DbContextManager,
+    id_tarefa: int,
+    token_reserva: str,
+    resultados: list[dict],
+):
+    """Registra, em uma transação própria, o resultado de itens que não
+    foram gravados, como os rejeitados na validação ao final do envio.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão async
+            do SQL Alchemy.
+        id_tarefa (int): id da tarefa.
+        token_reserva (str): token_reserva da tarefa reservada.
+        resultados (list[dict]): Resultados dos itens processados, no
+            formato de schemas.ResultadoItemLoteSchema.
+
+    Raises:
+        TarefaPerdida: Se a tarefa não estiver mais reservada com o token
+            informado.
+    """
+    if not resultados:
+        return
+    async with db_session as session:
+        await registrar_progresso_tarefa(session, id_tarefa, token_reserva, resultados)
+        await session.commit()
+
+
+@medir_crud
+async def finish_tarefa(
+    db_session: DbContextManager,
+    id_tarefa: int,
+    token_reserva: str,
+    situacao: models.SituacaoTarefa,
+    mensagem_falha: Optional[str] = None,
+):
+    """Encerra o processamento de uma tarefa.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão async
+            do SQL Alchemy.
+        id_tarefa (int): id da tarefa.
+        token_reserva (str): token_reserva da tarefa reservada.
+        situacao (models.SituacaoTarefa): Situação final da tarefa.
+        mensagem_falha (Optional[str]): Mensagem de erro, em caso de falha.
+
+    Raises:
+        TarefaPerdida: Se a tarefa não estiver mais reservada com o token
+            informado.
+    """
+    now = datetime.now()
+    async with db_session as session:
+        result = await session.execute(
+            update(models.Tarefa)
+            .where(_filtro_reserva(id_tarefa, token_reserva))
+            .values(
+                situacao=situacao.value,
+                mensagem_falha=mensagem_falha,
+                data_conclusao=now,
+                data_atualizacao=now,
+            )
+        )
+        if result.rowcount == 0:
+            raise TarefaPerdida(f"A reserva da tarefa {id_tarefa} expirou")
+        await session.commit()
+
+
 # The following methods are only for test in CI/CD environment
 
 
@@ -420,6 +2383,8 @@ def truncate_plano_entregas():
     """
     with SyncSession.begin() as session:
         result = session.execute(text("TRUNCATE plano_entregas CASCADE;"))
+        session.execute(text(f"NOTIFY {cache.CANAL}, '*';"))
+    cache.limpar()
     return result
 
 
@@ -429,6 +2394,14 @@ def truncate_plano_trabalho():
     """
     with SyncSession.begin() as session:
         result = session.execute(text("TRUNCATE plano_trabalho CASCADE;"))
+        session.execute(
+            text(
+                "UPDATE agregado_entrega "
+                "SET horas_vinculadas = 0, quantidade_contribuicoes = 0;"
+            )
+        )
+        session.execute(text(f"NOTIFY {cache.CANAL}, '*';"))
+    cache.limpar()
     return result
 
 
@@ -438,4 +2411,15 @@ def truncate_status_participante():
     """
     with SyncSession.begin() as session:
         result = session.execute(text("TRUNCATE status_participante CASCADE;"))
+        session.execute(text(f"NOTIFY {cache.CANAL}, '*';"))
+    cache.limpar()
+    return result
+
+
+def truncate_tarefa():
+    """Apaga a tabela tarefa.
+    Usado no ambiente de testes de integração contínua.
+    """
+    with SyncSession.begin() as session:
+        result = session.execute(text("TRUNCATE tarefa CASCADE;"))
     return result
@@ -1,31 +1,155 @@
 """Funções para estabelecer conexões com o banco de dados e sessões.
 """
 
+import bisect
+import math
 import os
-from typing import AsyncGenerator
+import time
+from typing import AsyncGenerator, Optional
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-SQLALCHEMY_DATABASE_URL = os.environ["SQLALCHEMY_DATABASE_URL"]
+from consultas_lentas import registrar_consultas_lentas
+from metricas import instrumentar_engine
 
-engine = create_async_engine(SQLALCHEMY_DATABASE_URL)
-sync_engine = create_engine(SQLALCHEMY_DATABASE_URL)
+SQLALCHEMY_DATABASE_URL = os.environ["SQLALCHEMY_DATABASE_URL"]
+# URLs das réplicas de leitura, separadas por vírgulas. Se vazio, as
+# consultas também usam o banco primário.
+SQLALCHEMY_REPLICA_URLS = [
+    url.strip()
+    for url in os.environ.get("SQLALCHEMY_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+# Tempo, em segundos, após uma gravação durante o qual as consultas do
+# mesmo cliente são feitas no banco primário
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", "5"))
+# Cookie com o instante da última gravação do cliente
+COOKIE_ULTIMA_ESCRITA = "ultima_escrita"
+
+# Configuração do pool de conexões de cada processo
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+# Tempo máximo, em segundos, de espera por uma conexão livre
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+# Idade máxima, em segundos, de uma conexão. -1 não limita.
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "-1"))
+# Se as conexões devem ser testadas antes de cada uso
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "false").lower() in (
+    "1",
+    "true",
+)
+# Tempo máximo, em milissegundos, de execução de cada comando SQL. Zero
+# não limita.
+DB_STATEMENT_TIMEOUT = int(os.environ.get("DB_STATEMENT_TIMEOUT", "0"))
+
+# Limites, em segundos, das faixas do histograma de espera por conexões
+LIMITES_ESPERA_POOL = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+
+class HistogramaEspera:
+    """Histograma cumulativo dos tempos de espera por uma conexão do pool,
+    no formato usado pelo Prometheus."""
+
+    def __init__(self, limites: tuple = LIMITES_ESPERA_POOL):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)
+        self.soma = 0.0
+
+    def observar(self, segundos: float):
+        "Registra um tempo de espera."
+        self.contagens[bisect.bisect_left(self.limites, segundos)] += 1
+        self.soma += segundos
+
+    def como_dict(self) -> dict:
+        "Traz as contagens acumuladas por faixa, a soma e a contagem total."
+        faixas = {}
+        acumulado = 0
+        for limite, contagem in zip(self.limites + ("+Inf",), self.contagens):
+            acumulado += contagem
+            faixas[str(limite)] = acumulado
+        return {"faixas": faixas, "soma": self.soma, "contagem": acumulado}
+
+
+class PoolMonitorado(AsyncAdaptedQueuePool):
+    "Pool de conexões que registra o tempo de espera por cada conexão."
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.espera = HistogramaEspera()
+        # Histograma do Prometheus, definido por metricas.instrumentar_engine
+        self.metrica_espera = None
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            espera = time.perf_counter() - inicio
+            self.espera.observar(espera)
+            if self.metrica_espera is not None:
+                self.metrica_espera.observe(espera)
+
+
+parametros_pool = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+if DB_STATEMENT_TIMEOUT > 0:
+    parametros_pool["connect_args"] = {
+        "options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"
+    }
+
+engine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL, poolclass=PoolMonitorado, **parametros_pool
+)
+sync_engine = create_engine(SQLALCHEMY_DATABASE_URL, **parametros_pool)
+replica_engines = [
+    create_async_engine(url, poolclass=PoolMonitorado, **parametros_pool)
+    for url in SQLALCHEMY_REPLICA_URLS
+]
+instrumentar_engine(engine.sync_engine, "primario")
+registrar_consultas_lentas(engine)
+for replica_engine in replica_engines:
+    instrumentar_engine(replica_engine.sync_engine, "replica")
+    registrar_consultas_lentas(replica_engine)
 
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
+replica_session_makers = [
+    async_sessionmaker(replica_engine, expire_on_commit=False)
+    for replica_engine in replica_engines
+]
 SyncSession = sessionmaker(sync_engine)
 
+_proxima_replica = 0
+
 
 # database models (SQLAlchemy)
 class Base(DeclarativeBase):
     pass
 
 
-async def create_db_and_tables():
-    async with engine.begin() as conn:
-        # await conn.run_sync(Base.metadata.drop_all)  # remover depois
-        await conn.run_sync(Base.metadata.create_all)
+def estatisticas_pool() -> dict:
+    """Traz o estado atual do pool de conexões assíncronas deste processo.
+
+    Returns:
+        dict: Tamanho configurado, conexões livres, em uso e excedentes
+            (overflow), e o histograma do tempo de espera por conexões.
+    """
+    pool = engine.sync_engine.pool
+    return {
+        "tamanho": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "livres": pool.checkedin(),
+        "em_uso": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "espera_segundos": pool.espera.como_dict(),
+    }
 
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
@@ -41,6 +165,8 @@ async def get_db():
         db.aclose()
 
 class DbContextManager:
+    replica = False
+
     def __init__(self):
         self.db = async_session_maker()
 
@@ -49,3 +175,74 @@ class DbContextManager:
 
     async def __aexit__(self, exc_type, exc_value, traceback):
         await self.db.close()
+
+
+class DbContextManagerReplica(DbContextManager):
+    "Sessão em uma das réplicas de leitura, escolhidas em rodízio."
+
+    replica = True
+
+    def __init__(self):  # pylint: disable=super-init-not-called
+        global _proxima_replica  # pylint: disable=global-statement
+        _proxima_replica = (_proxima_replica + 1) % len(replica_session_makers)
+        self.db = replica_session_makers[_proxima_replica]()
+
+
+def cookie_escrita() -> dict:
+    """Monta o cookie que registra uma gravação do cliente, para que as
+    suas próximas consultas, por READ_YOUR_WRITES_SECONDS segundos, sejam
+    feitas no banco primário.
+
+    O registro viaja com o cliente, e não na memória do processo, de modo
+    que vale para todos os processos e instâncias da API.
+
+    Returns:
+        dict: Argumentos para Response.set_cookie.
+    """
+    return {
+        "key": COOKIE_ULTIMA_ESCRITA,
+        "value": f"{time.time():.3f}",
+        "max_age": math.ceil(READ_YOUR_WRITES_SECONDS),
+        "httponly": True,
+        "samesite": "strict",
+    }
+
+
+def escrita_recente(ultima_escrita: Optional[str]) -> bool:
+    """Verifica se o cliente fez uma gravação nos últimos
+    READ_YOUR_WRITES_SECONDS segundos.
+
+    Args:
+        ultima_escrita (Optional[str]): Valor do cookie com o instante da
+            última gravação do cliente.
+
+    Returns:
+        bool: True se a gravação for recente.
+    """
+    try:
+        instante = float(ultima_escrita)
+    except (TypeError, ValueError):
+        return False
+    return time.time() - instante < READ_YOUR_WRITES_SECONDS
+
+
+def sessao_leitura(
+    ultima_escrita: Optional[str], ler_primario: bool = False
+) -> DbContextManager:
+    """Escolhe o banco de dados de uma consulta.
+
+    A consulta é feita em uma réplica, se houver, exceto quando o cliente
+    pedir a leitura no primário ou tiver feito uma gravação recentemente,
+    de modo que sempre leia as próprias gravações.
+
+    Args:
+        ultima_escrita (Optional[str]): Valor do cookie com o instante da
+            última gravação do cliente.
+        ler_primario (bool): Se o cliente pediu a leitura no primário.
+
+    Returns:
+        DbContextManager: Context manager para a sessão escolhida.
+    """
+    if not replica_session_makers or ler_primario or escrita_recente(ultima_escrita):
+        return DbContextManager()
+    return DbContextManagerReplica()
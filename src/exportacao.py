@@ -0,0 +1,79 @@
+"""Funções para a exportação dos dados de uma unidade instituidora em
+fluxo, nos formatos NDJSON ou CSV, à medida que são lidos do banco de
+dados.
+"""
+
+import csv
+import enum
+import io
+import json
+from typing import AsyncIterator
+
+from pydantic import BaseModel
+
+
+class FormatoExportacao(str, enum.Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+# Tipo de conteúdo (Content-Type) de cada formato
+TIPOS_CONTEUDO = {
+    FormatoExportacao.ndjson: "application/x-ndjson",
+    FormatoExportacao.csv: "text/csv; charset=utf-8",
+}
+
+
+async def gerar_ndjson(lotes: AsyncIterator[list[BaseModel]]) -> AsyncIterator[bytes]:
+    """Gera o conteúdo NDJSON de uma exportação, um bloco por lote lido.
+
+    Cada linha tem o mesmo formato aceito pelos envios em lote, de modo
+    que o conteúdo exportado pode ser enviado novamente.
+
+    Args:
+        lotes (AsyncIterator[list[BaseModel]]): Lotes de itens lidos do
+            banco de dados.
+
+    Yields:
+        bytes: Linhas de um lote.
+    """
+    async for lote in lotes:
+        if lote:
+            yield b"".join(item.model_dump_json().encode() + b"\n" for item in lote)
+
+
+def _valor_csv(valor):
+    "Representa os itens filhos de um plano, em uma coluna do CSV, em JSON."
+    if isinstance(valor, list):
+        return json.dumps(valor, ensure_ascii=False)
+    return valor
+
+
+async def gerar_csv(
+    lotes: AsyncIterator[list[BaseModel]], campos: list[str]
+) -> AsyncIterator[bytes]:
+    """Gera o conteúdo CSV de uma exportação, um bloco por lote lido.
+
+    Os itens filhos de cada plano, como as entregas, são informados em
+    JSON na coluna de mesmo nome.
+
+    Args:
+        lotes (AsyncIterator[list[BaseModel]]): Lotes de itens lidos do
+            banco de dados.
+        campos (list[str]): Campos dos itens, na ordem das colunas.
+
+    Yields:
+        bytes: Cabeçalho e linhas de um lote.
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(campos)
+    async for lote in lotes:
+        for item in lote:
+            dados = item.model_dump(mode="json")
+            escritor.writerow(_valor_csv(dados[campo]) for campo in campos)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
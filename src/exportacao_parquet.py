@@ -0,0 +1,314 @@
+"""Exportação das tabelas do PGD em arquivos Parquet, para análise.
+
+Cada tabela é gravada em colunas, comprimidas, com um arquivo por
+unidade instituidora, em diretórios no formato de particionamento do
+Hive:
+
+    {destino}/{tabela}/cod_SIAPE_instituidora={cod}/dados.parquet
+
+Assim, o diretório de cada tabela pode ser lido como um único conjunto de
+dados, por exemplo com pyarrow.dataset.dataset(caminho,
+partitioning="hive"), e as consultas filtradas por unidade instituidora
+leem somente os arquivos dela.
+
+As linhas são lidas com um cursor no servidor do banco de dados e
+gravadas em grupos de PARQUET_ROW_GROUP_SIZE linhas, então a memória
+usada não depende do tamanho da tabela. As unidades instituidoras são
+exportadas em paralelo, por PARQUET_EXPORT_WORKERS processos. A leitura
+é feita na primeira réplica de SQLALCHEMY_REPLICA_URLS, se houver.
+
+Uso:
+    python exportacao_parquet.py DESTINO [--organizacao COD ...]
+"""
+
+import argparse
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Date,
+    DateTime,
+    Float,
+    Integer,
+    String,
+    Table,
+    create_engine,
+    select,
+    union,
+)
+from sqlalchemy.pool import NullPool
+
+import models
+from db_config import SQLALCHEMY_DATABASE_URL, SQLALCHEMY_REPLICA_URLS
+
+# Quantidade de linhas lidas do cursor do banco a cada vez
+PARQUET_BATCH_SIZE = int(os.environ.get("PARQUET_BATCH_SIZE", "10000"))
+# Quantidade máxima de linhas de cada grupo de linhas (row group) dos
+# arquivos. Grupos maiores comprimem melhor e usam mais memória.
+PARQUET_ROW_GROUP_SIZE = int(os.environ.get("PARQUET_ROW_GROUP_SIZE", "100000"))
+# Algoritmo de compressão: zstd, snappy, gzip, lz4, brotli ou none
+PARQUET_COMPRESSION = os.environ.get("PARQUET_COMPRESSION", "zstd")
+# Quantidade de processos que exportam as unidades instituidoras
+PARQUET_EXPORT_WORKERS = int(
+    os.environ.get("PARQUET_EXPORT_WORKERS", str(os.cpu_count() or 1))
+)
+
+# Tabelas exportadas
+TABELAS: list[Table] = [
+    models.PlanoTrabalho.__table__,
+    models.Contribuicao.__table__,
+    models.Consolidacao.__table__,
+    models.PlanoEntregas.__table__,
+    models.Entrega.__table__,
+    models.StatusParticipante.__table__,
+]
+
+# Tipos Arrow correspondentes aos tipos das colunas
+TIPOS_ARROW = {
+    BigInteger: pa.int64(),
+    Integer: pa.int32(),
+    Boolean: pa.bool_(),
+    Float: pa.float64(),
+    Date: pa.date32(),
+    DateTime: pa.timestamp("us"),
+    String: pa.string(),
+}
+
+logger = logging.getLogger(__name__)
+
+engine = create_engine(
+    SQLALCHEMY_REPLICA_URLS[0] if SQLALCHEMY_REPLICA_URLS else SQLALCHEMY_DATABASE_URL,
+    poolclass=NullPool,
+)
+
+
+def tipo_arrow(tipo) -> Optional[pa.DataType]:
+    """Traz o tipo Arrow de um tipo de coluna do SQL Alchemy.
+
+    Args:
+        tipo: Tipo da coluna.
+
+    Returns:
+        Optional[pa.DataType]: O tipo Arrow, ou None se o tipo não for
+            exportado, como os intervalos de datas calculados a partir de
+            outras colunas.
+    """
+    for tipo_coluna, tipo_pa in TIPOS_ARROW.items():
+        if isinstance(tipo, tipo_coluna):
+            return tipo_pa
+    return None
+
+
+def esquema_arrow(tabela: Table) -> pa.Schema:
+    """Monta o esquema Arrow de uma tabela, sem a coluna de partição
+    cod_SIAPE_instituidora e sem as colunas de tipos não exportados.
+
+    Args:
+        tabela (Table): Tabela do SQL Alchemy.
+
+    Returns:
+        pa.Schema: O esquema, com os comentários das colunas nos
+            metadados dos campos.
+    """
+    campos = []
+    for coluna in tabela.columns:
+        tipo = tipo_arrow(coluna.type)
+        if tipo is None or coluna.name == "cod_SIAPE_instituidora":
+            continue
+        campos.append(
+            pa.field(
+                coluna.name,
+                tipo,
+                nullable=coluna.nullable,
+                metadata={"comentario": coluna.comment} if coluna.comment else None,
+            )
+        )
+    return pa.schema(campos)
+
+
+def listar_organizacoes() -> list[int]:
+    """Lista as unidades instituidoras que têm planos ou status de
+    participantes.
+
+    Returns:
+        list[int]: Códigos SIAPE das unidades instituidoras.
+    """
+    consulta = union(
+        *(
+            select(model.cod_SIAPE_instituidora).distinct()
+            for model in (
+                models.PlanoTrabalho,
+                models.PlanoEntregas,
+                models.StatusParticipante,
+            )
+        )
+    )
+    with engine.connect() as connection:
+        return sorted(connection.execute(consulta).scalars())
+
+
+def exportar_tabela(
+    connection, tabela: Table, cod_SIAPE_instituidora: int, destino: str
+) -> int:
+    """Exporta as linhas de uma tabela de uma unidade instituidora para um
+    arquivo Parquet.
+
+    O arquivo é gravado com outro nome e renomeado ao final, para que
+    nunca seja lido incompleto. Se a unidade não tiver linhas na tabela,
+    nenhum arquivo é gravado e o existente é removido.
+
+    Args:
+        connection: Conexão síncrona com o banco de dados.
+        tabela (Table): Tabela do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        destino (str): Diretório de destino da exportação.
+
+    Returns:
+        int: Quantidade de linhas exportadas.
+    """
+    esquema = esquema_arrow(tabela)
+    diretorio = os.path.join(
+        destino, tabela.name, f"cod_SIAPE_instituidora={cod_SIAPE_instituidora}"
+    )
+    caminho = os.path.join(diretorio, "dados.parquet")
+    temporario = f"{caminho}.tmp"
+    result = connection.execution_options(
+        stream_results=True, yield_per=PARQUET_BATCH_SIZE
+    ).execute(
+        select(*(tabela.c[campo.name] for campo in esquema))
+        .where(tabela.c.cod_SIAPE_instituidora == cod_SIAPE_instituidora)
+        .order_by(*tabela.primary_key.columns)
+    )
+    quantidade = 0
+    pendentes: list[pa.RecordBatch] = []
+    pendentes_linhas = 0
+    writer: Optional[pq.ParquetWriter] = None
+    try:
+        for linhas in result.partitions():
+            colunas = list(zip(*linhas))
+            pendentes.append(
+                pa.record_batch(
+                    [
+                        pa.array(coluna, type=campo.type)
+                        for coluna, campo in zip(colunas, esquema)
+                    ],
+                    schema=esquema,
+                )
+            )
+            pendentes_linhas += len(linhas)
+            quantidade += len(linhas)
+            if pendentes_linhas >= PARQUET_ROW_GROUP_SIZE:
+                writer = _gravar_grupo(writer, temporario, esquema, pendentes)
+                pendentes, pendentes_linhas = [], 0
+        if pendentes:
+            writer = _gravar_grupo(writer, temporario, esquema, pendentes)
+    except BaseException:
+        # Remove o arquivo incompleto, que seria lido junto com os demais
+        # arquivos da partição
+        if writer is not None:
+            writer.close()
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    if writer is not None:
+        writer.close()
+        os.replace(temporario, caminho)
+    elif os.path.exists(caminho):
+        os.remove(caminho)
+    return quantidade
+
+
+def _gravar_grupo(
+    writer: Optional[pq.ParquetWriter],
+    caminho: str,
+    esquema: pa.Schema,
+    lotes: list[pa.RecordBatch],
+) -> pq.ParquetWriter:
+    """Grava os lotes pendentes em um único grupo de linhas do arquivo,
+    criando-o na primeira gravação."""
+    if writer is None:
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        writer = pq.ParquetWriter(caminho, esquema, compression=PARQUET_COMPRESSION)
+    tabela = pa.Table.from_batches(lotes)
+    writer.write_table(tabela, row_group_size=tabela.num_rows)
+    return writer
+
+
+def exportar_organizacao(cod_SIAPE_instituidora: int, destino: str) -> dict[str, int]:
+    """Exporta todas as tabelas de uma unidade instituidora.
+
+    As tabelas são lidas em uma mesma transação, com o mesmo snapshot,
+    para que os planos e os seus itens filhos exportados sejam
+    consistentes entre si.
+
+    Args:
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        destino (str): Diretório de destino da exportação.
+
+    Returns:
+        dict[str, int]: Quantidade de linhas exportadas de cada tabela.
+    """
+    with engine.connect().execution_options(
+        isolation_level="REPEATABLE READ", postgresql_readonly=True
+    ) as connection:
+        with connection.begin():
+            return {
+                tabela.name: exportar_tabela(
+                    connection, tabela, cod_SIAPE_instituidora, destino
+                )
+                for tabela in TABELAS
+            }
+
+
+def exportar(
+    destino: str,
+    organizacoes: Optional[Iterable[int]] = None,
+    processos: Optional[int] = None,
+) -> dict[int, dict[str, int]]:
+    """Exporta as tabelas das unidades instituidoras informadas, em
+    paralelo.
+
+    Args:
+        destino (str): Diretório de destino da exportação.
+        organizacoes (Optional[Iterable[int]]): Códigos SIAPE das
+            unidades instituidoras. Se não informado, exporta todas.
+        processos (Optional[int]): Quantidade de processos. Se não
+            informado, usa PARQUET_EXPORT_WORKERS.
+
+    Returns:
+        dict[int, dict[str, int]]: Para cada unidade instituidora, a
+            quantidade de linhas exportadas de cada tabela.
+    """
+    organizacoes = listar_organizacoes() if organizacoes is None else list(organizacoes)
+    processos = min(processos or PARQUET_EXPORT_WORKERS, len(organizacoes))
+    if processos <= 1:
+        return {cod: exportar_organizacao(cod, destino) for cod in organizacoes}
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        resultados = executor.map(
+            exportar_organizacao, organizacoes, [destino] * len(organizacoes)
+        )
+        return dict(zip(organizacoes, resultados))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("destino", help="Diretório de destino da exportação.")
+    parser.add_argument(
+        "--organizacao",
+        type=int,
+        action="append",
+        help="Código SIAPE da unidade instituidora a exportar. Pode ser "
+        "repetido. Se omitido, exporta todas.",
+    )
+    argumentos = parser.parse_args()
+    for cod, quantidades in exportar(
+        argumentos.destino, argumentos.organizacao
+    ).items():
+        logger.info("Unidade instituidora %d: %s", cod, quantidades)
@@ -0,0 +1,288 @@
+"""Funções para o processamento de envios em lote, nos quais o corpo
+da requisição é um fluxo de documentos JSON delimitados por quebras de
+linha (NDJSON).
+"""
+
+import os
+import json
+from typing import AsyncIterator, Awaitable, Callable, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import schemas
+import crud
+from db_config import DbContextManager
+
+# Quantidade máxima de itens gravados em uma mesma transação
+BULK_BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE", "1000"))
+
+# Função que registra o progresso de um envio: recebe a sessão da
+# transação que grava os itens, antes do commit, ou None para os itens
+# que não foram gravados, e os resultados dos itens processados
+Progresso = Callable[[Optional[AsyncSession], list[dict]], Awaitable[None]]
+
+
+async def ler_ndjson(stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """Lê um fluxo de bytes no formato NDJSON à medida que é recebido.
+
+    Args:
+        stream (AsyncIterator[bytes]): Fluxo do corpo da requisição.
+
+    Yields:
+        Tuple[int, bytes]: Número da linha e o seu conteúdo. Linhas em
+            branco são ignoradas.
+    """
+    numero_linha = 0
+    buffer = b""
+    async for chunk in stream:
+        *linhas, buffer = (buffer + chunk).split(b"\n")
+        for linha in linhas:
+            numero_linha += 1
+            if linha.strip():
+                yield numero_linha, linha
+    if buffer.strip():
+        yield numero_linha + 1, buffer
+
+
+async def processar_lote(
+    linhas: AsyncIterator[Tuple[int, bytes]],
+    cod_SIAPE_instituidora: int,
+    schema: Type[BaseModel],
+    chave: str,
+    gravar: Callable[
+        [list, Optional[crud.AntesCommit]], Awaitable[list[Tuple[int, Optional[str]]]]
+    ],
+    chave_unica: bool = True,
+    progresso: Optional[Progresso] = None,
+) -> dict:
+    """Valida e grava os itens de um envio em lote, agrupando-os em
+    transações de até BULK_BATCH_SIZE itens.
+
+    Os itens com a mesma chave de outro item ainda não gravado provocam
+    a gravação antecipada do grupo corrente, de modo que o resultado é o
+    mesmo de enviar os itens um a um, na ordem recebida.
+
+    Args:
+        linhas (AsyncIterator[Tuple[int, bytes]]): Linhas do envio, como
+            retornadas por ler_ndjson.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora
+            informado na URL.
+        schema (Type[BaseModel]): Esquema Pydantic de cada item.
+        chave (str): Nome do atributo que identifica o item.
+        gravar (Callable): Função que grava uma lista de itens validados,
+            chamando a função informada antes do commit, e retorna, para
+            cada um, o código de status e a mensagem de erro, se houver.
+        chave_unica (bool): Se itens com a mesma chave devem ser gravados
+            em transações distintas. Falso para itens que apenas são
+            acrescentados, como os status de participantes.
+        progresso (Optional[Progresso]): Função chamada na transação de
+            cada gravação, antes do commit, com os resultados dos itens
+            processados desde a chamada anterior, de modo que os itens e
+            o progresso são confirmados juntos. Os itens rejeitados após
+            a última gravação são informados ao final, sem sessão.
+
+    Returns:
+        dict: Resultado do envio no formato de schemas.ResultadoLoteSchema.
+    """
+    resultados = []
+    pendentes = []
+    chaves_pendentes = set()
+    reportados = 0
+
+    def resultados_pendentes(gravados: list[Tuple[int, Optional[str]]]):
+        return [
+            {
+                "linha": numero_linha,
+                "status_code": status_code,
+                chave: getattr(item, chave),
+                "detail": detail,
+            }
+            for (numero_linha, item), (status_code, detail) in zip(pendentes, gravados)
+        ]
+
+    async def antes_commit(session: AsyncSession, gravados: list):
+        await progresso(
+            session, resultados[reportados:] + resultados_pendentes(gravados)
+        )
+
+    async def gravar_pendentes():
+        nonlocal reportados
+        gravados = await gravar(
+            [item for _, item in pendentes],
+            antes_commit if progresso is not None else None,
+        )
+        resultados.extend(resultados_pendentes(gravados))
+        if progresso is not None:
+            reportados = len(resultados)
+        pendentes.clear()
+        chaves_pendentes.clear()
+
+    async for numero_linha, linha in linhas:
+        try:
+            item = schema.model_validate_json(linha)
+        except ValidationError as exception:
+            resultados.append(
+                {
+                    "linha": numero_linha,
+                    "status_code": 422,
+                    "detail": json.loads(exception.json()),
+                }
+            )
+            continue
+        if item.cod_SIAPE_instituidora != cod_SIAPE_instituidora:
+            resultados.append(
+                {
+                    "linha": numero_linha,
+                    "status_code": 422,
+                    chave: getattr(item, chave),
+                    "detail": "Parâmetro cod_SIAPE_instituidora na URL e no "
+                    "JSON devem ser iguais",
+                }
+            )
+            continue
+        if len(pendentes) >= BULK_BATCH_SIZE or (
+            chave_unica and getattr(item, chave) in chaves_pendentes
+        ):
+            await gravar_pendentes()
+        pendentes.append((numero_linha, item))
+        chaves_pendentes.add(getattr(item, chave))
+    if pendentes:
+        await gravar_pendentes()
+    if progresso is not None and len(resultados) > reportados:
+        await progresso(None, resultados[reportados:])
+
+    resultados.sort(key=lambda resultado: resultado["linha"])
+    quantidade_rejeitada = sum(
+        1 for resultado in resultados if resultado["status_code"] >= 400
+    )
+    return {
+        "quantidade_recebida": len(resultados),
+        "quantidade_gravada": len(resultados) - quantidade_rejeitada,
+        "quantidade_rejeitada": quantidade_rejeitada,
+        "resultados": resultados,
+    }
+
+
+async def processar_planos_trabalho(
+    db_session: DbContextManager,
+    cod_SIAPE_instituidora: int,
+    linhas: AsyncIterator[Tuple[int, bytes]],
+    progresso: Optional[Progresso] = None,
+) -> dict:
+    """Cria ou substitui os planos de trabalho de um envio em lote.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão
+            async do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        linhas (AsyncIterator[Tuple[int, bytes]]): Linhas do envio.
+        progresso (Optional[Progresso]): Registro do progresso, como em
+            processar_lote.
+
+    Returns:
+        dict: Resultado do envio no formato de schemas.ResultadoLoteSchema.
+    """
+
+    async def gravar(
+        planos_trabalho: list[schemas.PlanoTrabalhoSchema],
+        antes_commit: Optional[crud.AntesCommit],
+    ):
+        return await crud.create_or_update_planos_trabalho(
+            db_session=db_session,
+            cod_SIAPE_instituidora=cod_SIAPE_instituidora,
+            planos_trabalho=planos_trabalho,
+            antes_commit=antes_commit,
+        )
+
+    return await processar_lote(
+        linhas,
+        cod_SIAPE_instituidora,
+        schemas.PlanoTrabalhoSchema,
+        "id_plano_trabalho_participante",
+        gravar,
+        progresso=progresso,
+    )
+
+
+async def processar_planos_entregas(
+    db_session: DbContextManager,
+    cod_SIAPE_instituidora: int,
+    linhas: AsyncIterator[Tuple[int, bytes]],
+    progresso: Optional[Progresso] = None,
+) -> dict:
+    """Cria ou atualiza os planos de entregas de um envio em lote.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão
+            async do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        linhas (AsyncIterator[Tuple[int, bytes]]): Linhas do envio.
+        progresso (Optional[Progresso]): Registro do progresso, como em
+            processar_lote.
+
+    Returns:
+        dict: Resultado do envio no formato de schemas.ResultadoLoteSchema.
+    """
+
+    async def gravar(
+        planos_entregas: list[schemas.PlanoEntregasSchema],
+        antes_commit: Optional[crud.AntesCommit],
+    ):
+        return await crud.create_or_update_planos_entregas(
+            db_session=db_session,
+            cod_SIAPE_instituidora=cod_SIAPE_instituidora,
+            planos_entregas=planos_entregas,
+            antes_commit=antes_commit,
+        )
+
+    return await processar_lote(
+        linhas,
+        cod_SIAPE_instituidora,
+        schemas.PlanoEntregasSchema,
+        "id_plano_entrega_unidade",
+        gravar,
+        progresso=progresso,
+    )
+
+
+async def processar_status_participantes(
+    db_session: DbContextManager,
+    cod_SIAPE_instituidora: int,
+    linhas: AsyncIterator[Tuple[int, bytes]],
+    progresso: Optional[Progresso] = None,
+) -> dict:
+    """Registra os status de participantes de um envio em lote.
+
+    Args:
+        db_session (DbContextManager): Context manager para a sessão
+            async do SQL Alchemy.
+        cod_SIAPE_instituidora (int): Código SIAPE da unidade instituidora.
+        linhas (AsyncIterator[Tuple[int, bytes]]): Linhas do envio.
+        progresso (Optional[Progresso]): Registro do progresso, como em
+            processar_lote.
+
+    Returns:
+        dict: Resultado do envio no formato de schemas.ResultadoLoteSchema.
+    """
+
+    async def gravar(
+        lista_status_participante: list[schemas.StatusParticipanteSchema],
+        antes_commit: Optional[crud.AntesCommit],
+    ):
+        await crud.create_lista_status_participante(
+            db_session=db_session,
+            lista_status_participante=lista_status_participante,
+            antes_commit=antes_commit,
+        )
+        return [(201, None)] * len(lista_status_participante)
+
+    return await processar_lote(
+        linhas,
+        cod_SIAPE_instituidora,
+        schemas.StatusParticipanteSchema,
+        "cpf_participante",
+        gravar,
+        chave_unica=False,
+        progresso=progresso,
+    )
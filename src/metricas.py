@@ -0,0 +1,355 @@
+"""Métricas da API no formato do Prometheus, publicadas em /metrics, e
+medições de cada requisição, informadas no cabeçalho Server-Timing.
+
+Com vários processos (por exemplo, uvicorn --workers), a variável de
+ambiente PROMETHEUS_MULTIPROC_DIR deve apontar para um diretório vazio,
+compartilhado pelos processos, antes do início da API. Cada processo
+grava as suas métricas nesse diretório e /metrics apresenta a soma de
+todos eles.
+"""
+
+import contextlib
+import contextvars
+import functools
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Iterator, Optional, TypeVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    REGISTRY,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+# O que fazer quando uma requisição executa mais comandos SQL do que o
+# orçamento da sua rota: "log" registra um aviso, "erro" lança
+# OrcamentoConsultasExcedido (usado nos testes) e "desligado" ignora.
+QUERY_BUDGET_MODE = os.environ.get("QUERY_BUDGET_MODE", "log")
+
+FAIXAS_TAMANHO = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+DURACAO_REQUISICAO = Histogram(
+    "http_request_duration_seconds",
+    "Duração das requisições HTTP",
+    ["method", "route", "status"],
+)
+TAMANHO_REQUISICAO = Histogram(
+    "http_request_size_bytes",
+    "Tamanho do corpo das requisições HTTP",
+    ["method", "route"],
+    buckets=FAIXAS_TAMANHO,
+)
+TAMANHO_RESPOSTA = Histogram(
+    "http_response_size_bytes",
+    "Tamanho do corpo das respostas HTTP",
+    ["method", "route"],
+    buckets=FAIXAS_TAMANHO,
+)
+REQUISICOES_EM_ANDAMENTO = Gauge(
+    "http_requests_in_progress",
+    "Requisições HTTP em andamento",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+DURACAO_CRUD = Histogram(
+    "db_crud_duration_seconds",
+    "Duração total das funções do módulo crud",
+    ["funcao"],
+)
+CONSULTAS_BANCO = Counter(
+    "db_queries",
+    "Comandos SQL executados, por função do módulo crud",
+    ["funcao"],
+)
+DURACAO_CONSULTA = Histogram(
+    "db_query_duration_seconds",
+    "Duração dos comandos SQL, por função do módulo crud",
+    ["funcao"],
+)
+CONEXOES_EM_USO = Gauge(
+    "db_pool_checked_out_connections",
+    "Conexões do pool em uso",
+    ["banco"],
+    multiprocess_mode="livesum",
+)
+CONEXOES_OVERFLOW = Gauge(
+    "db_pool_overflow_connections",
+    "Conexões abertas além do tamanho do pool",
+    ["banco"],
+    multiprocess_mode="livesum",
+)
+ESPERA_POOL = Histogram(
+    "db_pool_wait_seconds",
+    "Tempo de espera por uma conexão do pool",
+    ["banco"],
+)
+DURACAO_FIEF = Histogram(
+    "fief_request_duration_seconds",
+    "Duração das chamadas ao Fief",
+    ["operacao"],
+)
+
+# Função do módulo crud em execução, usada para atribuir os comandos SQL
+funcao_crud_atual = contextvars.ContextVar("funcao_crud_atual", default="outra")
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class OrcamentoConsultasExcedido(Exception):
+    "Uma requisição executou mais comandos SQL do que o orçamento da rota."
+
+
+class MedicaoRequisicao:
+    """Medições de uma requisição: comandos SQL executados, linhas
+    afetadas ou retornadas, tempo no banco de dados e tempo em outros
+    segmentos, como autenticação, validação e serialização."""
+
+    def __init__(self):
+        self.comandos = 0
+        self.linhas = 0
+        self.tempo_banco = 0.0
+        self.segmentos: dict[str, float] = {}
+        self.orcamento_comandos: Optional[int] = None
+
+    def server_timing(self, duracao_total: float) -> str:
+        """Monta o cabeçalho Server-Timing, com as durações em milissegundos.
+
+        Args:
+            duracao_total (float): Duração da requisição, em segundos.
+
+        Returns:
+            str: Valor do cabeçalho.
+        """
+        metricas = [
+            f"db;dur={self.tempo_banco * 1000:.1f};"
+            f'desc="{self.comandos} comandos, {self.linhas} linhas"'
+        ]
+        metricas.extend(
+            f"{nome};dur={duracao * 1000:.1f}"
+            for nome, duracao in self.segmentos.items()
+        )
+        metricas.append(f"total;dur={duracao_total * 1000:.1f}")
+        return ", ".join(metricas)
+
+
+# Medição da requisição em andamento
+medicao_atual: contextvars.ContextVar[Optional[MedicaoRequisicao]] = (
+    contextvars.ContextVar("medicao_atual", default=None)
+)
+
+
+@contextlib.contextmanager
+def medir_segmento(nome: str) -> Iterator[None]:
+    """Soma a duração do bloco ao segmento informado da requisição em
+    andamento, que aparece no cabeçalho Server-Timing.
+
+    Args:
+        nome (str): Nome do segmento, como auth, validacao ou serializacao.
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicao = medicao_atual.get()
+        if medicao is not None:
+            medicao.segmentos[nome] = (
+                medicao.segmentos.get(nome, 0.0) + time.perf_counter() - inicio
+            )
+
+
+def orcamento_consultas(maximo: int) -> Callable[[], None]:
+    """Cria uma dependência de rota que define a quantidade máxima de
+    comandos SQL das suas requisições. O que acontece quando ela é
+    excedida é definido por QUERY_BUDGET_MODE.
+
+    Args:
+        maximo (int): Quantidade máxima de comandos SQL.
+
+    Returns:
+        Callable[[], None]: Dependência para o parâmetro dependencies da
+            rota.
+    """
+
+    def definir_orcamento():
+        medicao = medicao_atual.get()
+        if medicao is not None:
+            medicao.orcamento_comandos = maximo
+
+    return definir_orcamento
+
+
+def medir_crud(funcao: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """Decorador das funções do módulo crud, que mede a sua duração e
+    atribui a elas os comandos SQL executados durante a sua execução."""
+    nome = funcao.__name__
+    duracao = DURACAO_CRUD.labels(nome)
+
+    @functools.wraps(funcao)
+    async def medida(*args, **kwargs) -> T:
+        token = funcao_crud_atual.set(nome)
+        inicio = time.perf_counter()
+        try:
+            return await funcao(*args, **kwargs)
+        finally:
+            duracao.observe(time.perf_counter() - inicio)
+            funcao_crud_atual.reset(token)
+
+    return medida
+
+
+def instrumentar_engine(engine: Engine, banco: str):
+    """Registra as métricas dos comandos SQL e do pool de conexões de uma
+    engine.
+
+    Args:
+        engine (Engine): Engine síncrona; para uma AsyncEngine, use o seu
+            atributo sync_engine.
+        banco (str): Nome do banco nas métricas, como primario ou replica.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def antes_comando(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("inicio_comando", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def depois_comando(conn, cursor, statement, parameters, context, executemany):
+        duracao = time.perf_counter() - conn.info["inicio_comando"].pop()
+        funcao = funcao_crud_atual.get()
+        CONSULTAS_BANCO.labels(funcao).inc()
+        DURACAO_CONSULTA.labels(funcao).observe(duracao)
+        medicao = medicao_atual.get()
+        if medicao is not None:
+            medicao.comandos += 1
+            medicao.tempo_banco += duracao
+            medicao.linhas += max(cursor.rowcount, 0)
+
+    em_uso = CONEXOES_EM_USO.labels(banco)
+    overflow = CONEXOES_OVERFLOW.labels(banco)
+    pool: Pool = engine.pool
+
+    def atualizar_pool(*_):
+        em_uso.set(pool.checkedout())
+        overflow.set(max(pool.overflow(), 0))
+
+    event.listen(pool, "checkout", atualizar_pool)
+    event.listen(pool, "checkin", atualizar_pool)
+    if hasattr(pool, "metrica_espera"):
+        pool.metrica_espera = ESPERA_POOL.labels(banco)
+
+
+def gerar_metricas() -> tuple[bytes, str]:
+    """Gera o conteúdo da resposta de /metrics.
+
+    Returns:
+        tuple[bytes, str]: O conteúdo e o seu tipo (Content-Type).
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def encerrar_processo():
+    "Descarta as métricas de medidores (gauges) do processo encerrado."
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class MetricasMiddleware:
+    """Middleware ASGI que mede a duração, o tamanho e a quantidade em
+    andamento das requisições HTTP, informa as medições de cada
+    requisição no cabeçalho Server-Timing e verifica o orçamento de
+    comandos SQL da rota.
+
+    As métricas usam o modelo da rota, como
+    /organizacao/{cod_SIAPE_instituidora}/plano_trabalho/{id}, e não o
+    caminho requisitado. As requisições que não correspondem a nenhuma
+    rota são agrupadas sob o nome "desconhecida", para limitar a
+    quantidade de séries.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        tamanhos = {"requisicao": 0, "resposta": 0}
+        status_code = 500
+        medicao = MedicaoRequisicao()
+        token = medicao_atual.set(medicao)
+
+        async def receive_medido():
+            mensagem = await receive()
+            if mensagem["type"] == "http.request":
+                tamanhos["requisicao"] += len(mensagem.get("body", b""))
+            return mensagem
+
+        async def send_medido(mensagem):
+            nonlocal status_code
+            if mensagem["type"] == "http.response.start":
+                status_code = mensagem["status"]
+                mensagem["headers"] = [
+                    *mensagem.get("headers", []),
+                    (
+                        b"server-timing",
+                        medicao.server_timing(time.perf_counter() - inicio).encode(),
+                    ),
+                ]
+            elif mensagem["type"] == "http.response.body":
+                tamanhos["resposta"] += len(mensagem.get("body", b""))
+            await send(mensagem)
+
+        em_andamento = REQUISICOES_EM_ANDAMENTO.labels(method)
+        em_andamento.inc()
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive_medido, send_medido)
+        finally:
+            duracao = time.perf_counter() - inicio
+            em_andamento.dec()
+            medicao_atual.reset(token)
+            rota = getattr(scope.get("route"), "path", "desconhecida")
+            DURACAO_REQUISICAO.labels(method, rota, str(status_code)).observe(duracao)
+            TAMANHO_REQUISICAO.labels(method, rota).observe(tamanhos["requisicao"])
+            TAMANHO_RESPOSTA.labels(method, rota).observe(tamanhos["resposta"])
+        verificar_orcamento(medicao, f"{method} {rota}")
+
+
+def verificar_orcamento(medicao: MedicaoRequisicao, rota: str):
+    """Verifica se uma requisição respeitou o orçamento de comandos SQL da
+    sua rota, conforme QUERY_BUDGET_MODE.
+
+    Raises:
+        OrcamentoConsultasExcedido: Se o orçamento foi excedido e
+            QUERY_BUDGET_MODE for "erro".
+    """
+    if (
+        QUERY_BUDGET_MODE == "desligado"
+        or medicao.orcamento_comandos is None
+        or medicao.comandos <= medicao.orcamento_comandos
+    ):
+        return
+    mensagem = (
+        f"{rota} executou {medicao.comandos} comandos SQL, "
+        f"acima do orçamento de {medicao.orcamento_comandos}"
+    )
+    if QUERY_BUDGET_MODE == "erro":
+        raise OrcamentoConsultasExcedido(mensagem)
+    logger.warning(mensagem)
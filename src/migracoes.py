@@ -0,0 +1,567 @@
+"""Migrações versionadas do esquema do banco de dados.
+
+As migrações são aplicadas por este módulo, executado como um comando à
+parte, antes do início da API e do worker, que não executam comandos de
+definição de dados (DDL). A tabela migracao_esquema registra as versões
+já aplicadas, e um lock de sessão (advisory lock) impede que duas
+execuções simultâneas apliquem as mesmas migrações.
+
+A primeira migração cria as tabelas que ainda não existirem a partir dos
+modelos, na sua definição atual. Por isso, as migrações seguintes devem
+ser idempotentes: em um banco novo, o que elas criam já existe.
+
+Migrações não transacionais são executadas em modo autocommit, o que
+permite CREATE INDEX CONCURRENTLY e preenchimentos em lotes, cada lote em
+sua própria transação, sem bloquear as gravações da API.
+
+Uso:
+    python migracoes.py [--listar]
+"""
+
+import argparse
+import logging
+import os
+import time
+from typing import Callable, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import bindparam, create_engine, select, text, tuple_, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+import models
+import schemas
+from db_config import SQLALCHEMY_DATABASE_URL, Base
+from util import content_hash
+
+# Tempo máximo, em milissegundos, de espera por um lock de tabela em um
+# comando de migração, para que a espera não bloqueie as requisições que
+# chegarem depois. Zero não limita.
+MIGRATION_LOCK_TIMEOUT = int(os.environ.get("MIGRATION_LOCK_TIMEOUT", "5000"))
+# Quantidade de linhas alteradas por transação nos preenchimentos em lotes
+MIGRATION_BATCH_SIZE = int(os.environ.get("MIGRATION_BATCH_SIZE", "5000"))
+# Pausa, em segundos, entre os lotes de um preenchimento
+MIGRATION_BATCH_PAUSE = float(os.environ.get("MIGRATION_BATCH_PAUSE", "0.1"))
+
+# Chave do lock que serializa as execuções das migrações
+CHAVE_LOCK = "api_pgd_migracoes"
+
+logger = logging.getLogger(__name__)
+
+# Migrações registradas: versão, descrição, se é transacional e função
+MIGRACOES: list[tuple[int, str, bool, Callable[[Connection], None]]] = []
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    poolclass=NullPool,
+    connect_args={
+        "options": "-c statement_timeout=0 " f"-c lock_timeout={MIGRATION_LOCK_TIMEOUT}"
+    },
+)
+
+
+def migracao(versao: int, descricao: str, transacional: bool = True):
+    """Decorador que registra uma função como a migração de uma versão.
+
+    Args:
+        versao (int): Número da versão, maior que o de todas as migrações
+            já registradas.
+        descricao (str): Descrição da migração.
+        transacional (bool): Se a migração é executada em uma única
+            transação. Caso contrário, cada comando é confirmado
+            imediatamente e a migração deve poder ser executada de novo,
+            caso seja interrompida.
+    """
+
+    def registrar(funcao: Callable[[Connection], None]):
+        if MIGRACOES and versao <= MIGRACOES[-1][0]:
+            raise ValueError(f"Versão de migração fora de ordem: {versao}")
+        MIGRACOES.append((versao, descricao, transacional, funcao))
+        return funcao
+
+    return registrar
+
+
+def criar_indice_concorrente(
+    connection: Connection,
+    nome: str,
+    tabela: str,
+    colunas: str,
+    where: Optional[str] = None,
+):
+    """Cria um índice com CREATE INDEX CONCURRENTLY, sem bloquear as
+    gravações na tabela, se ele ainda não existir.
+
+    Um índice inválido, deixado por uma criação concorrente
+    interrompida, é removido e criado novamente.
+
+    Args:
+        connection (Connection): Conexão em modo autocommit.
+        nome (str): Nome do índice.
+        tabela (str): Nome da tabela.
+        colunas (str): Colunas ou expressões indexadas, em SQL.
+        where (Optional[str]): Condição de um índice parcial, em SQL.
+    """
+    valido = connection.execute(
+        text(
+            "SELECT indisvalid FROM pg_index " "WHERE indexrelid = to_regclass(:nome)"
+        ),
+        {"nome": nome},
+    ).scalar()
+    if valido:
+        return
+    if valido is not None:
+        connection.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS "{nome}"')
+    connection.exec_driver_sql(
+        f'CREATE INDEX CONCURRENTLY "{nome}" ON {tabela} ({colunas})'
+        + (f" WHERE {where}" if where else "")
+    )
+
+
+def preencher_em_lotes(
+    connection: Connection,
+    tabela: str,
+    atribuicoes: str,
+    condicao: str,
+    tamanho_lote: Optional[int] = None,
+) -> int:
+    """Atualiza as linhas de uma tabela em lotes, cada lote em sua própria
+    transação, para não manter locks sobre muitas linhas por muito tempo.
+
+    A condição deve deixar de ser verdadeira para as linhas atualizadas,
+    de modo que cada lote atualize linhas ainda não atualizadas.
+
+    Args:
+        connection (Connection): Conexão em modo autocommit.
+        tabela (str): Nome da tabela.
+        atribuicoes (str): Cláusula SET do UPDATE, em SQL.
+        condicao (str): Condição das linhas a atualizar, em SQL.
+        tamanho_lote (Optional[int]): Quantidade de linhas por lote. Se
+            não informado, usa MIGRATION_BATCH_SIZE.
+
+    Returns:
+        int: Quantidade de linhas atualizadas.
+    """
+    total = 0
+    while True:
+        result = connection.execute(
+            text(
+                f"UPDATE {tabela} SET {atribuicoes} WHERE ctid IN "
+                f"(SELECT ctid FROM {tabela} WHERE {condicao} LIMIT :tamanho_lote)"
+            ),
+            {"tamanho_lote": tamanho_lote or MIGRATION_BATCH_SIZE},
+        )
+        total += result.rowcount
+        if result.rowcount == 0:
+            # linhas alteradas por outra transação entre a seleção e a
+            # atualização são atualizadas no próximo lote
+            restantes = connection.execute(
+                text(f"SELECT EXISTS (SELECT FROM {tabela} WHERE {condicao})")
+            ).scalar()
+            if not restantes:
+                return total
+        logger.info("%s: %d linhas atualizadas", tabela, total)
+        time.sleep(MIGRATION_BATCH_PAUSE)
+
+
+def preencher_hash_conteudo(
+    connection: Connection,
+    model: type,
+    schema: type,
+    tamanho_lote: Optional[int] = None,
+) -> int:
+    """Preenche, em lotes, o hash_conteudo dos planos que não o têm, a
+    partir do esquema Pydantic do plano, como na sua serialização nas
+    consultas. Cada lote é gravado em sua própria transação.
+
+    O hash é calculado sobre o conteúdo gravado, de modo que um reenvio
+    idêntico, mas que omita campos com valor padrão, é gravado de novo.
+    Planos que não passam pela validação atual do esquema são mantidos
+    sem hash até a próxima gravação.
+
+    Args:
+        connection (Connection): Conexão em modo autocommit.
+        model (type): Modelo SQLAlchemy do plano.
+        schema (type): Esquema Pydantic do plano.
+        tamanho_lote (Optional[int]): Quantidade de planos por lote. Se
+            não informado, usa MIGRATION_BATCH_SIZE.
+
+    Returns:
+        int: Quantidade de planos atualizados.
+    """
+    chave = model.__table__.primary_key.columns
+    atualizar = (
+        update(model.__table__)
+        .where(*(coluna == bindparam(f"chave_{coluna.name}") for coluna in chave))
+        .values(hash_conteudo=bindparam("novo_hash"))
+    )
+    total = 0
+    ultima = None
+    with Session(connection) as session:
+        while True:
+            consulta = select(model).where(model.hash_conteudo.is_(None))
+            if ultima is not None:
+                consulta = consulta.where(tuple_(*chave) > tuple_(*ultima))
+            planos = (
+                session.scalars(
+                    consulta.order_by(*chave).limit(
+                        tamanho_lote or MIGRATION_BATCH_SIZE
+                    )
+                )
+                .unique()
+                .all()
+            )
+            if not planos:
+                return total
+            hashes = []
+            for plano in planos:
+                try:
+                    hash_conteudo = content_hash(schema.model_validate(plano))
+                except ValidationError:
+                    logger.warning(
+                        "%s: plano %s mantido sem hash_conteudo",
+                        model.__tablename__,
+                        plano.__mapper__.primary_key_from_instance(plano),
+                    )
+                    continue
+                hashes.append(
+                    {
+                        **{
+                            f"chave_{coluna.name}": getattr(plano, coluna.key)
+                            for coluna in chave
+                        },
+                        "novo_hash": hash_conteudo,
+                    }
+                )
+            ultima = [getattr(planos[-1], coluna.key) for coluna in chave]
+            session.expunge_all()
+            if hashes:
+                session.execute(atualizar, hashes)
+                session.commit()
+            total += len(hashes)
+            logger.info("%s: %d planos atualizados", model.__tablename__, total)
+            time.sleep(MIGRATION_BATCH_PAUSE)
+
+
+@migracao(1, "Esquema inicial")
+def esquema_inicial(connection: Connection):
+    "Cria as tabelas que ainda não existirem, a partir dos modelos."
+    Base.metadata.create_all(connection)
+
+
+def planos_sobrepostos(
+    connection: Connection,
+    tabela: str,
+    coluna_id: str,
+    chaves: list[str],
+    periodo: str,
+    limite: int = 100,
+) -> list[tuple]:
+    """Traz os pares de planos não cancelados de uma tabela que têm as
+    mesmas chaves e períodos sobrepostos, que impedem a criação da
+    restrição de exclusão.
+
+    Args:
+        connection (Connection): Conexão com o banco de dados.
+        tabela (str): Nome da tabela de planos.
+        coluna_id (str): Coluna do id do plano.
+        chaves (list[str]): Colunas que identificam o responsável pelo
+            plano, entre aspas quando necessário.
+        periodo (str): Coluna com o período do plano.
+        limite (int): Quantidade máxima de pares trazidos.
+
+    Returns:
+        list[tuple]: Unidade instituidora e ids de cada par de planos.
+    """
+    return connection.execute(
+        text(
+            f'SELECT a."cod_SIAPE_instituidora", a.{coluna_id}, b.{coluna_id} '
+            f"FROM {tabela} a JOIN {tabela} b "
+            f"ON {' AND '.join(f'a.{chave} = b.{chave}' for chave in chaves)} "
+            f"AND a.{coluna_id} < b.{coluna_id} "
+            f"AND a.{periodo} && b.{periodo} "
+            "WHERE a.cancelado IS NOT TRUE AND b.cancelado IS NOT TRUE "
+            f'ORDER BY a."cod_SIAPE_instituidora", a.{coluna_id}, b.{coluna_id} '
+            "LIMIT :limite"
+        ),
+        {"limite": limite},
+    ).all()
+
+
+@migracao(2, "Restrições de exclusão de sobreposição de períodos dos planos")
+def restricoes_periodo_planos(connection: Connection):
+    """Acrescenta os períodos e as restrições de exclusão dos planos às
+    tabelas criadas antes deles.
+
+    Acrescentar uma coluna gerada reescreve a tabela sob lock exclusivo.
+    Se já houver planos sobrepostos, gravados antes das restrições, a
+    migração é interrompida com a lista dos pares de planos em conflito,
+    que devem ser corrigidos manualmente, cancelando ou ajustando o
+    período de um dos planos de cada par, antes de aplicá-la de novo.
+    """
+    connection.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    for tabela, coluna_id, coluna, inicio, termino, chaves, restricao in (
+        (
+            "plano_trabalho",
+            "id_plano_trabalho_participante",
+            "periodo_plano",
+            "data_inicio_plano",
+            "data_termino_plano",
+            [
+                '"cod_SIAPE_instituidora"',
+                '"cod_SIAPE_unidade_exercicio"',
+                "cpf_participante",
+            ],
+            "_plano_trabalho_periodo_excl",
+        ),
+        (
+            "plano_entregas",
+            "id_plano_entrega_unidade",
+            "periodo_plano_entregas",
+            "data_inicio_plano_entregas",
+            "data_termino_plano_entregas",
+            ['"cod_SIAPE_instituidora"', '"cod_SIAPE_unidade_plano"'],
+            "_plano_entregas_periodo_excl",
+        ),
+    ):
+        connection.exec_driver_sql(
+            f"ALTER TABLE {tabela} ADD COLUMN IF NOT EXISTS {coluna} daterange "
+            f"GENERATED ALWAYS AS (daterange({inicio}, {termino}, '[]')) STORED"
+        )
+        existe = connection.execute(
+            text("SELECT EXISTS (SELECT FROM pg_constraint WHERE conname = :nome)"),
+            {"nome": restricao},
+        ).scalar()
+        if existe:
+            continue
+        conflitos = planos_sobrepostos(connection, tabela, coluna_id, chaves, coluna)
+        if conflitos:
+            raise RuntimeError(
+                f"Há planos com períodos sobrepostos em {tabela}, que impedem "
+                f"a criação da restrição {restricao}. Cancele ou ajuste o "
+                "período de um dos planos de cada par e aplique as migrações "
+                "novamente. Pares (cod_SIAPE_instituidora, "
+                f"{coluna_id}, {coluna_id}): "
+                + ", ".join(str(tuple(conflito)) for conflito in conflitos)
+            )
+        connection.exec_driver_sql(
+            f"ALTER TABLE {tabela} ADD CONSTRAINT {restricao} "
+            "EXCLUDE USING gist ("
+            + ", ".join(f"{chave} WITH =" for chave in chaves)
+            + f", {coluna} WITH &&) WHERE (cancelado IS NOT TRUE)"
+        )
+
+
+@migracao(3, "Índice de status de participante por CPF", transacional=False)
+def indice_status_participante_cpf(connection: Connection):
+    "Cria o índice usado nas consultas de status de um participante."
+    criar_indice_concorrente(
+        connection,
+        "ix_status_participante_cpf",
+        "status_participante",
+        '"cod_SIAPE_instituidora", cpf_participante',
+    )
+
+
+# A versão 4 foi retirada e não deve ser reutilizada, pois pode constar
+# como aplicada em bancos existentes.
+
+
+@migracao(5, "Índices de paginação das listagens de planos", transacional=False)
+def indices_paginacao_planos(connection: Connection):
+    "Cria os índices usados na paginação das listagens de planos."
+    for tabela, coluna_id in (
+        ("plano_trabalho", "id_plano_trabalho_participante"),
+        ("plano_entregas", "id_plano_entrega_unidade"),
+    ):
+        criar_indice_concorrente(
+            connection,
+            f"ix_{tabela}_modificacao",
+            tabela,
+            '"cod_SIAPE_instituidora", '
+            f"coalesce(data_atualizacao, data_insercao), {coluna_id}",
+        )
+
+
+@migracao(6, "Tabela do feed de alterações")
+def tabela_alteracao(connection: Connection):
+    "Cria a tabela alteracao e o índice do feed de alterações."
+    models.Alteracao.__table__.create(connection, checkfirst=True)
+
+
+@migracao(7, "Tabelas de agregados de horas e de progresso das entregas")
+def tabelas_agregados(connection: Connection):
+    """Cria as tabelas agregado_entrega e agregado_plano_entregas e as
+    preenche a partir dos planos existentes."""
+    models.AgregadoEntrega.__table__.create(connection, checkfirst=True)
+    models.AgregadoPlanoEntregas.__table__.create(connection, checkfirst=True)
+    connection.exec_driver_sql(
+        "INSERT INTO agregado_entrega "
+        '("cod_SIAPE_instituidora", id_plano_entrega_unidade, id_entrega, '
+        '"cod_SIAPE_unidade_plano", data_entrega, horas_vinculadas, '
+        "quantidade_contribuicoes) "
+        'SELECT e."cod_SIAPE_instituidora", e.id_plano_entrega_unidade, '
+        'e.id_entrega, p."cod_SIAPE_unidade_plano", e.data_entrega, '
+        "coalesce(sum(c.horas_vinculadas), 0), count(c.id) "
+        "FROM entrega e "
+        "JOIN plano_entregas p "
+        'ON p."cod_SIAPE_instituidora" = e."cod_SIAPE_instituidora" '
+        "AND p.id_plano_entrega_unidade = e.id_plano_entrega_unidade "
+        "LEFT JOIN (contribuicao c JOIN plano_trabalho t "
+        'ON t."cod_SIAPE_instituidora" = c."cod_SIAPE_instituidora" '
+        "AND t.id_plano_trabalho_participante = c.id_plano_trabalho_participante "
+        "AND t.cancelado IS NOT TRUE) "
+        'ON c."cod_SIAPE_instituidora" = e."cod_SIAPE_instituidora" '
+        "AND c.id_plano_entrega_unidade = e.id_plano_entrega_unidade "
+        "AND c.id_entrega = e.id_entrega "
+        'GROUP BY e."cod_SIAPE_instituidora", e.id_plano_entrega_unidade, '
+        'e.id_entrega, p."cod_SIAPE_unidade_plano" '
+        "ON CONFLICT DO NOTHING"
+    )
+    connection.exec_driver_sql(
+        "INSERT INTO agregado_plano_entregas "
+        '("cod_SIAPE_instituidora", id_plano_entrega_unidade, '
+        '"cod_SIAPE_unidade_plano", cancelado, quantidade_entregas, '
+        "quantidade_entregas_com_progresso, soma_percentual_progresso_realizado) "
+        'SELECT p."cod_SIAPE_instituidora", p.id_plano_entrega_unidade, '
+        'p."cod_SIAPE_unidade_plano", p.cancelado, count(e.id_entrega), '
+        "count(e.percentual_progresso_realizado), "
+        "coalesce(sum(e.percentual_progresso_realizado), 0) "
+        "FROM plano_entregas p "
+        "LEFT JOIN entrega e "
+        'ON e."cod_SIAPE_instituidora" = p."cod_SIAPE_instituidora" '
+        "AND e.id_plano_entrega_unidade = p.id_plano_entrega_unidade "
+        'GROUP BY p."cod_SIAPE_instituidora", p.id_plano_entrega_unidade '
+        "ON CONFLICT DO NOTHING"
+    )
+
+
+@migracao(8, "Token de reserva das tarefas")
+def token_reserva_tarefa(connection: Connection):
+    """Acrescenta a coluna token_reserva à tabela tarefa criada antes
+    dela."""
+    connection.exec_driver_sql(
+        "ALTER TABLE tarefa ADD COLUMN IF NOT EXISTS token_reserva varchar"
+    )
+
+
+@migracao(9, "Hash do conteúdo dos planos")
+def hash_conteudo_planos(connection: Connection):
+    """Acrescenta a coluna hash_conteudo às tabelas de planos criadas antes
+    dela. Ela é preenchida para os planos existentes pela migração 10."""
+    for tabela in ("plano_trabalho", "plano_entregas"):
+        connection.exec_driver_sql(
+            f"ALTER TABLE {tabela} ADD COLUMN IF NOT EXISTS hash_conteudo varchar"
+        )
+
+
+@migracao(10, "Preenchimento do hash do conteúdo dos planos", transacional=False)
+def preencher_hash_conteudo_planos(connection: Connection):
+    """Calcula o hash_conteudo dos planos gravados antes dele, para que
+    tenham ETag e aceitem gravações condicionais (If-Match)."""
+    for model, schema in (
+        (models.PlanoTrabalho, schemas.PlanoTrabalhoSchema),
+        (models.PlanoEntregas, schemas.PlanoEntregasSchema),
+    ):
+        preencher_hash_conteudo(connection, model, schema)
+
+
+def versoes_aplicadas(connection: Connection) -> set[int]:
+    """Traz as versões das migrações já aplicadas ao banco.
+
+    Args:
+        connection (Connection): Conexão com o banco de dados.
+
+    Returns:
+        set[int]: Versões aplicadas.
+    """
+    if connection.execute(text("SELECT to_regclass('migracao_esquema')")).scalar():
+        return set(
+            connection.execute(text("SELECT versao FROM migracao_esquema")).scalars()
+        )
+    return set()
+
+
+def migracoes_pendentes() -> list[tuple[int, str]]:
+    """Traz as migrações ainda não aplicadas ao banco.
+
+    Returns:
+        list[tuple[int, str]]: Versão e descrição de cada migração
+            pendente, em ordem.
+    """
+    with engine.connect() as connection:
+        aplicadas = versoes_aplicadas(connection)
+    return [
+        (versao, descricao)
+        for versao, descricao, _, _ in MIGRACOES
+        if versao not in aplicadas
+    ]
+
+
+def aplicar_migracoes() -> list[int]:
+    """Aplica as migrações pendentes, em ordem de versão.
+
+    Cada migração é registrada em migracao_esquema ao final da sua
+    execução; uma migração transacional é registrada na mesma transação.
+    Se uma migração falhar, as seguintes não são aplicadas.
+
+    Returns:
+        list[int]: Versões aplicadas nesta execução.
+    """
+    aplicadas_agora = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock:
+        # aguarda, sem limite de tempo, o fim de outra execução
+        lock.exec_driver_sql("SET lock_timeout = 0")
+        lock.execute(
+            text("SELECT pg_advisory_lock(hashtext(:chave))"), {"chave": CHAVE_LOCK}
+        )
+        lock.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS migracao_esquema ("
+            "versao integer PRIMARY KEY, "
+            "descricao varchar NOT NULL, "
+            "data_aplicacao timestamp NOT NULL DEFAULT now())"
+        )
+        aplicadas = versoes_aplicadas(lock)
+        registro = text(
+            "INSERT INTO migracao_esquema (versao, descricao) "
+            "VALUES (:versao, :descricao)"
+        )
+        for versao, descricao, transacional, funcao in MIGRACOES:
+            if versao in aplicadas:
+                continue
+            logger.info("Aplicando a migração %d: %s", versao, descricao)
+            if transacional:
+                with engine.begin() as connection:
+                    funcao(connection)
+                    connection.execute(
+                        registro, {"versao": versao, "descricao": descricao}
+                    )
+            else:
+                with engine.connect().execution_options(
+                    isolation_level="AUTOCOMMIT"
+                ) as connection:
+                    funcao(connection)
+                    connection.execute(
+                        registro, {"versao": versao, "descricao": descricao}
+                    )
+            aplicadas_agora.append(versao)
+        lock.execute(
+            text("SELECT pg_advisory_unlock(hashtext(:chave))"), {"chave": CHAVE_LOCK}
+        )
+    return aplicadas_agora
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--listar",
+        action="store_true",
+        help="Lista as migrações pendentes, sem aplicá-las.",
+    )
+    if parser.parse_args().listar:
+        for versao_pendente, descricao_pendente in migracoes_pendentes():
+            print(f"{versao_pendente:>4} {descricao_pendente}")
+    else:
+        aplicar_migracoes()
@@ -15,12 +15,27 @@ from sqlalchemy import (
     Enum,
     UniqueConstraint,
     ForeignKeyConstraint,
+    LargeBinary,
+    Index,
+    Computed,
 )
-from sqlalchemy import event, DDL
+from sqlalchemy import event, func, text, DDL
+from sqlalchemy.dialects.postgresql import DATERANGE, JSONB, ExcludeConstraint
 from sqlalchemy.orm import relationship
 
 from db_config import Base
 
+# As restrições de exclusão combinam igualdade de inteiros e textos com
+# sobreposição de intervalos em um mesmo índice GiST, o que requer a
+# extensão btree_gist
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(
+        dialect="postgresql"
+    ),
+)
+
 
 class PlanoEntregas(Base):
     "Plano de Entregas da unidade"
@@ -59,6 +74,14 @@ class PlanoEntregas(Base):
         comment="Data de término da vigência do plano de entregas da"
         "Unidade de Execução",
     )
+    periodo_plano_entregas = Column(
+        DATERANGE,
+        Computed(
+            "daterange(data_inicio_plano_entregas, data_termino_plano_entregas, '[]')"
+        ),
+        comment="Período de vigência do plano de entregas, incluindo as datas "
+        "de início e de término",
+    )
     avaliacao_plano_entregas = Column(
         Integer,
         comment="Avaliação do plano de entregas pelo nível hierárquico "
@@ -86,6 +109,11 @@ class PlanoEntregas(Base):
         "Integrado de Administração de Recursos Humanos (Siape) "
         "corresponde à Unidade de Execução",
     )
+    hash_conteudo = Column(
+        String,
+        comment="Hash SHA-256 do conteúdo recebido na última gravação, usado "
+        "para identificar reenvios sem alteração",
+    )
     data_atualizacao = Column(DateTime)
     data_insercao = Column(DateTime, nullable=False)
     entregas = relationship(
@@ -101,6 +129,21 @@ class PlanoEntregas(Base):
             "id_plano_entrega_unidade",
             name="_instituidora_plano_entregas_uc",
         ),
+        ExcludeConstraint(
+            (cod_SIAPE_instituidora, "="),
+            (cod_SIAPE_unidade_plano, "="),
+            (periodo_plano_entregas, "&&"),
+            name="_plano_entregas_periodo_excl",
+            using="gist",
+            where=cancelado.isnot(True),
+        ),
+        # paginação das listagens pela data da última modificação
+        Index(
+            "ix_plano_entregas_modificacao",
+            cod_SIAPE_instituidora,
+            func.coalesce(data_atualizacao, data_insercao),
+            id_plano_entrega_unidade,
+        ),
     )
 
 
@@ -264,6 +307,12 @@ class PlanoTrabalho(Base):
         nullable=False,
         comment="Data de término da vigência do plano de trabalho do " "participante",
     )
+    periodo_plano = Column(
+        DATERANGE,
+        Computed("daterange(data_inicio_plano, data_termino_plano, '[]')"),
+        comment="Período de vigência do plano de trabalho, incluindo as datas "
+        "de início e de término",
+    )
     carga_horaria_total_periodo_plano = Column(
         Integer,
         nullable=False,
@@ -271,6 +320,11 @@ class PlanoTrabalho(Base):
         "período de vigência do plano de trabalho. Não inclui "
         "períodos de férias,  ocorrências e afastamentos",
     )
+    hash_conteudo = Column(
+        String,
+        comment="Hash SHA-256 do conteúdo recebido na última gravação, usado "
+        "para identificar reenvios sem alteração",
+    )
     data_atualizacao = Column(DateTime)
     data_insercao = Column(DateTime, nullable=False)
     contribuicoes = relationship(
@@ -293,6 +347,22 @@ class PlanoTrabalho(Base):
             "id_plano_trabalho_participante",
             name="_instituidora_plano_trabalho_uc",
         ),
+        ExcludeConstraint(
+            (cod_SIAPE_instituidora, "="),
+            (cod_SIAPE_unidade_exercicio, "="),
+            (cpf_participante, "="),
+            (periodo_plano, "&&"),
+            name="_plano_trabalho_periodo_excl",
+            using="gist",
+            where=cancelado.isnot(True),
+        ),
+        # paginação das listagens pela data da última modificação
+        Index(
+            "ix_plano_trabalho_modificacao",
+            cod_SIAPE_instituidora,
+            func.coalesce(data_atualizacao, data_insercao),
+            id_plano_trabalho_participante,
+        ),
         ForeignKeyConstraint(
             [id_plano_entrega_unidade, cod_SIAPE_instituidora],
             [
@@ -515,6 +585,256 @@ class StatusParticipante(Base):
     )
     data_atualizacao = Column(DateTime)
     data_insercao = Column(DateTime, nullable=False)
+    __table_args__ = (
+        Index(
+            "ix_status_participante_cpf",
+            cod_SIAPE_instituidora,
+            cpf_participante,
+        ),
+    )
+
+
+class TipoTarefa(str, enum.Enum):
+    planos_entregas = "planos_entregas"
+    planos_trabalho = "planos_trabalho"
+    participantes = "participantes"
+
+
+class SituacaoTarefa(str, enum.Enum):
+    pendente = "pendente"
+    em_processamento = "em_processamento"
+    concluida = "concluida"
+    falha = "falha"
+
+
+class Tarefa(Base):
+    "Tarefa de processamento assíncrono de um envio em lote"
+    __tablename__ = "tarefa"
+    id = Column(
+        Integer,
+        primary_key=True,
+        index=True,
+        autoincrement=True,
+        nullable=False,
+        comment="Identificador único da tarefa",
+    )
+    cod_SIAPE_instituidora = Column(
+        Integer,
+        nullable=False,
+        comment="Código da unidade organizacional (UORG) no "
+        "Sistema Integrado de Administração de Recursos Humanos "
+        "(Siape) corresponde à Unidade de Instituição",
+    )
+    tipo = Column(
+        String,
+        nullable=False,
+        comment="Tipo dos itens enviados: planos_entregas, planos_trabalho "
+        "ou participantes",
+    )
+    situacao = Column(
+        String,
+        nullable=False,
+        default=SituacaoTarefa.pendente.value,
+        comment="Situação da tarefa: pendente, em_processamento, concluida "
+        "ou falha",
+    )
+    conteudo = Column(
+        LargeBinary,
+        nullable=False,
+        comment="Corpo do envio em lote, no formato NDJSON",
+    )
+    quantidade_total = Column(
+        Integer,
+        nullable=False,
+        comment="Quantidade de linhas não vazias do envio",
+    )
+    quantidade_processada = Column(
+        Integer,
+        nullable=False,
+        default=0,
+        comment="Quantidade de itens já processados",
+    )
+    quantidade_rejeitada = Column(
+        Integer,
+        nullable=False,
+        default=0,
+        comment="Quantidade de itens rejeitados",
+    )
+    ultima_linha_processada = Column(
+        Integer,
+        nullable=False,
+        default=0,
+        comment="Número da última linha do envio já gravada, a partir da "
+        "qual o processamento é retomado caso seja interrompido",
+    )
+    erros = Column(
+        JSONB,
+        nullable=False,
+        default=list,
+        comment="Resultado de cada item rejeitado",
+    )
+    mensagem_falha = Column(
+        String,
+        comment="Mensagem de erro que interrompeu o processamento da tarefa",
+    )
+    token_reserva = Column(
+        String,
+        comment="Identificador da reserva da tarefa pelo processo que a "
+        "processa, exigido nas atualizações do progresso",
+    )
+    data_inicio_processamento = Column(DateTime)
+    data_conclusao = Column(DateTime)
+    data_atualizacao = Column(DateTime)
+    data_insercao = Column(DateTime, nullable=False)
+    __table_args__ = (
+        Index(
+            "ix_tarefa_pendente",
+            id,
+            postgresql_where=situacao.in_(
+                [
+                    SituacaoTarefa.pendente.value,
+                    SituacaoTarefa.em_processamento.value,
+                ]
+            ),
+        ),
+    )
+
+
+class TipoAlteracao(str, enum.Enum):
+    plano_trabalho = "plano_trabalho"
+    plano_entregas = "plano_entregas"
+    participante = "participante"
+
+
+class Alteracao(Base):
+    """Alteração de um recurso, registrada na mesma transação que a
+    gravou (outbox), para o feed de alterações de cada unidade
+    instituidora"""
+
+    __tablename__ = "alteracao"
+    id = Column(
+        BigInteger,
+        primary_key=True,
+        autoincrement=True,
+        nullable=False,
+        comment="Identificador único da alteração",
+    )
+    transacao = Column(
+        BigInteger,
+        nullable=False,
+        server_default=text("(pg_current_xact_id()::text)::bigint"),
+        comment="Identificador da transação que gravou a alteração",
+    )
+    cod_SIAPE_instituidora = Column(
+        Integer,
+        nullable=False,
+        comment="Código da unidade organizacional (UORG) no "
+        "Sistema Integrado de Administração de Recursos Humanos "
+        "(Siape) corresponde à Unidade de Instituição",
+    )
+    tipo = Column(
+        String,
+        nullable=False,
+        comment="Tipo do recurso alterado: plano_trabalho, plano_entregas "
+        "ou participante",
+    )
+    chave = Column(
+        String,
+        nullable=False,
+        comment="Identificador do recurso alterado na unidade instituidora: "
+        "o id do plano ou o CPF do participante",
+    )
+    versao = Column(
+        String,
+        nullable=False,
+        comment="Versão (ETag) do recurso após a alteração",
+    )
+    data_alteracao = Column(DateTime, nullable=False)
+    __table_args__ = (
+        Index("ix_alteracao_feed", cod_SIAPE_instituidora, transacao, id),
+    )
+
+
+class AgregadoEntrega(Base):
+    """Horas vinculadas a uma entrega pelas contribuições dos planos de
+    trabalho não cancelados, atualizadas a cada gravação de plano"""
+
+    __tablename__ = "agregado_entrega"
+    cod_SIAPE_instituidora = Column(Integer, primary_key=True, nullable=False)
+    id_plano_entrega_unidade = Column(Integer, primary_key=True, nullable=False)
+    id_entrega = Column(Integer, primary_key=True, nullable=False)
+    cod_SIAPE_unidade_plano = Column(
+        Integer,
+        nullable=False,
+        comment="Unidade de Execução do plano de entregas da entrega",
+    )
+    data_entrega = Column(Date, nullable=False)
+    horas_vinculadas = Column(
+        BigInteger,
+        nullable=False,
+        default=0,
+        comment="Soma das horas vinculadas à entrega pelas contribuições "
+        "dos planos de trabalho não cancelados",
+    )
+    quantidade_contribuicoes = Column(
+        Integer,
+        nullable=False,
+        default=0,
+        comment="Quantidade de contribuições dos planos de trabalho não "
+        "cancelados vinculadas à entrega",
+    )
+    __table_args__ = (
+        ForeignKeyConstraint(
+            [cod_SIAPE_instituidora, id_plano_entrega_unidade, id_entrega],
+            [
+                "entrega.cod_SIAPE_instituidora",
+                "entrega.id_plano_entrega_unidade",
+                "entrega.id_entrega",
+            ],
+            ondelete="CASCADE",
+        ),
+        # somas por unidade de execução e período
+        Index(
+            "ix_agregado_entrega_unidade",
+            cod_SIAPE_instituidora,
+            cod_SIAPE_unidade_plano,
+            data_entrega,
+        ),
+    )
+
+
+class AgregadoPlanoEntregas(Base):
+    """Totais das entregas de um plano de entregas, atualizados a cada
+    gravação do plano"""
+
+    __tablename__ = "agregado_plano_entregas"
+    cod_SIAPE_instituidora = Column(Integer, primary_key=True, nullable=False)
+    id_plano_entrega_unidade = Column(Integer, primary_key=True, nullable=False)
+    cod_SIAPE_unidade_plano = Column(Integer, nullable=False)
+    cancelado = Column(Boolean)
+    quantidade_entregas = Column(Integer, nullable=False)
+    quantidade_entregas_com_progresso = Column(
+        Integer,
+        nullable=False,
+        comment="Quantidade de entregas com percentual_progresso_realizado "
+        "informado",
+    )
+    soma_percentual_progresso_realizado = Column(
+        BigInteger,
+        nullable=False,
+        comment="Soma do percentual_progresso_realizado das entregas, que "
+        "dividida por quantidade_entregas_com_progresso resulta na média",
+    )
+    __table_args__ = (
+        ForeignKeyConstraint(
+            [cod_SIAPE_instituidora, id_plano_entrega_unidade],
+            [
+                "plano_entregas.cod_SIAPE_instituidora",
+                "plano_entregas.id_plano_entrega_unidade",
+            ],
+            ondelete="CASCADE",
+        ),
+    )
 
 
 # trigger = DDL("""
@@ -5,14 +5,15 @@ A principal ferramenta de validação de dados usada no FastAPI é o
 Pydantic: https://docs.pydantic.dev/2.0/
 """
 
-from typing import List, Optional
-from datetime import date
+from typing import Any, Generic, List, Optional, TypeVar
+from datetime import date, datetime
 
 from pydantic import BaseModel, ConfigDict, Field
 from pydantic import model_validator, field_validator
 
 from models import PlanoEntregas, PlanoTrabalho, Entrega
-from models import Consolidacao, Contribuicao, StatusParticipante
+from models import Consolidacao, Contribuicao, StatusParticipante, Tarefa
+from models import Alteracao, AgregadoEntrega
 from util import over_a_year
 
 
@@ -520,3 +521,388 @@ class ListaStatusParticipanteSchema(BaseModel):
         title="Contribuições",
         description="Lista de Contribuições planejadas para o Plano de Trabalho.",
     )
+
+
+class PlanoTrabalhoResumoSchema(BaseModel):
+    """Resumo de um plano de trabalho, sem as contribuições e as
+    consolidações, usado nas listagens."""
+
+    model_config = ConfigDict(from_attributes=True)
+    id_plano_trabalho_participante: int = Field(
+        title="Id do Plano de Trabalho",
+        description=PlanoTrabalho.id_plano_trabalho_participante.comment,
+    )
+    id_plano_entrega_unidade: int = Field(
+        title="Id do Plano de Entregas da unidade",
+        description=PlanoTrabalho.id_plano_entrega_unidade.comment,
+    )
+    cancelado: Optional[bool] = Field(
+        default=False,
+        title="Plano cancelado",
+        description=PlanoTrabalho.cancelado.comment,
+    )
+    cod_SIAPE_unidade_exercicio: int = Field(
+        title="Código SIAPE da unidade de exercício do participante",
+        description=PlanoTrabalho.cod_SIAPE_unidade_exercicio.comment,
+    )
+    cpf_participante: str = Field(
+        title="Número do CPF do participante",
+        description=PlanoTrabalho.cpf_participante.comment,
+    )
+    data_inicio_plano: date = Field(
+        title="Data de início do plano",
+        description=PlanoTrabalho.data_inicio_plano.comment,
+    )
+    data_termino_plano: date = Field(
+        title="Data de término do plano",
+        description=PlanoTrabalho.data_termino_plano.comment,
+    )
+    carga_horaria_total_periodo_plano: int = Field(
+        title="Carga horária total do período do plano de trabalho",
+        description=PlanoTrabalho.carga_horaria_total_periodo_plano.comment,
+    )
+    data_modificacao: datetime = Field(
+        title="Data da última modificação",
+        description="Data da última gravação que alterou o plano de trabalho",
+    )
+
+
+class PlanoEntregasResumoSchema(BaseModel):
+    """Resumo de um plano de entregas, sem as entregas, usado nas
+    listagens."""
+
+    model_config = ConfigDict(from_attributes=True)
+    id_plano_entrega_unidade: int = Field(
+        title="Id do plano de entregas da unidade",
+        description=PlanoEntregas.id_plano_entrega_unidade.comment,
+    )
+    cancelado: Optional[bool] = Field(
+        default=False,
+        title="Plano cancelado",
+        description=PlanoEntregas.cancelado.comment,
+    )
+    cod_SIAPE_unidade_plano: int = Field(
+        title="Código SIAPE da unidade do plano de entregas",
+        description=PlanoEntregas.cod_SIAPE_unidade_plano.comment,
+    )
+    data_inicio_plano_entregas: date = Field(
+        title="Data de início estipulada no plano de entregas",
+        description=PlanoEntregas.data_inicio_plano_entregas.comment,
+    )
+    data_termino_plano_entregas: date = Field(
+        title="Data de término estipulada no plano de entregas",
+        description=PlanoEntregas.data_termino_plano_entregas.comment,
+    )
+    avaliacao_plano_entregas: Optional[int] = Field(
+        default=None,
+        title="Avaliação do plano de entregas",
+        description=PlanoEntregas.avaliacao_plano_entregas.comment,
+    )
+    data_modificacao: datetime = Field(
+        title="Data da última modificação",
+        description="Data da última gravação que alterou o plano de entregas",
+    )
+
+
+ItemPagina = TypeVar("ItemPagina")
+
+
+class PaginaSchema(BaseModel, Generic[ItemPagina]):
+    """Página de uma listagem, ordenada pela data da última modificação
+    e pelo id dos itens."""
+
+    itens: List[ItemPagina] = Field(title="Itens", description="Itens da página.")
+    proximo_cursor: Optional[str] = Field(
+        default=None,
+        title="Cursor da próxima página",
+        description="Valor do parâmetro cursor para consultar a próxima "
+        "página, ou nulo se esta for a última.",
+    )
+
+
+class AlteracaoSchema(BaseModel):
+    """Alteração de um recurso, informada no feed de alterações."""
+
+    model_config = ConfigDict(from_attributes=True)
+    tipo: str = Field(
+        title="Tipo do recurso",
+        description=Alteracao.tipo.comment,
+    )
+    chave: str = Field(
+        title="Identificador do recurso",
+        description=Alteracao.chave.comment,
+    )
+    versao: str = Field(
+        title="Versão do recurso",
+        description=Alteracao.versao.comment,
+    )
+    data_alteracao: datetime = Field(
+        title="Data da alteração",
+        description="Data da gravação que alterou o recurso",
+    )
+
+
+class FeedAlteracoesSchema(BaseModel):
+    """Página do feed de alterações, em ordem de gravação."""
+
+    itens: List[AlteracaoSchema] = Field(
+        title="Itens", description="Alterações da página."
+    )
+    proximo_cursor: str = Field(
+        title="Cursor da próxima página",
+        description="Valor do parâmetro desde para consultar as alterações "
+        "posteriores às desta página. É informado mesmo na última página, "
+        "para a consulta de alterações futuras.",
+    )
+    tem_mais: bool = Field(
+        title="Há mais alterações",
+        description="Se já há alterações posteriores às desta página.",
+    )
+
+
+class HorasEntregaSchema(BaseModel):
+    """Horas vinculadas a uma entrega pelos planos de trabalho."""
+
+    model_config = ConfigDict(from_attributes=True)
+    id_entrega: int = Field(
+        title="Id da entrega",
+        description=Entrega.id_entrega.comment,
+    )
+    data_entrega: date = Field(
+        title="Data da entrega",
+        description=Entrega.data_entrega.comment,
+    )
+    horas_vinculadas: int = Field(
+        title="Horas vinculadas",
+        description=AgregadoEntrega.horas_vinculadas.comment,
+    )
+    quantidade_contribuicoes: int = Field(
+        title="Quantidade de contribuições",
+        description=AgregadoEntrega.quantidade_contribuicoes.comment,
+    )
+
+
+class AgregadosPlanoEntregasSchema(BaseModel):
+    """Totais de um plano de entregas e das suas entregas."""
+
+    id_plano_entrega_unidade: int = Field(
+        title="Id do plano de entregas da unidade",
+        description=PlanoEntregas.id_plano_entrega_unidade.comment,
+    )
+    cod_SIAPE_unidade_plano: int = Field(
+        title="Código SIAPE da unidade do plano de entregas",
+        description=PlanoEntregas.cod_SIAPE_unidade_plano.comment,
+    )
+    cancelado: Optional[bool] = Field(
+        default=False,
+        title="Plano cancelado",
+        description=PlanoEntregas.cancelado.comment,
+    )
+    quantidade_entregas: int = Field(
+        title="Quantidade de entregas",
+        description="Quantidade de entregas do plano de entregas.",
+    )
+    media_percentual_progresso_realizado: Optional[float] = Field(
+        default=None,
+        title="Média do percentual de progresso realizado",
+        description="Média do percentual_progresso_realizado das entregas "
+        "que o informam, ou nulo se nenhuma o informar.",
+    )
+    horas_vinculadas: int = Field(
+        title="Horas vinculadas",
+        description="Soma das horas vinculadas às entregas do plano pelas "
+        "contribuições dos planos de trabalho não cancelados.",
+    )
+    entregas: List[HorasEntregaSchema] = Field(
+        title="Entregas",
+        description="Horas vinculadas a cada entrega do plano.",
+    )
+
+
+class HorasUnidadeSchema(BaseModel):
+    """Horas vinculadas às entregas de uma unidade de execução em um mês."""
+
+    model_config = ConfigDict(from_attributes=True)
+    cod_SIAPE_unidade_plano: int = Field(
+        title="Código SIAPE da unidade do plano de entregas",
+        description=PlanoEntregas.cod_SIAPE_unidade_plano.comment,
+    )
+    mes: date = Field(
+        title="Mês",
+        description="Primeiro dia do mês da data das entregas.",
+    )
+    quantidade_entregas: int = Field(
+        title="Quantidade de entregas",
+        description="Quantidade de entregas da unidade no mês.",
+    )
+    horas_vinculadas: int = Field(
+        title="Horas vinculadas",
+        description="Soma das horas vinculadas às entregas da unidade no mês "
+        "pelas contribuições dos planos de trabalho não cancelados.",
+    )
+    quantidade_contribuicoes: int = Field(
+        title="Quantidade de contribuições",
+        description="Quantidade de contribuições dos planos de trabalho não "
+        "cancelados vinculadas às entregas da unidade no mês.",
+    )
+
+
+class QuantidadePlanosSchema(BaseModel):
+    """Quantidades de planos ativos e cancelados."""
+
+    ativos: int = Field(
+        title="Planos ativos", description="Quantidade de planos não cancelados."
+    )
+    cancelados: int = Field(
+        title="Planos cancelados", description="Quantidade de planos cancelados."
+    )
+
+
+class DistribuicaoSchema(BaseModel):
+    """Medidas da distribuição de um valor numérico. As medidas são nulas
+    se não houver valores."""
+
+    quantidade: int = Field(title="Quantidade", description="Quantidade de valores.")
+    minimo: Optional[int] = Field(default=None, title="Mínimo")
+    primeiro_quartil: Optional[float] = Field(default=None, title="Primeiro quartil")
+    mediana: Optional[float] = Field(default=None, title="Mediana")
+    terceiro_quartil: Optional[float] = Field(default=None, title="Terceiro quartil")
+    maximo: Optional[int] = Field(default=None, title="Máximo")
+    media: Optional[float] = Field(default=None, title="Média")
+
+
+class ResumoOrganizacaoSchema(BaseModel):
+    """Resumo dos planos e dos participantes de uma unidade instituidora.
+
+    As contagens por código (modalidade de execução, tipo de contribuição
+    e avaliação) informam todos os códigos válidos, inclusive os sem
+    ocorrências.
+    """
+
+    planos_trabalho: QuantidadePlanosSchema = Field(title="Planos de trabalho")
+    planos_entregas: QuantidadePlanosSchema = Field(title="Planos de entregas")
+    participantes_ativos_por_modalidade_execucao: dict[int, int] = Field(
+        title="Participantes ativos por modalidade de execução",
+        description="Quantidade de participantes cujo último status é ativo, "
+        "por modalidade_execucao do último status.",
+    )
+    participantes_inativos: int = Field(
+        title="Participantes inativos",
+        description="Quantidade de participantes cujo último status é inativo.",
+    )
+    carga_horaria_total_periodo_plano: DistribuicaoSchema = Field(
+        title="Carga horária total dos planos de trabalho",
+        description="Distribuição da carga_horaria_total_periodo_plano dos "
+        "planos de trabalho não cancelados.",
+    )
+    horas_por_tipo_contribuicao: dict[int, int] = Field(
+        title="Horas por tipo de contribuição",
+        description="Soma das horas_vinculadas das contribuições dos planos "
+        "de trabalho não cancelados, por tipo_contribuicao.",
+    )
+    avaliacoes_planos_trabalho: dict[int, int] = Field(
+        title="Avaliações dos planos de trabalho",
+        description="Quantidade de consolidações dos planos de trabalho não "
+        "cancelados por avaliacao_plano_trabalho.",
+    )
+    avaliacoes_planos_entregas: dict[int, int] = Field(
+        title="Avaliações dos planos de entregas",
+        description="Quantidade de planos de entregas não cancelados por "
+        "avaliacao_plano_entregas.",
+    )
+
+
+class ResultadoItemLoteSchema(BaseModel):
+    """Resultado da gravação de um item de um envio em lote."""
+
+    linha: int = Field(
+        title="Linha",
+        description="Número da linha do item no corpo da requisição.",
+    )
+    status_code: int = Field(
+        title="Código de status",
+        description="Código de status HTTP equivalente ao resultado do envio "
+        "individual do item: 201 se criado, 200 se substituído ou 422 se "
+        "rejeitado.",
+    )
+    id_plano_trabalho_participante: Optional[int] = Field(
+        default=None,
+        title="Id do Plano de Trabalho",
+        description=PlanoTrabalho.id_plano_trabalho_participante.comment,
+    )
+    id_plano_entrega_unidade: Optional[int] = Field(
+        default=None,
+        title="Id do plano de entregas da unidade",
+        description=PlanoEntregas.id_plano_entrega_unidade.comment,
+    )
+    cpf_participante: Optional[str] = Field(
+        default=None,
+        title="Número do CPF do participante",
+        description=StatusParticipante.cpf_participante.comment,
+    )
+    detail: Optional[Any] = Field(
+        default=None,
+        title="Detalhe",
+        description="Mensagem de erro, caso o item tenha sido rejeitado.",
+    )
+
+
+class ResultadoLoteSchema(BaseModel):
+    """Resultado da gravação de um envio em lote."""
+
+    quantidade_recebida: int = Field(
+        title="Quantidade recebida",
+        description="Quantidade de itens recebidos no envio.",
+    )
+    quantidade_gravada: int = Field(
+        title="Quantidade gravada",
+        description="Quantidade de itens criados ou substituídos.",
+    )
+    quantidade_rejeitada: int = Field(
+        title="Quantidade rejeitada",
+        description="Quantidade de itens rejeitados.",
+    )
+    resultados: List[ResultadoItemLoteSchema] = Field(
+        title="Resultados",
+        description="Resultado de cada item, na ordem do envio.",
+    )
+
+
+class TarefaSchema(BaseModel):
+    __doc__ = Tarefa.__doc__
+    model_config = ConfigDict(from_attributes=True)
+    id: int = Field(title="Id da tarefa", description=Tarefa.id.comment)
+    cod_SIAPE_instituidora: int = Field(
+        title="Código SIAPE da organização que instituiu o PGD",
+        description=Tarefa.cod_SIAPE_instituidora.comment,
+    )
+    tipo: str = Field(title="Tipo dos itens", description=Tarefa.tipo.comment)
+    situacao: str = Field(
+        title="Situação da tarefa", description=Tarefa.situacao.comment
+    )
+    quantidade_total: int = Field(
+        title="Quantidade total", description=Tarefa.quantidade_total.comment
+    )
+    quantidade_processada: int = Field(
+        title="Quantidade processada",
+        description=Tarefa.quantidade_processada.comment,
+    )
+    quantidade_rejeitada: int = Field(
+        title="Quantidade rejeitada",
+        description=Tarefa.quantidade_rejeitada.comment,
+    )
+    erros: List[ResultadoItemLoteSchema] = Field(
+        title="Erros", description=Tarefa.erros.comment
+    )
+    mensagem_falha: Optional[str] = Field(
+        default=None,
+        title="Mensagem de falha",
+        description=Tarefa.mensagem_falha.comment,
+    )
+    data_insercao: datetime = Field(title="Data de criação da tarefa")
+    data_inicio_processamento: Optional[datetime] = Field(
+        default=None, title="Data de início do processamento"
+    )
+    data_conclusao: Optional[datetime] = Field(
+        default=None, title="Data de conclusão do processamento"
+    )
@@ -2,22 +2,55 @@
 Fief: https://docs.fief.dev/
 """
 
+import asyncio
+import base64
+import hashlib
+import json
+import logging
 import os
+import time
+import uuid
+from typing import Optional
 
+from fastapi import Depends
 from fastapi.security import OAuth2AuthorizationCodeBearer
+from jwcrypto import jwk, jwt
 
-from fief_client import FiefAsync
+from fief_client import (
+    FiefAccessTokenInfo,
+    FiefAccessTokenInvalid,
+    FiefAsync,
+    FiefUserInfo,
+)
 from fief_client.integrations.fastapi import FiefAuth
 
+from cache import AUSENTE, CacheLRU
+from metricas import DURACAO_FIEF, medir_segmento
+
 FIEF_BASE_TENANT_URL = os.environ["FIEF_BASE_TENANT_URL"]
 FIEF_CLIENT_ID = os.environ["FIEF_CLIENT_ID"]
 FIEF_CLIENT_SECRET = os.environ["FIEF_CLIENT_SECRET"]
 
-fief = FiefAsync(
-    base_url=FIEF_BASE_TENANT_URL,
-    client_id=FIEF_CLIENT_ID,
-    client_secret=FIEF_CLIENT_SECRET,
+# Quantidade máxima de tokens no cache de informações de usuários. Zero
+# desativa o cache.
+USERINFO_CACHE_SIZE = int(os.environ.get("USERINFO_CACHE_SIZE", "10000"))
+# Tempo de vida, em segundos, das informações de usuários no cache. Nunca
+# ultrapassa a expiração do token.
+USERINFO_CACHE_TTL = float(os.environ.get("USERINFO_CACHE_TTL", "300"))
+# Se as informações do usuário devem ser lidas das claims do token de
+# acesso, quando ele as contiver, em vez de consultadas no Fief.
+FIEF_LOCAL_USERINFO = os.environ.get("FIEF_LOCAL_USERINFO", "false").lower() in (
+    "1",
+    "true",
 )
+# Tempo, em segundos, após o qual as chaves públicas (JWKS) do Fief são
+# consultadas novamente
+JWKS_CACHE_TTL = float(os.environ.get("JWKS_CACHE_TTL", "3600"))
+# Intervalo mínimo, em segundos, entre consultas às chaves do Fief
+# motivadas por tokens assinados com chaves desconhecidas
+JWKS_MIN_REFRESH_INTERVAL = float(os.environ.get("JWKS_MIN_REFRESH_INTERVAL", "30"))
+
+logger = logging.getLogger(__name__)
 
 scheme = OAuth2AuthorizationCodeBearer(
     authorizationUrl=f"{FIEF_BASE_TENANT_URL}/authorize",
@@ -26,4 +59,218 @@ scheme = OAuth2AuthorizationCodeBearer(
     auto_error=False,
 )
 
-auth_backend = FiefAuth(fief, scheme)
+userinfo_cache = CacheLRU(USERINFO_CACHE_SIZE, USERINFO_CACHE_TTL, 0)
+
+
+def ler_segmento_jwt(token: str, indice: int) -> dict:
+    """Lê um segmento de um token JWT, sem verificar a assinatura.
+
+    Args:
+        token (str): Token JWT.
+        indice (int): 0 para o cabeçalho, 1 para as claims.
+
+    Returns:
+        dict: Conteúdo do segmento, ou um dicionário vazio se o token não
+            for um JWT válido.
+    """
+    try:
+        segmento = token.split(".")[indice]
+        conteudo = json.loads(
+            base64.urlsafe_b64decode(segmento + "=" * (-len(segmento) % 4))
+        )
+    except (IndexError, TypeError, ValueError):
+        return {}
+    return conteudo if isinstance(conteudo, dict) else {}
+
+
+def expiracao_token(token: str) -> Optional[float]:
+    """Lê a data de expiração (claim exp) de um token JWT.
+
+    A assinatura não é verificada, pois o token já foi validado por
+    FiefAuth antes do uso do cache.
+
+    Args:
+        token (str): Token de acesso.
+
+    Returns:
+        Optional[float]: Data de expiração, como timestamp Unix, ou None
+            se o token não a informar.
+    """
+    try:
+        return float(ler_segmento_jwt(token, 1)["exp"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class FiefAsyncLocal(FiefAsync):
+    """Cliente do Fief que verifica os tokens de acesso localmente, com as
+    chaves públicas (JWKS) do Fief mantidas em cache.
+
+    Diferente do FiefAsync, que consulta as chaves uma única vez, as
+    chaves são consultadas novamente a cada JWKS_CACHE_TTL segundos e
+    quando um token é assinado por uma chave desconhecida, o que permite a
+    rotação de chaves no Fief. Se o Fief estiver indisponível, as chaves
+    já conhecidas continuam em uso.
+
+    Com local_userinfo, as informações do usuário são lidas das claims
+    do token de acesso, quando ele contiver o campo fields, sem consulta
+    ao Fief.
+    """
+
+    def __init__(self, *args, local_userinfo: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.local_userinfo = local_userinfo
+        self._jwks_expiracao = 0.0
+        self._jwks_ultima_consulta_forcada = float("-inf")
+        self._jwks_lock = asyncio.Lock()
+
+    async def _consultar_jwks(self) -> jwk.JWKSet:
+        "Consulta as chaves públicas no Fief, sem alterar as conhecidas."
+        jwks_uri = self._get_endpoint_url(
+            await self._get_openid_configuration(), "jwks_uri"
+        )
+        async with self._get_httpx_client() as client:
+            response = await client.get(jwks_uri)
+            response.raise_for_status()
+            return jwk.JWKSet.from_json(response.text)
+
+    async def _renovar_jwks(self):
+        """Substitui as chaves conhecidas pelas consultadas no Fief. Deve
+        ser chamado com _jwks_lock.
+
+        Em caso de falha, as chaves conhecidas, se houver, continuam em uso
+        e a consulta é repetida após JWKS_MIN_REFRESH_INTERVAL segundos.
+        """
+        try:
+            with DURACAO_FIEF.labels("jwks").time():
+                self._jwks = await self._consultar_jwks()
+            self._jwks_expiracao = time.monotonic() + JWKS_CACHE_TTL
+        except Exception:  # pylint: disable=broad-except
+            if self._jwks is None:
+                raise
+            logger.exception("Falha ao consultar as chaves do Fief")
+            self._jwks_expiracao = time.monotonic() + JWKS_MIN_REFRESH_INTERVAL
+
+    async def _get_jwks(self) -> jwk.JWKSet:
+        # Enquanto uma tarefa renova as chaves vencidas, as demais usam as
+        # chaves conhecidas em vez de aguardar a consulta ao Fief
+        if self._jwks is not None and (
+            time.monotonic() < self._jwks_expiracao or self._jwks_lock.locked()
+        ):
+            return self._jwks
+        async with self._jwks_lock:
+            if self._jwks is None or time.monotonic() >= self._jwks_expiracao:
+                await self._renovar_jwks()
+            return self._jwks
+
+    async def _atualizar_jwks(self, token: str) -> bool:
+        """Consulta novamente as chaves do Fief se o token for assinado por
+        uma chave desconhecida, respeitando JWKS_MIN_REFRESH_INTERVAL.
+
+        Returns:
+            bool: Se a chave do token passou a ser conhecida.
+        """
+        kid = ler_segmento_jwt(token, 0).get("kid")
+        agora = time.monotonic()
+        if (
+            kid is None
+            or (self._jwks is not None and self._jwks.get_key(kid) is not None)
+            or agora - self._jwks_ultima_consulta_forcada < JWKS_MIN_REFRESH_INTERVAL
+        ):
+            return False
+        self._jwks_ultima_consulta_forcada = agora
+        async with self._jwks_lock:
+            # Outra tarefa pode ter trazido a chave enquanto esta aguardava
+            if self._jwks is None or self._jwks.get_key(kid) is None:
+                await self._renovar_jwks()
+            return self._jwks.get_key(kid) is not None
+
+    async def validate_access_token(
+        self, access_token: str, **kwargs
+    ) -> FiefAccessTokenInfo:
+        with medir_segmento("auth"):
+            try:
+                return await super().validate_access_token(access_token, **kwargs)
+            except FiefAccessTokenInvalid:
+                if not await self._atualizar_jwks(access_token):
+                    raise
+            return await super().validate_access_token(access_token, **kwargs)
+
+    async def _claims_verificadas(self, access_token: str) -> Optional[dict]:
+        "Verifica a assinatura e a expiração do token e traz as suas claims."
+        for tentativa in range(2):
+            try:
+                token = jwt.JWT(
+                    jwt=access_token, algs=["RS256"], key=await self._get_jwks()
+                )
+                return json.loads(token.claims)
+            except jwt.JWTExpired:
+                return None
+            except (jwt.JWException, ValueError):
+                if tentativa or not await self._atualizar_jwks(access_token):
+                    return None
+        return None
+
+    async def userinfo(self, access_token: str) -> FiefUserInfo:
+        with medir_segmento("auth"):
+            return await self._userinfo(access_token)
+
+    async def _userinfo(self, access_token: str) -> FiefUserInfo:
+        if self.local_userinfo:
+            claims = await self._claims_verificadas(access_token)
+            if claims is not None and "fields" in claims:
+                return {
+                    campo: claims[campo]
+                    for campo in ("sub", "email", "tenant_id", "fields")
+                    if campo in claims
+                }
+        with DURACAO_FIEF.labels("userinfo").time():
+            return await super().userinfo(access_token)
+
+
+fief = FiefAsyncLocal(
+    base_url=FIEF_BASE_TENANT_URL,
+    client_id=FIEF_CLIENT_ID,
+    client_secret=FIEF_CLIENT_SECRET,
+    local_userinfo=FIEF_LOCAL_USERINFO,
+)
+
+
+class UserInfoCache:
+    """Cache das informações de usuário retornadas pelo Fief para um token
+    de acesso, segundo o protocolo UserInfoCacheProtocol do fief_client.
+
+    As entradas são indexadas pelo hash do token, e não pelo id do
+    usuário, de modo que um token novo sempre consulta o Fief, e expiram
+    junto com o token.
+    """
+
+    def __init__(self, token: Optional[str]):
+        self.chave = hashlib.sha256(token.encode()).hexdigest() if token else None
+        self.token = token
+
+    async def get(self, user_id: uuid.UUID) -> Optional[FiefUserInfo]:
+        "Traz as informações do usuário do cache, se houver."
+        if self.chave is None:
+            return None
+        userinfo = userinfo_cache.get(self.chave)
+        if userinfo is AUSENTE or userinfo["sub"] != str(user_id):
+            return None
+        return userinfo
+
+    async def set(self, user_id: uuid.UUID, userinfo: FiefUserInfo):
+        "Grava as informações do usuário no cache até a expiração do token."
+        if self.chave is None:
+            return
+        expiracao = expiracao_token(self.token)
+        ttl = None if expiracao is None else expiracao - time.time()
+        userinfo_cache.set(self.chave, userinfo, userinfo_cache.geracao, ttl)
+
+
+def get_userinfo_cache(token: Optional[str] = Depends(scheme)) -> UserInfoCache:
+    """Dependência que fornece o cache de informações de usuário para o
+    token da requisição."""
+    return UserInfoCache(token)
+
+
+auth_backend = FiefAuth(fief, scheme, get_userinfo_cache=get_userinfo_cache)
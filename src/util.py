@@ -1,7 +1,14 @@
 """Funções de utilidade comum.
 """
+import base64
 import calendar
-from datetime import date, timedelta
+import hashlib
+import json
+from datetime import date, datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Optional
+
+from pydantic import BaseModel
 
 def sa_obj_to_dict(d: dict) -> dict:
     "Copia os valores do objeto SQL Alchemy para um dicionário."
@@ -80,3 +87,132 @@ def over_a_year(start: date, end: date) -> int:
     if end - start > timedelta(days=365+add_leap):
         return 1
     return -1
+
+
+def content_hash(model: BaseModel) -> str:
+    """Calcula o hash SHA-256 da representação JSON canônica de um
+    esquema Pydantic, com os campos na ordem definida no esquema.
+
+    Args:
+        model (BaseModel): o esquema Pydantic.
+
+    Returns:
+        str: o hash em hexadecimal.
+    """
+    return hashlib.sha256(model.model_dump_json().encode("utf-8")).hexdigest()
+
+
+def etag_matches(header: Optional[str], etag: Optional[str], weak: bool = True) -> bool:
+    """Verifica se uma ETag consta de um cabeçalho If-Match ou
+    If-None-Match.
+
+    Args:
+        header (Optional[str]): valor do cabeçalho, com uma lista de
+            ETags separadas por vírgulas ou "*".
+        etag (Optional[str]): ETag atual do recurso, entre aspas, ou None
+            se o recurso não existir.
+        weak (bool): se a comparação é fraca, como em If-None-Match, em
+            que ETags com prefixo W/ também são consideradas.
+
+    Returns:
+        bool: True se a ETag consta do cabeçalho.
+    """
+    if header is None or etag is None:
+        return False
+    if header.strip() == "*":
+        return True
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            if not weak:
+                continue
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def http_date(value: datetime) -> str:
+    """Formata uma data e hora local no formato usado em cabeçalhos HTTP,
+    como Last-Modified.
+
+    Args:
+        value (datetime): a data e hora, sem fuso horário.
+
+    Returns:
+        str: a data e hora em GMT, no formato do RFC 9110.
+    """
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def codificar_cursor(data_modificacao: datetime, id_item: int) -> str:
+    """Codifica a posição de um item em uma listagem paginada, ordenada
+    pela data da última modificação e pelo id, em um cursor opaco.
+
+    Args:
+        data_modificacao (datetime): data da última modificação do item.
+        id_item (int): id do item.
+
+    Returns:
+        str: o cursor, em base64 seguro para URLs.
+    """
+    conteudo = json.dumps([data_modificacao.isoformat(), id_item])
+    return base64.urlsafe_b64encode(conteudo.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> tuple[datetime, int]:
+    """Decodifica um cursor gerado por codificar_cursor.
+
+    Args:
+        cursor (str): o cursor.
+
+    Raises:
+        ValueError: se o cursor for inválido.
+
+    Returns:
+        tuple[datetime, int]: a data da última modificação e o id do
+            item.
+    """
+    try:
+        data_modificacao, id_item = json.loads(
+            base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        )
+        return datetime.fromisoformat(data_modificacao), int(id_item)
+    except (TypeError, ValueError) as exception:
+        raise ValueError("Cursor inválido") from exception
+
+
+def codificar_cursor_alteracoes(transacao: int, id_alteracao: int) -> str:
+    """Codifica a posição de uma alteração no feed de alterações, ordenado
+    pela transação e pelo id, em um cursor opaco.
+
+    Args:
+        transacao (int): identificador da transação da alteração.
+        id_alteracao (int): id da alteração.
+
+    Returns:
+        str: o cursor, em base64 seguro para URLs.
+    """
+    conteudo = json.dumps([transacao, id_alteracao])
+    return base64.urlsafe_b64encode(conteudo.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor_alteracoes(cursor: str) -> tuple[int, int]:
+    """Decodifica um cursor gerado por codificar_cursor_alteracoes.
+
+    Args:
+        cursor (str): o cursor.
+
+    Raises:
+        ValueError: se o cursor for inválido.
+
+    Returns:
+        tuple[int, int]: o identificador da transação e o id da alteração.
+    """
+    try:
+        transacao, id_alteracao = json.loads(
+            base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        )
+        return int(transacao), int(id_alteracao)
+    except (TypeError, ValueError) as exception:
+        raise ValueError("Cursor inválido") from exception
@@ -0,0 +1,129 @@
+"""Processamento assíncrono das tarefas de envio em lote.
+
+As tarefas são enfileiradas pela API na tabela tarefa. Podem ser
+executados quantos processos deste módulo forem necessários: cada um
+reserva uma tarefa por vez com FOR UPDATE SKIP LOCKED. Se a reserva de
+uma tarefa expirar e ela for reservada por outro processo, o processo
+anterior é interrompido na próxima atualização do progresso, cuja
+transação é desfeita, de modo que uma mesma tarefa nunca é gravada por
+dois processos.
+
+Uso:
+    python worker.py
+"""
+
+import asyncio
+import logging
+import os
+from typing import AsyncIterator, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+import lote
+import models
+from db_config import DbContextManager
+
+# Intervalo, em segundos, entre consultas à fila quando ela está vazia
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1"))
+# Tempo, em segundos, sem progresso após o qual uma tarefa em
+# processamento é considerada abandonada e pode ser retomada
+JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", "300"))
+
+PROCESSADORES = {
+    models.TipoTarefa.planos_entregas.value: lote.processar_planos_entregas,
+    models.TipoTarefa.planos_trabalho.value: lote.processar_planos_trabalho,
+    models.TipoTarefa.participantes.value: lote.processar_status_participantes,
+}
+
+logger = logging.getLogger(__name__)
+
+
+async def ler_conteudo(
+    conteudo: bytes, ultima_linha_processada: int
+) -> AsyncIterator[Tuple[int, bytes]]:
+    """Lê as linhas de uma tarefa ainda não processadas.
+
+    Args:
+        conteudo (bytes): Conteúdo NDJSON da tarefa.
+        ultima_linha_processada (int): Número da última linha cujo
+            resultado já foi registrado.
+
+    Yields:
+        Tuple[int, bytes]: Número da linha e o seu conteúdo.
+    """
+    for numero_linha, linha in enumerate(conteudo.split(b"\n"), start=1):
+        if numero_linha > ultima_linha_processada and linha.strip():
+            yield numero_linha, linha
+
+
+async def processar_proxima_tarefa() -> bool:
+    """Reserva e processa a próxima tarefa da fila.
+
+    O progresso é registrado na mesma transação que grava cada grupo de
+    itens, de modo que uma tarefa interrompida é retomada a partir da
+    primeira linha não gravada, sem gravar novamente as anteriores.
+
+    Returns:
+        bool: Se alguma tarefa foi processada.
+    """
+    db_session = DbContextManager()
+    tarefa = await crud.claim_tarefa(db_session, JOB_LEASE_SECONDS)
+    if tarefa is None:
+        return False
+    logger.info("Processando tarefa %d (%s)", tarefa.id, tarefa.tipo)
+
+    async def progresso(session: Optional[AsyncSession], resultados: list[dict]):
+        if session is None:
+            await crud.update_progresso_tarefa(
+                db_session, tarefa.id, tarefa.token_reserva, resultados
+            )
+        else:
+            await crud.registrar_progresso_tarefa(
+                session, tarefa.id, tarefa.token_reserva, resultados
+            )
+
+    try:
+        try:
+            await PROCESSADORES[tarefa.tipo](
+                db_session=db_session,
+                cod_SIAPE_instituidora=tarefa.cod_SIAPE_instituidora,
+                linhas=ler_conteudo(tarefa.conteudo, tarefa.ultima_linha_processada),
+                progresso=progresso,
+            )
+        except crud.TarefaPerdida:
+            raise
+        except Exception as exception:  # pylint: disable=broad-except
+            logger.exception("Falha ao processar a tarefa %d", tarefa.id)
+            await crud.finish_tarefa(
+                db_session,
+                tarefa.id,
+                tarefa.token_reserva,
+                models.SituacaoTarefa.falha,
+                str(exception),
+            )
+        else:
+            await crud.finish_tarefa(
+                db_session,
+                tarefa.id,
+                tarefa.token_reserva,
+                models.SituacaoTarefa.concluida,
+            )
+    except crud.TarefaPerdida:
+        logger.warning(
+            "A reserva da tarefa %d expirou e o processamento foi interrompido",
+            tarefa.id,
+        )
+    return True
+
+
+async def main():
+    "Processa as tarefas da fila indefinidamente."
+    while True:
+        if not await processar_proxima_tarefa():
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""Compara a taxa de gravação (linhas por segundo) das formas de gravar
+status de participantes: uma linha por vez com
+crud.create_status_participante, INSERT de múltiplas linhas e COPY.
+
+Requer a variável de ambiente SQLALCHEMY_DATABASE_URL. As linhas
+gravadas usam um cod_SIAPE_instituidora reservado e são apagadas ao
+final de cada medição.
+
+Uso:
+    python benchmark_status_participante.py [--linhas 10000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from sqlalchemy import delete  # pylint: disable=wrong-import-position
+
+import crud  # pylint: disable=wrong-import-position
+import models  # pylint: disable=wrong-import-position
+import schemas  # pylint: disable=wrong-import-position
+from db_config import DbContextManager  # pylint: disable=wrong-import-position
+from migracoes import aplicar_migracoes  # pylint: disable=wrong-import-position
+
+COD_SIAPE_INSTITUIDORA = 999999
+
+
+def gerar_status(quantidade: int) -> list[schemas.StatusParticipanteSchema]:
+    "Gera status de participantes de exemplo."
+    return [
+        schemas.StatusParticipanteSchema(
+            cod_SIAPE_instituidora=COD_SIAPE_INSTITUIDORA,
+            cpf_participante="64635210600",
+            participante_ativo_inativo_pgd=1,
+            matricula_siape=str(1000000 + numero),
+            modalidade_execucao=3,
+            jornada_trabalho_semanal=40,
+            data_envio="2023-10-19",
+        )
+        for numero in range(quantidade)
+    ]
+
+
+async def apagar_status():
+    "Apaga os status gravados pelo benchmark."
+    async with DbContextManager() as session:
+        await session.execute(
+            delete(models.StatusParticipante).filter_by(
+                cod_SIAPE_instituidora=COD_SIAPE_INSTITUIDORA
+            )
+        )
+        await session.commit()
+
+
+async def um_por_vez(lista_status: list[schemas.StatusParticipanteSchema]):
+    "Grava com crud.create_status_participante, um status por transação."
+    for status_participante in lista_status:
+        await crud.create_status_participante(DbContextManager(), status_participante)
+
+
+async def insert_multiplas_linhas(lista_status: list[schemas.StatusParticipanteSchema]):
+    "Grava com INSERT de múltiplas linhas em uma transação."
+    crud.STATUS_PARTICIPANTE_COPY_THRESHOLD = len(lista_status) + 1
+    await crud.create_lista_status_participante(DbContextManager(), lista_status)
+
+
+async def copy(lista_status: list[schemas.StatusParticipanteSchema]):
+    "Grava com COPY em uma transação."
+    crud.STATUS_PARTICIPANTE_COPY_THRESHOLD = 1
+    await crud.create_lista_status_participante(DbContextManager(), lista_status)
+
+
+async def main(quantidade: int):
+    "Executa e apresenta as medições."
+    aplicar_migracoes()
+    lista_status = gerar_status(quantidade)
+    for nome, gravar in (
+        ("crud.create_status_participante", um_por_vez),
+        ("INSERT de múltiplas linhas", insert_multiplas_linhas),
+        ("COPY", copy),
+    ):
+        await apagar_status()
+        inicio = time.perf_counter()
+        await gravar(lista_status)
+        duracao = time.perf_counter() - inicio
+        print(f"{nome:<35} {quantidade / duracao:>12,.0f} linhas/s")
+    await apagar_status()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--linhas", type=int, default=10000)
+    asyncio.run(main(parser.parse_args().linhas))
@@ -18,8 +18,14 @@ from crud import (
     truncate_plano_entregas,
     truncate_plano_trabalho,
     truncate_status_participante,
+    truncate_tarefa,
 )
 from api import app
+import metricas
+from migracoes import aplicar_migracoes
+
+# Nos testes, exceder o orçamento de comandos SQL de uma rota é um erro
+metricas.QUERY_BUDGET_MODE = "erro"
 
 # Fief admin helper object
 fief_admin = FiefAdminHelper(
@@ -53,6 +59,12 @@ def prepare_header(username: Optional[str]) -> dict:
 # Fixtures
 
 
+@pytest.fixture(scope="session", autouse=True)
+def fixture_migracoes():
+    """Aplica as migrações pendentes ao banco de dados dos testes."""
+    aplicar_migracoes()
+
+
 @pytest.fixture(scope="function", name="input_pe")
 def fixture_input_pe() -> dict:
     """Template de Plano de Entregas da Unidade.
@@ -171,6 +183,11 @@ def truncate_participantes():
     truncate_status_participante()
 
 
+@pytest.fixture()
+def truncate_tarefas():
+    truncate_tarefa()
+
+
 @pytest.fixture(scope="module", name="truncate_users")
 def fixture_truncate_users(admin_credentials: dict):
     for user in USERS_CREDENTIALS + [admin_credentials]:
@@ -6,6 +6,9 @@ from httpx import Client
 from fastapi import status
 import pytest
 
+import cache
+import metricas
+
 def test_redirect_to_docs_html(client: Client):
     """
     Testa se o acesso por um navegador na raiz redireciona para o /docs.
@@ -27,3 +30,68 @@ def test_redirect_to_entrypoint_json(client: Client):
 
     assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
     assert response.headers['Location'] == "/openapi.json"
+
+def test_get_estatisticas_pool(client: Client, header_usr_1: dict):
+    """
+    Testa se as estatísticas do pool de conexões são informadas.
+    """
+    # uma consulta ao banco, para que haja ao menos uma espera registrada
+    cache.limpar()
+    client.get("/organizacao/1/plano_trabalho/888888888", headers=header_usr_1)
+    response = client.get("/estatisticas/pool", headers=header_usr_1)
+
+    assert response.status_code == status.HTTP_200_OK
+    estatisticas = response.json()
+    assert estatisticas["em_uso"] >= 0
+    assert estatisticas["overflow"] >= 0
+    espera = estatisticas["espera_segundos"]
+    assert espera["faixas"]["+Inf"] == espera["contagem"]
+    assert espera["contagem"] > 0
+
+def test_get_metrics(client: Client, header_usr_1: dict):
+    """
+    Testa se as métricas no formato do Prometheus incluem a duração das
+    requisições por rota e os comandos SQL por função do módulo crud.
+    """
+    cache.limpar()
+    client.get("/organizacao/1/plano_trabalho/888888888", headers=header_usr_1)
+    response = client.get("/metrics")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Content-Type"].startswith("text/plain")
+    metricas = response.text
+    assert (
+        'http_request_duration_seconds_count{method="GET",'
+        'route="/organizacao/{cod_SIAPE_instituidora}/plano_trabalho/'
+        '{id_plano_trabalho_participante}",status="404"}'
+    ) in metricas
+    assert 'db_queries_total{funcao="get_versao_plano_trabalho"}' in metricas
+    assert "db_pool_wait_seconds_bucket" in metricas
+
+def test_server_timing(client: Client, header_usr_1: dict):
+    """
+    Testa se o cabeçalho Server-Timing informa os comandos SQL executados.
+    """
+    cache.limpar()
+    response = client.get(
+        "/organizacao/1/plano_trabalho/888888888", headers=header_usr_1
+    )
+
+    server_timing = response.headers["Server-Timing"]
+    assert server_timing.startswith("db;dur=")
+    assert 'desc="1 comandos, ' in server_timing
+    assert "total;dur=" in server_timing
+    assert "auth;dur=" in server_timing
+
+
+def test_orcamento_consultas_excedido():
+    """
+    Testa se exceder o orçamento de comandos SQL de uma rota é um erro
+    nos testes.
+    """
+    medicao = metricas.MedicaoRequisicao()
+    medicao.orcamento_comandos = 2
+    medicao.comandos = 3
+
+    with pytest.raises(metricas.OrcamentoConsultasExcedido):
+        metricas.verificar_orcamento(medicao, "GET /rota")
@@ -0,0 +1,112 @@
+"""
+Testes relacionados à exportação das tabelas em arquivos Parquet.
+"""
+
+import pytest
+
+pa_dataset = pytest.importorskip("pyarrow.dataset")
+
+# pylint: disable=wrong-import-position
+import exportacao_parquet
+import models
+from db_config import sync_engine
+
+# Os testes usam muitas fixtures, então necessariamente precisam de
+# muitos argumentos. Além disso, algumas fixtures não retornam um valor
+# para ser usado no teste, mas mesmo assim são executadas quando estão
+# presentes como um argumento da função.
+# A linha abaixo desabilita os warnings do Pylint sobre isso.
+# pylint: disable=too-many-arguments
+# pylint: disable=unused-argument
+
+
+def test_exportar_parquet(
+    truncate_pe,
+    truncate_pt,
+    truncate_participantes,
+    example_pe,
+    example_pt,
+    example_part,
+    input_pt: dict,
+    input_part: dict,
+    user1_credentials: dict,
+    tmp_path,
+):
+    """Exporta as tabelas de duas unidades instituidoras, em dois
+    processos, e as lê como conjuntos de dados particionados.
+    """
+    cod_SIAPE_instituidora = user1_credentials["cod_SIAPE_instituidora"]
+    resultado = exportacao_parquet.exportar(
+        str(tmp_path), [cod_SIAPE_instituidora, 999999], processos=2
+    )
+
+    assert resultado[999999] == {
+        tabela.name: 0 for tabela in exportacao_parquet.TABELAS
+    }
+    quantidades = resultado[cod_SIAPE_instituidora]
+    assert quantidades["plano_trabalho"] == 1
+    assert quantidades["contribuicao"] == len(input_pt["contribuicoes"])
+    assert quantidades["consolidacao"] == len(input_pt["consolidacoes"])
+    assert quantidades["plano_entregas"] == 1
+    assert quantidades["status_participante"] == 1
+    assert not (tmp_path / "plano_trabalho" / "cod_SIAPE_instituidora=999999").exists()
+
+    contribuicoes = pa_dataset.dataset(
+        tmp_path / "contribuicao", partitioning="hive"
+    ).to_table()
+    assert contribuicoes.num_rows == len(input_pt["contribuicoes"])
+    assert set(contribuicoes.column("cod_SIAPE_instituidora").to_pylist()) == {
+        cod_SIAPE_instituidora
+    }
+    assert sorted(contribuicoes.column("tipo_contribuicao").to_pylist()) == sorted(
+        contribuicao["tipo_contribuicao"] for contribuicao in input_pt["contribuicoes"]
+    )
+
+    participantes = pa_dataset.dataset(
+        tmp_path / "status_participante", partitioning="hive"
+    ).to_table()
+    assert participantes.column("cpf_participante").to_pylist() == [
+        input_part["cpf_participante"]
+    ]
+
+
+def test_exportar_tabela_falha(
+    truncate_pe,
+    truncate_pt,
+    example_pe,
+    example_pt,
+    input_pt: dict,
+    user1_credentials: dict,
+    tmp_path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """Verifica se uma falha durante a exportação de uma tabela não deixa
+    o arquivo incompleto no diretório da partição.
+    """
+    assert len(input_pt["contribuicoes"]) > 1
+    monkeypatch.setattr(exportacao_parquet, "PARQUET_BATCH_SIZE", 1)
+    monkeypatch.setattr(exportacao_parquet, "PARQUET_ROW_GROUP_SIZE", 1)
+    record_batch = exportacao_parquet.pa.record_batch
+    lotes = []
+
+    def record_batch_com_falha(*args, **kwargs):
+        lotes.append(1)
+        if len(lotes) > 1:
+            raise ValueError("falha na conversão")
+        return record_batch(*args, **kwargs)
+
+    monkeypatch.setattr(exportacao_parquet.pa, "record_batch", record_batch_com_falha)
+    cod_SIAPE_instituidora = user1_credentials["cod_SIAPE_instituidora"]
+    with sync_engine.connect() as connection:
+        with pytest.raises(ValueError):
+            exportacao_parquet.exportar_tabela(
+                connection,
+                models.Contribuicao.__table__,
+                cod_SIAPE_instituidora,
+                str(tmp_path),
+            )
+    diretorio = (
+        tmp_path / "contribuicao" / f"cod_SIAPE_instituidora={cod_SIAPE_instituidora}"
+    )
+    assert diretorio.exists()
+    assert not list(diretorio.iterdir())
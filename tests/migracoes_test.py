@@ -0,0 +1,217 @@
+"""
+Testes relacionados às migrações do esquema do banco de dados.
+"""
+
+import pytest
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+import migracoes
+import models
+import schemas
+from db_config import Base
+from util import content_hash
+
+# Banco de dados criado para o teste das migrações de um banco anterior a
+# elas
+BANCO_ANTERIOR = "api_pgd_teste_migracoes"
+
+
+def test_aplicar_migracoes_idempotente():
+    """Testa se, com o banco atualizado, não há migrações pendentes e uma
+    nova execução não aplica nenhuma migração.
+    """
+    assert migracoes.migracoes_pendentes() == []
+    assert migracoes.aplicar_migracoes() == []
+
+
+def test_criar_indice_concorrente_e_preencher_em_lotes():
+    """Testa a criação concorrente de um índice, que não é recriado se já
+    existir, e o preenchimento de uma coluna em lotes.
+    """
+    with migracoes.engine.connect().execution_options(
+        isolation_level="AUTOCOMMIT"
+    ) as connection:
+        connection.exec_driver_sql("DROP TABLE IF EXISTS teste_migracao")
+        connection.exec_driver_sql(
+            "CREATE TABLE teste_migracao AS "
+            "SELECT numero, NULL::integer AS dobro "
+            "FROM generate_series(1, 25) AS numero"
+        )
+        try:
+            for _ in range(2):
+                migracoes.criar_indice_concorrente(
+                    connection, "ix_teste_migracao", "teste_migracao", "numero"
+                )
+            assert connection.execute(
+                text(
+                    "SELECT indisvalid FROM pg_index "
+                    "WHERE indexrelid = to_regclass(:nome)"
+                ),
+                {"nome": "ix_teste_migracao"},
+            ).scalar()
+
+            atualizadas = migracoes.preencher_em_lotes(
+                connection,
+                "teste_migracao",
+                "dobro = numero * 2",
+                "dobro IS NULL",
+                tamanho_lote=10,
+            )
+            assert atualizadas == 25
+            assert (
+                connection.execute(
+                    text("SELECT count(*) FROM teste_migracao WHERE dobro = numero * 2")
+                ).scalar()
+                == 25
+            )
+        finally:
+            connection.exec_driver_sql("DROP TABLE teste_migracao")
+
+
+@pytest.fixture(name="banco_anterior")
+def fixture_banco_anterior(monkeypatch: pytest.MonkeyPatch):
+    """Cria um banco com o esquema anterior às migrações, sem as tabelas,
+    colunas, índices e restrições acrescentados depois, e o usa nas
+    migrações."""
+    principal = migracoes.engine
+    with principal.connect().execution_options(
+        isolation_level="AUTOCOMMIT"
+    ) as connection:
+        connection.exec_driver_sql(f"DROP DATABASE IF EXISTS {BANCO_ANTERIOR}")
+        connection.exec_driver_sql(f"CREATE DATABASE {BANCO_ANTERIOR}")
+    engine = create_engine(
+        principal.url.set(database=BANCO_ANTERIOR), poolclass=NullPool
+    )
+    try:
+        with engine.begin() as connection:
+            Base.metadata.create_all(connection)
+            connection.exec_driver_sql(
+                "DROP TABLE tarefa, alteracao, agregado_entrega, "
+                "agregado_plano_entregas"
+            )
+            for tabela, periodo in (
+                ("plano_trabalho", "periodo_plano"),
+                ("plano_entregas", "periodo_plano_entregas"),
+            ):
+                connection.exec_driver_sql(
+                    f"ALTER TABLE {tabela} DROP COLUMN hash_conteudo, "
+                    f"DROP COLUMN {periodo} CASCADE"
+                )
+            connection.exec_driver_sql(
+                "DROP INDEX ix_status_participante_cpf, "
+                "ix_plano_trabalho_modificacao, ix_plano_entregas_modificacao"
+            )
+            connection.exec_driver_sql(
+                "INSERT INTO plano_entregas "
+                '("cod_SIAPE_instituidora", id_plano_entrega_unidade, '
+                "data_inicio_plano_entregas, data_termino_plano_entregas, "
+                '"cod_SIAPE_unidade_plano", data_insercao) '
+                "VALUES (1, 1, '2023-01-01', '2023-01-31', 99, now())"
+            )
+        monkeypatch.setattr(migracoes, "engine", engine)
+        yield engine
+    finally:
+        engine.dispose()
+        with principal.connect().execution_options(
+            isolation_level="AUTOCOMMIT"
+        ) as connection:
+            connection.exec_driver_sql(
+                f"DROP DATABASE IF EXISTS {BANCO_ANTERIOR} WITH (FORCE)"
+            )
+
+
+def test_aplicar_migracoes_banco_anterior(
+    banco_anterior, monkeypatch: pytest.MonkeyPatch
+):
+    """Aplica as migrações a um banco com o esquema anterior a elas e
+    confere se o esquema resultante é o dos modelos e se os planos
+    existentes recebem o hash do conteúdo.
+    """
+    engine = banco_anterior
+    monkeypatch.setattr(migracoes, "MIGRATION_BATCH_SIZE", 1)
+    monkeypatch.setattr(migracoes, "MIGRATION_BATCH_PAUSE", 0)
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO plano_entregas "
+            '("cod_SIAPE_instituidora", id_plano_entrega_unidade, '
+            "data_inicio_plano_entregas, data_termino_plano_entregas, "
+            '"cod_SIAPE_unidade_plano", data_insercao) '
+            "VALUES (1, 2, '2023-02-01', '2023-02-28', 99, now())"
+        )
+    assert migracoes.aplicar_migracoes() == [
+        versao for versao, _, _, _ in migracoes.MIGRACOES
+    ]
+    assert migracoes.aplicar_migracoes() == []
+
+    inspector = inspect(engine)
+    for tabela in Base.metadata.sorted_tables:
+        assert {coluna["name"] for coluna in inspector.get_columns(tabela.name)} == set(
+            tabela.columns.keys()
+        )
+        assert {indice["name"] for indice in inspector.get_indexes(tabela.name)} >= {
+            indice.name for indice in tabela.indexes
+        }
+    with engine.connect() as connection:
+        assert (
+            connection.execute(
+                text(
+                    "SELECT count(*) FROM pg_constraint WHERE conname IN "
+                    "('_plano_trabalho_periodo_excl', "
+                    "'_plano_entregas_periodo_excl')"
+                )
+            ).scalar()
+            == 2
+        )
+        assert connection.execute(
+            text(
+                "SELECT cancelado, periodo_plano_entregas IS NOT NULL "
+                "FROM plano_entregas WHERE id_plano_entrega_unidade = 1"
+            )
+        ).one() == (None, True)
+    with Session(engine) as session:
+        planos = session.scalars(select(models.PlanoEntregas)).unique().all()
+        assert len(planos) == 2
+        for plano in planos:
+            assert plano.hash_conteudo == content_hash(
+                schemas.PlanoEntregasSchema.model_validate(plano)
+            )
+    with engine.connect() as connection:
+        assert (
+            connection.execute(
+                text(
+                    "SELECT quantidade_entregas FROM agregado_plano_entregas "
+                    "WHERE id_plano_entrega_unidade = 1"
+                )
+            ).scalar()
+            == 0
+        )
+
+
+def test_aplicar_migracoes_planos_sobrepostos(banco_anterior):
+    """Verifica se a criação das restrições de exclusão é interrompida,
+    com a lista dos planos em conflito, quando já houver planos
+    sobrepostos, e se as migrações prosseguem após a correção.
+    """
+    with banco_anterior.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO plano_entregas "
+            '("cod_SIAPE_instituidora", id_plano_entrega_unidade, '
+            "data_inicio_plano_entregas, data_termino_plano_entregas, "
+            '"cod_SIAPE_unidade_plano", data_insercao, cancelado) '
+            "VALUES (1, 2, '2023-01-15', '2023-02-15', 99, now(), NULL), "
+            "(1, 3, '2023-01-15', '2023-02-15', 99, now(), TRUE)"
+        )
+
+    with pytest.raises(RuntimeError, match=r"\(1, 1, 2\)") as excinfo:
+        migracoes.aplicar_migracoes()
+    assert "3)" not in str(excinfo.value)
+    assert [versao for versao, _ in migracoes.migracoes_pendentes()][:1] == [2]
+
+    with banco_anterior.begin() as connection:
+        connection.exec_driver_sql(
+            "UPDATE plano_entregas SET cancelado = TRUE "
+            "WHERE id_plano_entrega_unidade = 2"
+        )
+    assert migracoes.aplicar_migracoes()[:1] == [2]
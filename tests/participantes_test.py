@@ -1,12 +1,20 @@
 """
 Testes relacionados aos status de participantes.
 """
+import json
+import logging
+import time
+
 from httpx import Client
 
 from fastapi import status
 
 import pytest
 
+import consultas_lentas
+import crud
+from consultas_lentas import LimiteTaxa
+
 # Relação de campos obrigatórios para testar sua ausência:
 fields_participantes = {
     "optional": (["matricula_siape"],),
@@ -217,6 +225,77 @@ def test_get_participante(
     assert response.status_code == status.HTTP_200_OK
 
 
+def test_get_participante_if_none_match(
+    truncate_participantes,  # pylint: disable=unused-argument
+    example_part,  # pylint: disable=unused-argument
+    user1_credentials: dict,
+    header_usr_1: dict,
+    input_part: dict,
+    client: Client,
+):
+    """Consulta os status de um participante informando a ETag já
+    conhecida, antes e depois do envio de um novo status."""
+    url = (
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        f"/participante/{input_part['cpf_participante']}"
+    )
+    etag = client.get(url, headers=header_usr_1).headers["ETag"]
+
+    response = client.get(url, headers={**header_usr_1, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    client.put(url, json={"lista_status": [input_part]}, headers=header_usr_1)
+    response = client.get(url, headers={**header_usr_1, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["ETag"] != etag
+
+
+def test_get_participante_consulta_lenta(
+    truncate_participantes,  # pylint: disable=unused-argument
+    example_part,  # pylint: disable=unused-argument
+    user1_credentials: dict,
+    header_usr_1: dict,
+    input_part: dict,
+    client: Client,
+    caplog: pytest.LogCaptureFixture,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """Registra todas as consultas como lentas e verifica se o registro
+    traz o plano de execução e os CPFs mascarados."""
+    monkeypatch.setattr(consultas_lentas, "SLOW_QUERY_THRESHOLD_MS", 1e-6)
+    monkeypatch.setattr(consultas_lentas, "SLOW_QUERY_EXPLAIN_SAMPLE_RATE", 1)
+    monkeypatch.setattr(consultas_lentas, "limite_explain", LimiteTaxa(100))
+    monkeypatch.setattr(consultas_lentas, "limite_registros", LimiteTaxa(100))
+    caplog.set_level(logging.WARNING, logger="consultas_lentas")
+
+    response = client.get(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        f"/participante/{input_part['cpf_participante']}",
+        headers=header_usr_1,
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    for _ in range(50):
+        registros = [
+            json.loads(record.getMessage())
+            for record in caplog.records
+            if record.name == "consultas_lentas"
+        ]
+        if any("plano" in registro for registro in registros):
+            break
+        time.sleep(0.1)
+    registro = next(registro for registro in registros if "plano" in registro)
+    assert registro["funcao"] in (
+        "get_status_participante",
+        "get_versao_status_participante",
+    )
+    assert "Execution Time" in registro["plano"][0]
+    assert input_part["cpf_participante"] not in caplog.text
+    assert f"*********{input_part['cpf_participante'][-2:]}" in json.dumps(
+        registro["parametros"]
+    )
+
+
 def test_get_participante_inexistente(
     user1_credentials: dict, header_usr_1: dict, client: Client
 ):
@@ -430,3 +509,102 @@ def test_put_part_invalid_jornada_trabalho_semanal(
         for message in detail_messages
         for error in response.json().get("detail")
     )
+
+
+def test_post_varios_participantes(
+    truncate_participantes,  # pylint: disable=unused-argument
+    input_part: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+):
+    """Testa o envio dos status de vários participantes em uma única
+    requisição."""
+    outro_part = input_part.copy()
+    outro_part["cpf_participante"] = "82893311776"
+    outro_part["matricula_siape"] = "7654321"
+    lista_status = [input_part, outro_part]
+
+    response = client.post(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        "/participantes",
+        json={"lista_status": lista_status},
+        headers=header_usr_1,
+    )
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json() == {"lista_status": lista_status}
+
+    for status_participante in lista_status:
+        response = client.get(
+            f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+            f"/participante/{status_participante['cpf_participante']}",
+            headers=header_usr_1,
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"lista_status": [status_participante]}
+
+
+def test_post_varios_participantes_copy(
+    truncate_participantes,  # pylint: disable=unused-argument
+    input_part: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """Testa o envio dos status de vários participantes gravados com o
+    comando COPY, usado para listas grandes."""
+    monkeypatch.setattr(crud, "STATUS_PARTICIPANTE_COPY_THRESHOLD", 1)
+    lista_status = []
+    for matricula in range(3):
+        status_participante = input_part.copy()
+        status_participante["matricula_siape"] = str(1234567 + matricula)
+        lista_status.append(status_participante)
+
+    response = client.post(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        "/participantes",
+        json={"lista_status": lista_status},
+        headers=header_usr_1,
+    )
+
+    assert response.status_code == status.HTTP_201_CREATED
+    response = client.get(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        f"/participante/{input_part['cpf_participante']}",
+        headers=header_usr_1,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()["lista_status"]) == 3
+
+
+def test_post_varios_participantes_inconsistent(
+    truncate_participantes,  # pylint: disable=unused-argument
+    input_part: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+):
+    """Tenta enviar status de participantes de outra unidade instituidora
+    junto com os da unidade informada na URL. Nenhum deve ser gravado."""
+    outro_part = input_part.copy()
+    outro_part["cod_SIAPE_instituidora"] = 2
+
+    response = client.post(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        "/participantes",
+        json={"lista_status": [input_part, outro_part]},
+        headers=header_usr_1,
+    )
+
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    detail_msg = "Parâmetro cod_SIAPE_instituidora na URL e no JSON devem ser iguais"
+    assert response.json().get("detail", None) == detail_msg
+
+    response = client.get(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        f"/participante/{input_part['cpf_participante']}",
+        headers=header_usr_1,
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -1,6 +1,7 @@
 """
 Testes relacionados ao Plano de Entregas da Unidade
 """
+import json
 from datetime import date
 
 from httpx import Client
@@ -163,6 +164,39 @@ def test_update_plano_entregas(
     assert response.json()["data_avaliacao_plano_entregas"] == "2023-08-15"
 
 
+def test_update_plano_entregas_somente_diferencas(
+    truncate_pe,  # pylint: disable=unused-argument
+    example_pe,  # pylint: disable=unused-argument
+    input_pe: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+):
+    """Atualiza um Plano de Entregas existente e verifica se somente as
+    linhas alteradas foram gravadas."""
+    url = (
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        f"/plano_entregas/{input_pe['id_plano_entrega_unidade']}"
+    )
+    # reenvio sem alterações
+    response = client.put(url, json=input_pe, headers=header_usr_1)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["X-Linhas-Alteradas"] == "0"
+
+    # alteração de uma entrega e remoção de outra, além da atualização do
+    # hash do conteúdo no plano
+    input_pe["entregas"][0]["nome_entrega"] = "Entrega alterada"
+    input_pe["entregas"] = input_pe["entregas"][:1]
+    response = client.put(url, json=input_pe, headers=header_usr_1)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["X-Linhas-Alteradas"] == "3"
+
+    response = client.get(url, headers=header_usr_1)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()["entregas"]) == 1
+    assert response.json()["entregas"][0]["nome_entrega"] == "Entrega alterada"
+
+
 @pytest.mark.parametrize("omitted_fields", enumerate(fields_entrega["optional"]))
 def test_create_plano_entregas_entrega_omit_optional_fields(
     truncate_pe,  # pylint: disable=unused-argument
@@ -957,3 +991,247 @@ def test_create_pe_invalid_avaliacao(
             f"Value error, {detail_message}" in error["msg"]
             for error in response.json().get("detail")
         )
+
+
+# Envio em lote
+
+
+def test_create_planos_entregas_lote(
+    truncate_pe,  # pylint: disable=unused-argument
+    input_pe: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+):
+    """Cria vários Planos de Entregas em um único envio no formato NDJSON
+    e confere se foram persistidos com as suas entregas.
+    """
+    planos_entregas = []
+    for offset in range(3):
+        plano_entregas = input_pe.copy()
+        plano_entregas["id_plano_entrega_unidade"] = 1 + offset
+        plano_entregas["cod_SIAPE_unidade_plano"] = 99 + offset
+        planos_entregas.append(plano_entregas)
+
+    response = client.post(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        "/planos_entregas",
+        content="\n".join(json.dumps(plano) for plano in planos_entregas),
+        headers={**header_usr_1, "Content-Type": "application/x-ndjson"},
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["quantidade_gravada"] == 3
+    assert all(
+        resultado["status_code"] == status.HTTP_201_CREATED
+        for resultado in response.json()["resultados"]
+    )
+
+    for plano_entregas in planos_entregas:
+        response = client.get(
+            f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+            f"/plano_entregas/{plano_entregas['id_plano_entrega_unidade']}",
+            headers=header_usr_1,
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert_equal_plano_entregas(response.json(), plano_entregas)
+
+
+def test_update_planos_entregas_lote(
+    truncate_pe,  # pylint: disable=unused-argument
+    example_pe,  # pylint: disable=unused-argument
+    input_pe: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+):
+    """Atualiza um Plano de Entregas existente por meio do envio em lote,
+    alterando, removendo e incluindo entregas.
+    """
+    input_pe["entregas"][0]["nome_entrega"] = "entrega alterada"
+    nova_entrega = input_pe["entregas"][1].copy()
+    nova_entrega["id_entrega"] = 3
+    input_pe["entregas"] = [input_pe["entregas"][0], nova_entrega]
+    sobreposto = input_pe.copy()
+    sobreposto["id_plano_entrega_unidade"] = 2
+
+    response = client.post(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        "/planos_entregas",
+        content=f"{json.dumps(input_pe)}\n{json.dumps(sobreposto)}\n",
+        headers={**header_usr_1, "Content-Type": "application/x-ndjson"},
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [
+        resultado["status_code"] for resultado in response.json()["resultados"]
+    ] == [status.HTTP_200_OK, status.HTTP_422_UNPROCESSABLE_ENTITY]
+    detail_msg = (
+        "Já existe um plano de entregas para este "
+        "cod_SIAPE_unidade_plano no período informado."
+    )
+    assert response.json()["resultados"][1]["detail"] == detail_msg
+
+    response = client.get(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        f"/plano_entregas/{input_pe['id_plano_entrega_unidade']}",
+        headers=header_usr_1,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert {entrega["id_entrega"] for entrega in response.json()["entregas"]} == {
+        1,
+        3,
+    }
+    assert_equal_plano_entregas(response.json(), input_pe)
+
+
+def test_list_planos_entregas_paginado(
+    truncate_pe,  # pylint: disable=unused-argument
+    input_pe: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+):
+    """Lista os planos de entregas em páginas e com filtros."""
+    url = f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+    planos_entregas = []
+    for offset in range(3):
+        plano_entregas = input_pe.copy()
+        plano_entregas["id_plano_entrega_unidade"] = 1 + offset
+        plano_entregas["cod_SIAPE_unidade_plano"] = 99 + offset
+        plano_entregas["cancelado"] = offset == 2
+        planos_entregas.append(plano_entregas)
+    client.post(
+        f"{url}/planos_entregas",
+        content="\n".join(json.dumps(plano) for plano in planos_entregas),
+        headers={**header_usr_1, "Content-Type": "application/x-ndjson"},
+    )
+
+    response = client.get(
+        f"{url}/planos_entregas", params={"limite": 2}, headers=header_usr_1
+    )
+    assert response.status_code == status.HTTP_200_OK
+    pagina = response.json()
+    assert [item["id_plano_entrega_unidade"] for item in pagina["itens"]] == [1, 2]
+    assert "entregas" not in pagina["itens"][0]
+    response = client.get(
+        f"{url}/planos_entregas",
+        params={"limite": 2, "cursor": pagina["proximo_cursor"]},
+        headers=header_usr_1,
+    )
+    pagina = response.json()
+    assert [item["id_plano_entrega_unidade"] for item in pagina["itens"]] == [3]
+    assert pagina["proximo_cursor"] is None
+
+    response = client.get(
+        f"{url}/planos_entregas",
+        params={"cancelado": False, "cod_SIAPE_unidade_plano": 100, "completo": True},
+        headers=header_usr_1,
+    )
+    itens = response.json()["itens"]
+    assert [item["id_plano_entrega_unidade"] for item in itens] == [2]
+    assert_equal_plano_entregas(itens[0], planos_entregas[1])
+
+
+def test_agregados_plano_entregas(
+    truncate_pe,  # pylint: disable=unused-argument
+    truncate_pt,  # pylint: disable=unused-argument
+    input_pe: dict,
+    input_pt: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+):
+    """Testa a manutenção das horas vinculadas às entregas e da média do
+    progresso realizado a cada gravação de planos de trabalho e de
+    planos de entregas."""
+    url = f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+    url_agregados = (
+        f"{url}/plano_entregas/{input_pe['id_plano_entrega_unidade']}/agregados"
+    )
+
+    def horas_entregas() -> dict[int, tuple[int, int]]:
+        response = client.get(url_agregados, headers=header_usr_1)
+        assert response.status_code == status.HTTP_200_OK
+        return {
+            entrega["id_entrega"]: (
+                entrega["horas_vinculadas"],
+                entrega["quantidade_contribuicoes"],
+            )
+            for entrega in response.json()["entregas"]
+        }
+
+    response = client.get(url_agregados, headers=header_usr_1)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    client.put(
+        f"{url}/plano_entregas/{input_pe['id_plano_entrega_unidade']}",
+        json=input_pe,
+        headers=header_usr_1,
+    )
+    response = client.get(url_agregados, headers=header_usr_1)
+    assert response.json()["horas_vinculadas"] == 0
+    client.put(
+        f"{url}/plano_trabalho/{input_pt['id_plano_trabalho_participante']}",
+        json=input_pt,
+        headers=header_usr_1,
+    )
+    response = client.get(url_agregados, headers=header_usr_1)
+    agregados = response.json()
+    assert agregados["quantidade_entregas"] == len(input_pe["entregas"])
+    assert agregados["media_percentual_progresso_realizado"] == 87.5
+    assert agregados["horas_vinculadas"] == 40
+    assert horas_entregas() == {1: (40, 1), 2: (0, 0)}
+
+    outro_pt = {
+        **input_pt,
+        "id_plano_trabalho_participante": input_pt["id_plano_trabalho_participante"]
+        + 1,
+        "data_inicio_plano": "2023-02-01",
+        "data_termino_plano": "2023-02-15",
+        "consolidacoes": [],
+    }
+    client.put(
+        f"{url}/plano_trabalho/{outro_pt['id_plano_trabalho_participante']}",
+        json=outro_pt,
+        headers=header_usr_1,
+    )
+    assert horas_entregas() == {1: (80, 2), 2: (0, 0)}
+
+    # o cancelamento retira as horas do plano de trabalho
+    client.put(
+        f"{url}/plano_trabalho/{input_pt['id_plano_trabalho_participante']}",
+        json={**input_pt, "cancelado": True},
+        headers=header_usr_1,
+    )
+    assert horas_entregas() == {1: (40, 1), 2: (0, 0)}
+
+    # o reenvio do plano de entregas mantém as horas
+    entregas = [
+        {**entrega, "percentual_progresso_realizado": None}
+        for entrega in input_pe["entregas"]
+    ]
+    client.put(
+        f"{url}/plano_entregas/{input_pe['id_plano_entrega_unidade']}",
+        json={**input_pe, "entregas": entregas},
+        headers=header_usr_1,
+    )
+    response = client.get(url_agregados, headers=header_usr_1)
+    assert response.json()["media_percentual_progresso_realizado"] is None
+    assert horas_entregas() == {1: (40, 1), 2: (0, 0)}
+
+    response = client.get(
+        f"{url}/agregados/horas",
+        params={"data_inicio": "2023-06-01", "data_termino": "2023-06-30"},
+        headers=header_usr_1,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {
+            "cod_SIAPE_unidade_plano": input_pe["cod_SIAPE_unidade_plano"],
+            "mes": "2023-06-01",
+            "quantidade_entregas": 2,
+            "horas_vinculadas": 40,
+            "quantidade_contribuicoes": 1,
+        }
+    ]
@@ -1,13 +1,22 @@
 """
 Testes relacionados ao plano de trabalho do participante.
 """
+import csv
+import io
+import json
+import time
 from datetime import date, timedelta
 
 from httpx import Client
 from fastapi import status
+from sqlalchemy import text
 
 import pytest
 
+import cache
+import crud
+import db_config
+from db_config import sync_engine
 from util import over_a_year
 
 # grupos de campos opcionais e obrigatórios a testar
@@ -194,6 +203,39 @@ def test_update_plano_trabalho(
     assert_equal_plano_trabalho(response.json(), input_pt)
 
 
+def test_update_plano_trabalho_somente_diferencas(
+    truncate_pe,  # pylint: disable=unused-argument
+    truncate_pt,  # pylint: disable=unused-argument
+    example_pe,  # pylint: disable=unused-argument
+    example_pt,  # pylint: disable=unused-argument
+    input_pt: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+):
+    """Atualiza um Plano de Trabalho existente e verifica se somente as
+    linhas alteradas foram gravadas."""
+    url = (
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        f"/plano_trabalho/{input_pt['id_plano_trabalho_participante']}"
+    )
+    # reenvio sem alterações
+    response = client.put(url, json=input_pt, headers=header_usr_1)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["X-Linhas-Alteradas"] == "0"
+
+    # alteração de uma contribuição: a antiga é apagada e a nova inserida,
+    # além da atualização do hash do conteúdo no plano
+    input_pt["contribuicoes"][0]["horas_vinculadas"] += 1
+    response = client.put(url, json=input_pt, headers=header_usr_1)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["X-Linhas-Alteradas"] == "3"
+
+    response = client.get(url, headers=header_usr_1)
+    assert response.status_code == status.HTTP_200_OK
+    assert_equal_plano_trabalho(response.json(), input_pt)
+
+
 @pytest.mark.parametrize(
     "tipo_contribuicao, id_entrega",
     [
@@ -616,6 +658,52 @@ def test_create_plano_trabalho_overlapping_date_interval(
         assert_equal_plano_trabalho(response.json(), input_pt)
 
 
+def test_reativar_plano_trabalho_cancelado_sobreposto(
+    truncate_pe,  # pylint: disable=unused-argument
+    truncate_pt,  # pylint: disable=unused-argument
+    example_pe,  # pylint: disable=unused-argument
+    input_pt: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+):
+    """Tenta reativar um plano de trabalho cancelado cujo período passou a
+    se sobrepor ao de outro plano de trabalho do mesmo participante, criado
+    enquanto ele estava cancelado.
+    """
+    url = (
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        "/plano_trabalho/{}"
+    )
+    cancelado = {**input_pt, "cancelado": True}
+    response = client.put(
+        url.format(cancelado["id_plano_trabalho_participante"]),
+        json=cancelado,
+        headers=header_usr_1,
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    sobreposto = {**input_pt, "id_plano_trabalho_participante": 556}
+    response = client.put(
+        url.format(sobreposto["id_plano_trabalho_participante"]),
+        json=sobreposto,
+        headers=header_usr_1,
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = client.put(
+        url.format(input_pt["id_plano_trabalho_participante"]),
+        json=input_pt,
+        headers=header_usr_1,
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert response.json().get("detail", None) == (
+        "Já existe um plano de trabalho para este "
+        "cod_SIAPE_unidade_exercicio para este cpf_participante "
+        "no período informado."
+    )
+
+
 @pytest.mark.parametrize(
     "data_inicio_plano, data_termino_plano",
     [
@@ -710,6 +798,236 @@ def test_get_plano_trabalho(
     assert_equal_plano_trabalho(response.json(), input_pt)
 
 
+def test_get_plano_trabalho_if_none_match(
+    input_pt: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    truncate_pt,  # pylint: disable=unused-argument
+    example_pt,  # pylint: disable=unused-argument
+    client: Client,
+):
+    """Consulta um Plano de Trabalho informando a ETag já conhecida e
+    verifica se a resposta tem o código 304, sem corpo."""
+    url = (
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        f"/plano_trabalho/{input_pt['id_plano_trabalho_participante']}"
+    )
+    response = client.get(url, headers=header_usr_1)
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers["ETag"]
+    assert "Last-Modified" in response.headers
+
+    response = client.get(url, headers={**header_usr_1, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["ETag"] == etag
+    assert not response.content
+
+    response = client.get(
+        url, headers={**header_usr_1, "If-None-Match": '"outra-versao"'}
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_get_plano_trabalho_if_none_match_sem_carregar(
+    input_pt: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    truncate_pt,  # pylint: disable=unused-argument
+    example_pt,  # pylint: disable=unused-argument
+    client: Client,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """Com o cache vazio, responde 304 a uma consulta condicional sem
+    carregar o Plano de Trabalho do banco de dados."""
+    url = (
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        f"/plano_trabalho/{input_pt['id_plano_trabalho_participante']}"
+    )
+    response = client.get(url, headers=header_usr_1)
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers["ETag"]
+
+    async def nao_carregar(*args, **kwargs):
+        raise AssertionError("plano carregado desnecessariamente")
+
+    cache.limpar()
+    monkeypatch.setattr(crud, "get_plano_trabalho", nao_carregar)
+    response = client.get(url, headers={**header_usr_1, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["ETag"] == etag
+    assert not response.content
+
+
+def test_update_plano_trabalho_if_match(
+    input_pt: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    truncate_pe,  # pylint: disable=unused-argument
+    truncate_pt,  # pylint: disable=unused-argument
+    example_pe,  # pylint: disable=unused-argument
+    example_pt,  # pylint: disable=unused-argument
+    client: Client,
+):
+    """Atualiza um Plano de Trabalho informando o cabeçalho If-Match com
+    uma versão desatualizada e com a versão atual."""
+    url = (
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        f"/plano_trabalho/{input_pt['id_plano_trabalho_participante']}"
+    )
+    etag = client.get(url, headers=header_usr_1).headers["ETag"]
+    input_pt["carga_horaria_total_periodo_plano"] = 100
+
+    response = client.put(
+        url, json=input_pt, headers={**header_usr_1, "If-Match": '"outra-versao"'}
+    )
+    assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+
+    response = client.put(
+        url, json=input_pt, headers={**header_usr_1, "If-Match": etag}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["ETag"] != etag
+    assert client.get(url, headers=header_usr_1).headers["ETag"] == (
+        response.headers["ETag"]
+    )
+
+
+def test_get_plano_trabalho_cache_negativo(
+    input_pt: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    truncate_pe,  # pylint: disable=unused-argument
+    truncate_pt,  # pylint: disable=unused-argument
+    example_pe,  # pylint: disable=unused-argument
+    client: Client,
+):
+    """Consulta um Plano de Trabalho inexistente, o que grava a ausência
+    no cache, e verifica se ele é encontrado logo após ser criado."""
+    url = (
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        f"/plano_trabalho/{input_pt['id_plano_trabalho_participante']}"
+    )
+    response = client.get(url, headers=header_usr_1)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = client.put(url, json=input_pt, headers=header_usr_1)
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = client.get(url, headers=header_usr_1)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["cpf_participante"] == input_pt["cpf_participante"]
+
+
+def test_get_plano_trabalho_cache_notificacao(
+    input_pt: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    truncate_pt,  # pylint: disable=unused-argument
+    example_pt,  # pylint: disable=unused-argument
+    client: Client,
+):
+    """Altera um Plano de Trabalho fora deste processo da API e verifica
+    se a notificação de alteração remove o plano do cache."""
+    url = (
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        f"/plano_trabalho/{input_pt['id_plano_trabalho_participante']}"
+    )
+    etag = client.get(url, headers=header_usr_1).headers["ETag"]
+
+    with sync_engine.begin() as connection:
+        connection.execute(
+            text(
+                "UPDATE plano_trabalho SET hash_conteudo = 'outra-versao' "
+                'WHERE "cod_SIAPE_instituidora" = :cod '
+                "AND id_plano_trabalho_participante = :id"
+            ),
+            {
+                "cod": user1_credentials["cod_SIAPE_instituidora"],
+                "id": input_pt["id_plano_trabalho_participante"],
+            },
+        )
+        connection.execute(
+            text("SELECT pg_notify(:canal, :conteudo)"),
+            {
+                "canal": cache.CANAL,
+                "conteudo": cache.chave_notificacao(
+                    "plano_trabalho",
+                    user1_credentials["cod_SIAPE_instituidora"],
+                    input_pt["id_plano_trabalho_participante"],
+                ),
+            },
+        )
+
+    for _ in range(50):
+        if client.get(url, headers=header_usr_1).headers["ETag"] != etag:
+            break
+        time.sleep(0.1)
+    assert client.get(url, headers=header_usr_1).headers["ETag"] == (
+        '"outra-versao"'
+    )
+
+
+def test_get_plano_trabalho_replica(
+    input_pt: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    truncate_pe,  # pylint: disable=unused-argument
+    truncate_pt,  # pylint: disable=unused-argument
+    example_pe,  # pylint: disable=unused-argument
+    example_pt,  # pylint: disable=unused-argument
+    client: Client,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """Verifica se as consultas vão à réplica de leitura, exceto logo após
+    uma gravação do mesmo cliente ou com o cabeçalho X-Ler-Primario."""
+    client.cookies.clear()
+    sessoes_replica = []
+
+    def replica_session_maker():
+        sessoes_replica.append(1)
+        return db_config.async_session_maker()
+
+    monkeypatch.setattr(db_config, "replica_session_makers", [replica_session_maker])
+    cache.limpar()
+    url = (
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        f"/plano_trabalho/{input_pt['id_plano_trabalho_participante']}"
+    )
+    response = client.get(url, headers=header_usr_1)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(sessoes_replica) == 1
+
+    input_pt["carga_horaria_total_periodo_plano"] = 100
+    response = client.put(url, json=input_pt, headers=header_usr_1)
+    assert response.status_code == status.HTTP_200_OK
+    response = client.get(url, headers=header_usr_1)
+    assert response.json()["carga_horaria_total_periodo_plano"] == 100
+    assert len(sessoes_replica) == 1
+
+    # O registro da gravação viaja com o cliente, e vale em qualquer
+    # processo da API enquanto estiver na janela de leitura no primário
+    ultima_escrita = client.cookies[db_config.COOKIE_ULTIMA_ESCRITA]
+    client.cookies.clear()
+    client.cookies.set(db_config.COOKIE_ULTIMA_ESCRITA, ultima_escrita)
+    cache.limpar()
+    response = client.get(url, headers=header_usr_1)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(sessoes_replica) == 1
+
+    cache.limpar()
+    response = client.get(url, headers={**header_usr_1, "X-Ler-Primario": "true"})
+    assert response.status_code == status.HTTP_200_OK
+    assert len(sessoes_replica) == 1
+
+    cache.limpar()
+    antiga = time.time() - db_config.READ_YOUR_WRITES_SECONDS - 1
+    client.cookies.set(db_config.COOKIE_ULTIMA_ESCRITA, f"{antiga:.3f}")
+    response = client.get(url, headers=header_usr_1)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(sessoes_replica) == 2
+    client.cookies.clear()
+
+
 def test_get_pt_inexistente(
     user1_credentials: dict, header_usr_1: dict, client: Client
 ):
@@ -1207,3 +1525,405 @@ def test_put_plano_trabalho_invalid_cpf(
         for message in detail_messages
         for error in response.json().get("detail")
     )
+
+
+# Envio em lote
+
+
+def test_create_planos_trabalho_lote(
+    truncate_pe,  # pylint: disable=unused-argument
+    truncate_pt,  # pylint: disable=unused-argument
+    example_pe,  # pylint: disable=unused-argument
+    input_pt: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+):
+    """Cria vários Planos de Trabalho em um único envio no formato NDJSON
+    e confere se foram persistidos.
+    """
+    planos_trabalho = []
+    for offset in range(3):
+        plano_trabalho = input_pt.copy()
+        plano_trabalho["id_plano_trabalho_participante"] = 555 + offset
+        plano_trabalho["cod_SIAPE_unidade_exercicio"] = 99 + offset
+        planos_trabalho.append(plano_trabalho)
+
+    response = client.post(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        "/planos_trabalho",
+        content="\n".join(json.dumps(plano) for plano in planos_trabalho),
+        headers={**header_usr_1, "Content-Type": "application/x-ndjson"},
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["quantidade_gravada"] == 3
+    assert all(
+        resultado["status_code"] == status.HTTP_201_CREATED
+        for resultado in response.json()["resultados"]
+    )
+
+    for plano_trabalho in planos_trabalho:
+        response = client.get(
+            f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+            f"/plano_trabalho/{plano_trabalho['id_plano_trabalho_participante']}",
+            headers=header_usr_1,
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert_equal_plano_trabalho(response.json(), plano_trabalho)
+
+
+def test_create_planos_trabalho_lote_resultado_por_item(
+    truncate_pe,  # pylint: disable=unused-argument
+    truncate_pt,  # pylint: disable=unused-argument
+    example_pe,  # pylint: disable=unused-argument
+    example_pt,  # pylint: disable=unused-argument
+    input_pt: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+):
+    """Envia um lote com itens válidos e inválidos e verifica se cada
+    linha recebe o seu próprio resultado, sem impedir a gravação das
+    demais.
+    """
+    # substitui o plano de trabalho criado por example_pt
+    atualizado = input_pt.copy()
+    atualizado["carga_horaria_total_periodo_plano"] = 40
+    # sobrepõe o período do plano de trabalho atualizado
+    sobreposto = input_pt.copy()
+    sobreposto["id_plano_trabalho_participante"] = 556
+    # CPF inválido
+    invalido = input_pt.copy()
+    invalido["id_plano_trabalho_participante"] = 557
+    invalido["cpf_participante"] = "11111111111"
+    # outra unidade instituidora
+    outra_unidade = input_pt.copy()
+    outra_unidade["id_plano_trabalho_participante"] = 558
+    outra_unidade["cod_SIAPE_instituidora"] = 2
+
+    linhas = [json.dumps(plano) for plano in (atualizado, sobreposto, invalido)]
+    linhas.append("{ json inválido")
+    linhas.append(json.dumps(outra_unidade))
+    response = client.post(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        "/planos_trabalho",
+        content="\n".join(linhas),
+        headers={**header_usr_1, "Content-Type": "application/x-ndjson"},
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["quantidade_recebida"] == 5
+    assert response.json()["quantidade_gravada"] == 1
+    assert [
+        (resultado["linha"], resultado["status_code"])
+        for resultado in response.json()["resultados"]
+    ] == [
+        (1, status.HTTP_200_OK),
+        (2, status.HTTP_422_UNPROCESSABLE_ENTITY),
+        (3, status.HTTP_422_UNPROCESSABLE_ENTITY),
+        (4, status.HTTP_422_UNPROCESSABLE_ENTITY),
+        (5, status.HTTP_422_UNPROCESSABLE_ENTITY),
+    ]
+    detail_msg = (
+        "Já existe um plano de trabalho para este "
+        "cod_SIAPE_unidade_exercicio para este cpf_participante "
+        "no período informado."
+    )
+    assert response.json()["resultados"][1]["detail"] == detail_msg
+
+    response = client.get(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        f"/plano_trabalho/{input_pt['id_plano_trabalho_participante']}",
+        headers=header_usr_1,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["carga_horaria_total_periodo_plano"] == 40
+
+
+def test_create_planos_trabalho_lote_unidade_nao_permitida(
+    input_pt: dict,
+    header_usr_1: dict,
+    client: Client,
+):
+    """Tenta enviar um lote de Planos de Trabalho para uma organização na
+    qual o usuário não está autorizado.
+    """
+    response = client.post(
+        "/organizacao/2/planos_trabalho",  # só está autorizado na organização 1
+        content=json.dumps(input_pt),
+        headers={**header_usr_1, "Content-Type": "application/x-ndjson"},
+    )
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    detail_message = "Usuário não tem permissão na cod_SIAPE_instituidora informada"
+    assert detail_message in response.json().get("detail")
+
+
+def test_list_planos_trabalho_paginado(
+    truncate_pe,  # pylint: disable=unused-argument
+    truncate_pt,  # pylint: disable=unused-argument
+    example_pe,  # pylint: disable=unused-argument
+    input_pt: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+):
+    """Lista os planos de trabalho em páginas, na ordem da última
+    modificação, e com filtros.
+    """
+    url = f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+    planos_trabalho = []
+    for offset in range(5):
+        plano_trabalho = input_pt.copy()
+        plano_trabalho["id_plano_trabalho_participante"] = 555 + offset
+        plano_trabalho["cod_SIAPE_unidade_exercicio"] = 99 + offset
+        planos_trabalho.append(plano_trabalho)
+    response = client.post(
+        f"{url}/planos_trabalho",
+        content="\n".join(json.dumps(plano) for plano in planos_trabalho),
+        headers={**header_usr_1, "Content-Type": "application/x-ndjson"},
+    )
+    assert response.json()["quantidade_gravada"] == 5
+    # o plano alterado passa a ser o último da listagem
+    alterado = {**planos_trabalho[0], "carga_horaria_total_periodo_plano": 100}
+    response = client.put(
+        f"{url}/plano_trabalho/555", json=alterado, headers=header_usr_1
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    ids = []
+    params = {"limite": 2}
+    while True:
+        response = client.get(
+            f"{url}/planos_trabalho", params=params, headers=header_usr_1
+        )
+        assert response.status_code == status.HTTP_200_OK
+        pagina = response.json()
+        assert len(pagina["itens"]) <= 2
+        assert "contribuicoes" not in pagina["itens"][0]
+        ids.extend(item["id_plano_trabalho_participante"] for item in pagina["itens"])
+        if pagina["proximo_cursor"] is None:
+            break
+        params["cursor"] = pagina["proximo_cursor"]
+    assert ids == [556, 557, 558, 559, 555]
+
+    response = client.get(
+        f"{url}/planos_trabalho",
+        params={"cod_SIAPE_unidade_exercicio": 101, "completo": True},
+        headers=header_usr_1,
+    )
+    itens = response.json()["itens"]
+    assert [item["id_plano_trabalho_participante"] for item in itens] == [557]
+    assert_equal_plano_trabalho(itens[0], planos_trabalho[2])
+
+    response = client.get(
+        f"{url}/planos_trabalho",
+        params={"data_inicio": "2099-01-01", "cancelado": False},
+        headers=header_usr_1,
+    )
+    assert response.json() == {"itens": [], "proximo_cursor": None}
+
+    response = client.get(
+        f"{url}/planos_trabalho", params={"cursor": "invalido"}, headers=header_usr_1
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_feed_alteracoes(
+    truncate_pe,  # pylint: disable=unused-argument
+    truncate_pt,  # pylint: disable=unused-argument
+    example_pe,  # pylint: disable=unused-argument
+    input_pt: dict,
+    input_part: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+):
+    """Lê o feed de alterações até o fim e verifica se as gravações
+    seguintes aparecem nele, com a versão (ETag) de cada recurso.
+    """
+    url = f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+    params = {"limite": 1000}
+    while True:
+        response = client.get(f"{url}/alteracoes", params=params, headers=header_usr_1)
+        assert response.status_code == status.HTTP_200_OK
+        feed = response.json()
+        params["desde"] = feed["proximo_cursor"]
+        if not feed["tem_mais"]:
+            break
+
+    response = client.put(
+        f"{url}/plano_trabalho/555", json=input_pt, headers=header_usr_1
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    versao_plano = response.headers["ETag"]
+    # reenvio sem alteração não é registrado
+    client.put(f"{url}/plano_trabalho/555", json=input_pt, headers=header_usr_1)
+    response = client.put(
+        f"{url}/participante/{input_part['cpf_participante']}",
+        json={"lista_status": [input_part]},
+        headers=header_usr_1,
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    versao_participante = client.get(
+        f"{url}/participante/{input_part['cpf_participante']}",
+        headers=header_usr_1,
+    ).headers["ETag"]
+
+    params["limite"] = 1
+    response = client.get(f"{url}/alteracoes", params=params, headers=header_usr_1)
+    feed = response.json()
+    assert [(item["tipo"], item["chave"]) for item in feed["itens"]] == [
+        ("plano_trabalho", "555")
+    ]
+    assert feed["itens"][0]["versao"] == versao_plano
+    assert feed["tem_mais"]
+
+    params["desde"] = feed["proximo_cursor"]
+    response = client.get(f"{url}/alteracoes", params=params, headers=header_usr_1)
+    feed = response.json()
+    assert [item["chave"] for item in feed["itens"]] == [input_part["cpf_participante"]]
+    assert feed["itens"][0]["versao"] == versao_participante
+    assert not feed["tem_mais"]
+
+    # sem novas alterações, o cursor se mantém
+    params["desde"] = feed["proximo_cursor"]
+    response = client.get(f"{url}/alteracoes", params=params, headers=header_usr_1)
+    assert response.json() == {
+        "itens": [],
+        "proximo_cursor": params["desde"],
+        "tem_mais": False,
+    }
+
+    response = client.get(
+        f"{url}/alteracoes", params={"desde": "invalido"}, headers=header_usr_1
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_exportar_planos_trabalho(
+    truncate_pe,  # pylint: disable=unused-argument
+    truncate_pt,  # pylint: disable=unused-argument
+    example_pe,  # pylint: disable=unused-argument
+    input_pt: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """Exporta os planos de trabalho em NDJSON, lidos do banco em vários
+    lotes, e verifica se o conteúdo exportado pode ser enviado novamente.
+    """
+    monkeypatch.setattr(crud, "EXPORT_BATCH_SIZE", 2)
+    url = f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+    planos_trabalho = []
+    for offset in range(5):
+        plano_trabalho = input_pt.copy()
+        plano_trabalho["id_plano_trabalho_participante"] = 555 + offset
+        plano_trabalho["cod_SIAPE_unidade_exercicio"] = 99 + offset
+        planos_trabalho.append(plano_trabalho)
+    conteudo = "\n".join(json.dumps(plano) for plano in planos_trabalho)
+    client.post(
+        f"{url}/planos_trabalho",
+        content=conteudo,
+        headers={**header_usr_1, "Content-Type": "application/x-ndjson"},
+    )
+
+    response = client.get(f"{url}/exportacao/planos_trabalho", headers=header_usr_1)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    exportados = [json.loads(linha) for linha in response.text.splitlines()]
+    assert len(exportados) == 5
+    for exportado, plano_trabalho in zip(exportados, planos_trabalho):
+        assert_equal_plano_trabalho(exportado, plano_trabalho)
+
+    response = client.post(
+        f"{url}/planos_trabalho",
+        content=response.content,
+        headers={**header_usr_1, "Content-Type": "application/x-ndjson"},
+    )
+    assert response.json()["quantidade_rejeitada"] == 0
+
+    response = client.get(
+        f"{url}/exportacao/planos_trabalho",
+        params={"formato": "csv"},
+        headers=header_usr_1,
+    )
+    linhas = list(csv.DictReader(io.StringIO(response.text)))
+    assert [int(linha["id_plano_trabalho_participante"]) for linha in linhas] == [
+        555,
+        556,
+        557,
+        558,
+        559,
+    ]
+    assert json.loads(linhas[0]["contribuicoes"]) == exportados[0]["contribuicoes"]
+
+
+def test_resumo_organizacao(
+    truncate_pe,  # pylint: disable=unused-argument
+    truncate_pt,  # pylint: disable=unused-argument
+    truncate_participantes,  # pylint: disable=unused-argument
+    example_pe,  # pylint: disable=unused-argument
+    example_pt,  # pylint: disable=unused-argument
+    example_part,  # pylint: disable=unused-argument
+    input_pt: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """Consulta o resumo da organização, que fica em cache até a próxima
+    gravação da organização."""
+    url = f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+    response = client.get(f"{url}/resumo", headers=header_usr_1)
+    assert response.status_code == status.HTTP_200_OK
+    resumo = response.json()
+    assert resumo["planos_trabalho"] == {"ativos": 1, "cancelados": 0}
+    assert resumo["planos_entregas"] == {"ativos": 1, "cancelados": 0}
+    assert resumo["participantes_ativos_por_modalidade_execucao"] == {
+        "1": 0,
+        "2": 0,
+        "3": 1,
+        "4": 0,
+    }
+    assert resumo["participantes_inativos"] == 0
+    assert resumo["carga_horaria_total_periodo_plano"] == {
+        "quantidade": 1,
+        "minimo": 80,
+        "primeiro_quartil": 80.0,
+        "mediana": 80.0,
+        "terceiro_quartil": 80.0,
+        "maximo": 80,
+        "media": 80.0,
+    }
+    assert resumo["horas_por_tipo_contribuicao"] == {"1": 40, "2": 40, "3": 0}
+    assert resumo["avaliacoes_planos_trabalho"] == {
+        "1": 0,
+        "2": 0,
+        "3": 0,
+        "4": 0,
+        "5": 1,
+    }
+    assert resumo["avaliacoes_planos_entregas"]["5"] == 1
+
+    # sem gravações, o resumo vem do cache
+    async def get_resumo_organizacao(**_):
+        raise AssertionError("O resumo deveria vir do cache")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(crud, "get_resumo_organizacao", get_resumo_organizacao)
+        response = client.get(f"{url}/resumo", headers=header_usr_1)
+        assert response.json() == resumo
+
+    client.put(
+        f"{url}/plano_trabalho/{input_pt['id_plano_trabalho_participante']}",
+        json={**input_pt, "cancelado": True},
+        headers=header_usr_1,
+    )
+    resumo = client.get(f"{url}/resumo", headers=header_usr_1).json()
+    assert resumo["planos_trabalho"] == {"ativos": 0, "cancelados": 1}
+    assert resumo["carga_horaria_total_periodo_plano"]["quantidade"] == 0
+    assert resumo["carga_horaria_total_periodo_plano"]["mediana"] is None
+    assert resumo["horas_por_tipo_contribuicao"] == {"1": 0, "2": 0, "3": 0}
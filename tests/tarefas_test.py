@@ -0,0 +1,275 @@
+"""
+Testes relacionados às tarefas de envio em lote assíncrono.
+"""
+import json
+
+from httpx import Client
+
+from fastapi import status
+from sqlalchemy import text
+
+import pytest
+
+import api
+import crud
+import models
+import worker
+from db_config import DbContextManager, sync_engine
+
+# Os testes usam muitas fixtures, então necessariamente precisam de
+# muitos argumentos. Além disso, algumas fixtures não retornam um valor
+# para ser usado no teste, mas mesmo assim são executadas quando estão
+# presentes como um argumento da função.
+# A linha abaixo desabilita os warnings do Pylint sobre isso.
+# pylint: disable=too-many-arguments
+
+
+def test_create_tarefa_planos_trabalho(
+    truncate_pe,  # pylint: disable=unused-argument
+    truncate_pt,  # pylint: disable=unused-argument
+    truncate_tarefas,  # pylint: disable=unused-argument
+    example_pe,  # pylint: disable=unused-argument
+    input_pt: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+):
+    """Enfileira um envio em lote de planos de trabalho, processa a tarefa
+    e confere o progresso e os erros informados.
+    """
+    planos_trabalho = []
+    for offset in range(3):
+        plano_trabalho = input_pt.copy()
+        plano_trabalho["id_plano_trabalho_participante"] = 555 + offset
+        plano_trabalho["cod_SIAPE_unidade_exercicio"] = 99 + offset
+        planos_trabalho.append(json.dumps(plano_trabalho))
+    planos_trabalho.append('{"id_plano_trabalho_participante": 558}')
+
+    response = client.post(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        "/tarefas/planos_trabalho",
+        content="\n".join(planos_trabalho),
+        headers={**header_usr_1, "Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.json()["situacao"] == "pendente"
+    assert response.json()["quantidade_total"] == 4
+    location = response.headers["Location"]
+
+    assert client.portal.call(worker.processar_proxima_tarefa)
+    assert not client.portal.call(worker.processar_proxima_tarefa)
+
+    response = client.get(location, headers=header_usr_1)
+    assert response.status_code == status.HTTP_200_OK
+    tarefa = response.json()
+    assert tarefa["situacao"] == "concluida"
+    assert tarefa["quantidade_processada"] == 4
+    assert tarefa["quantidade_rejeitada"] == 1
+    assert len(tarefa["erros"]) == 1
+    assert tarefa["erros"][0]["linha"] == 4
+    assert tarefa["erros"][0]["status_code"] == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    response = client.get(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        "/plano_trabalho/556",
+        headers=header_usr_1,
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_create_tarefa_participantes(
+    truncate_participantes,  # pylint: disable=unused-argument
+    truncate_tarefas,  # pylint: disable=unused-argument
+    input_part: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+):
+    """Enfileira um envio em lote de status de participantes e confere se
+    foram gravados após o processamento.
+    """
+    response = client.post(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        "/tarefas/participantes",
+        content="\n".join(json.dumps(input_part) for _ in range(2)),
+        headers={**header_usr_1, "Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+
+    assert client.portal.call(worker.processar_proxima_tarefa)
+
+    response = client.get(response.headers["Location"], headers=header_usr_1)
+    assert response.json()["situacao"] == "concluida"
+    assert response.json()["quantidade_processada"] == 2
+    assert response.json()["quantidade_rejeitada"] == 0
+
+    response = client.get(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        f"/participante/{input_part['cpf_participante']}",
+        headers=header_usr_1,
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_get_tarefa_inexistente(
+    truncate_tarefas,  # pylint: disable=unused-argument
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+):
+    """Consulta uma tarefa que não existe."""
+    response = client.get(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}/tarefa/888",
+        headers=header_usr_1,
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json().get("detail", None) == "Tarefa não encontrada"
+
+
+def test_create_tarefa_unidade_nao_permitida(
+    truncate_tarefas,  # pylint: disable=unused-argument
+    input_part: dict,
+    header_usr_2: dict,
+    client: Client,
+):
+    """Tenta enfileirar uma tarefa em uma organização na qual o usuário
+    não tem permissão.
+    """
+    response = client.post(
+        "/organizacao/1/tarefas/participantes",
+        content=json.dumps(input_part),
+        headers={**header_usr_2, "Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_create_tarefa_muito_grande(
+    truncate_tarefas,  # pylint: disable=unused-argument
+    input_part: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """Tenta enfileirar uma tarefa maior que o limite JOB_MAX_BYTES, com e
+    sem o cabeçalho Content-Length."""
+    conteudo = "\n".join(json.dumps(input_part) for _ in range(3)).encode()
+    monkeypatch.setattr(api, "JOB_MAX_BYTES", len(conteudo) - 1)
+    url = (
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        "/tarefas/participantes"
+    )
+    headers = {**header_usr_1, "Content-Type": "application/x-ndjson"}
+    response = client.post(url, content=conteudo, headers=headers)
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    def em_partes():
+        yield from (conteudo[i : i + 100] for i in range(0, len(conteudo), 100))
+
+    response = client.post(url, content=em_partes(), headers=headers)
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    with sync_engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM tarefa")).scalar() == 0
+
+    monkeypatch.setattr(api, "JOB_MAX_BYTES", len(conteudo))
+    response = client.post(url, content=em_partes(), headers=headers)
+    assert response.status_code == status.HTTP_202_ACCEPTED
+
+
+def test_progresso_na_transacao_dos_itens(
+    truncate_participantes,  # pylint: disable=unused-argument
+    truncate_tarefas,  # pylint: disable=unused-argument
+    input_part: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """Se o registro do progresso falhar, os itens gravados na mesma
+    transação também são desfeitos.
+    """
+    response = client.post(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        "/tarefas/participantes",
+        content=json.dumps(input_part),
+        headers={**header_usr_1, "Content-Type": "application/x-ndjson"},
+    )
+    location = response.headers["Location"]
+
+    async def registrar_progresso_tarefa(*_):
+        raise RuntimeError("falha ao registrar o progresso")
+
+    monkeypatch.setattr(crud, "registrar_progresso_tarefa", registrar_progresso_tarefa)
+    assert client.portal.call(worker.processar_proxima_tarefa)
+
+    tarefa = client.get(location, headers=header_usr_1).json()
+    assert tarefa["situacao"] == "falha"
+    assert tarefa["quantidade_processada"] == 0
+    response = client.get(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        f"/participante/{input_part['cpf_participante']}",
+        headers=header_usr_1,
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_reserva_expirada(
+    truncate_tarefas,  # pylint: disable=unused-argument
+    input_part: dict,
+    user1_credentials: dict,
+    header_usr_1: dict,
+    client: Client,
+):
+    """Uma tarefa cuja reserva expirou é reservada por outro processo, e o
+    processo anterior não consegue mais atualizá-la.
+    """
+    client.post(
+        f"/organizacao/{user1_credentials['cod_SIAPE_instituidora']}"
+        "/tarefas/participantes",
+        content=json.dumps(input_part),
+        headers={**header_usr_1, "Content-Type": "application/x-ndjson"},
+    )
+    anterior = client.portal.call(crud.claim_tarefa, DbContextManager(), 300)
+    assert client.portal.call(crud.claim_tarefa, DbContextManager(), 300) is None
+    with sync_engine.begin() as connection:
+        connection.execute(
+            text(
+                "UPDATE tarefa SET data_atualizacao = "
+                "data_atualizacao - interval '1 hour'"
+            )
+        )
+    atual = client.portal.call(crud.claim_tarefa, DbContextManager(), 300)
+    assert atual.id == anterior.id
+    assert atual.token_reserva != anterior.token_reserva
+
+    resultados = [{"linha": 1, "status_code": 201, "detail": None}]
+    with pytest.raises(crud.TarefaPerdida):
+        client.portal.call(
+            crud.update_progresso_tarefa,
+            DbContextManager(),
+            anterior.id,
+            anterior.token_reserva,
+            resultados,
+        )
+    with pytest.raises(crud.TarefaPerdida):
+        client.portal.call(
+            crud.finish_tarefa,
+            DbContextManager(),
+            anterior.id,
+            anterior.token_reserva,
+            models.SituacaoTarefa.concluida,
+        )
+    client.portal.call(
+        crud.update_progresso_tarefa,
+        DbContextManager(),
+        atual.id,
+        atual.token_reserva,
+        resultados,
+    )
+    client.portal.call(
+        crud.finish_tarefa,
+        DbContextManager(),
+        atual.id,
+        atual.token_reserva,
+        models.SituacaoTarefa.concluida,
+    )
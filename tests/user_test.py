@@ -1,10 +1,18 @@
 """
 Testes relacionados aos métodos de usuários.
 """
+import asyncio
+import base64
+import json
+import time
+
 from httpx import Client
 
 from fastapi import status
+import pytest
+from jwcrypto import jwk, jwt
 
+import users
 from tests.conftest import fief_admin
 
 
@@ -32,3 +40,124 @@ def test_get_user_self_logged_in(
         == user1_credentials["cod_SIAPE_instituidora"]
     )
     assert data.get("is_active", None) == True
+
+
+def test_get_user_cache_userinfo(
+    client: Client, header_usr_1: dict, monkeypatch: pytest.MonkeyPatch
+):
+    """Verifica se as informações do usuário são obtidas do Fief uma única
+    vez para requisições com o mesmo token."""
+    chamadas = []
+    userinfo = users.fief.userinfo
+
+    async def userinfo_contado(access_token: str):
+        chamadas.append(access_token)
+        return await userinfo(access_token)
+
+    monkeypatch.setattr(users.fief, "userinfo", userinfo_contado)
+    users.userinfo_cache.limpar()
+
+    for _ in range(3):
+        response = client.get("/user", headers=header_usr_1)
+        assert response.status_code == status.HTTP_200_OK
+    assert len(chamadas) == 1
+
+
+def test_expiracao_token():
+    """Lê a expiração de um token JWT e ignora tokens sem expiração."""
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": 1700000000}).encode())
+    token = f"cabecalho.{payload.decode().rstrip('=')}.assinatura"
+    assert users.expiracao_token(token) == 1700000000
+    assert users.expiracao_token("token-opaco") is None
+
+
+def test_fief_local_userinfo_rotacao_chaves(monkeypatch: pytest.MonkeyPatch):
+    """Lê as informações do usuário das claims de tokens assinados
+    localmente e verifica se as chaves do Fief são consultadas novamente
+    quando surge um token assinado com uma chave nova."""
+    chaves = [jwk.JWK.generate(kty="RSA", size=2048, kid=kid) for kid in "123"]
+    consultas = []
+
+    async def consultar_jwks(self):
+        consultas.append(1)
+        jwks = jwk.JWKSet()
+        for chave in chaves[: len(consultas)]:
+            jwks.add(chave)
+        return jwks
+
+    monkeypatch.setattr(users.FiefAsyncLocal, "_consultar_jwks", consultar_jwks)
+
+    def assinar(chave: jwk.JWK) -> str:
+        token = jwt.JWT(
+            header={"alg": "RS256", "kid": chave.key_id},
+            claims={
+                "sub": "aeeb8bfa-e8f4-4724-9427-c3d5af66190e",
+                "fields": {"cod_SIAPE_instituidora": 1},
+                "exp": int(time.time()) + 60,
+            },
+        )
+        token.make_signed_token(chave)
+        return token.serialize()
+
+    async def cenario():
+        cliente = users.FiefAsyncLocal(
+            "http://fief:8000", "client_id", "client_secret", local_userinfo=True
+        )
+        userinfo = await cliente.userinfo(assinar(chaves[0]))
+        assert userinfo["fields"]["cod_SIAPE_instituidora"] == 1
+        assert len(consultas) == 1
+
+        userinfo = await cliente.userinfo(assinar(chaves[1]))
+        assert userinfo["fields"]["cod_SIAPE_instituidora"] == 1
+        assert len(consultas) == 2
+
+        # Novas consultas por chaves desconhecidas respeitam o intervalo
+        # mínimo JWKS_MIN_REFRESH_INTERVAL
+        # pylint: disable=protected-access
+        assert await cliente._claims_verificadas(assinar(chaves[2])) is None
+        assert len(consultas) == 2
+
+    asyncio.run(cenario())
+
+
+def test_fief_jwks_vencidas(monkeypatch: pytest.MonkeyPatch):
+    """Verifica se as chaves vencidas continuam em uso enquanto uma tarefa
+    as renova e quando a consulta ao Fief falha."""
+    chave = jwk.JWK.generate(kty="RSA", size=2048, kid="1")
+    consultas = []
+    liberar = asyncio.Event()
+
+    async def consultar_jwks(self):  # pylint: disable=unused-argument
+        consultas.append(1)
+        if len(consultas) == 2:
+            await liberar.wait()
+        elif len(consultas) > 2:
+            raise ValueError("resposta inválida do Fief")
+        jwks = jwk.JWKSet()
+        jwks.add(chave)
+        return jwks
+
+    monkeypatch.setattr(users.FiefAsyncLocal, "_consultar_jwks", consultar_jwks)
+
+    async def cenario():
+        # pylint: disable=protected-access
+        cliente = users.FiefAsyncLocal("http://fief:8000", "id", "segredo")
+        conhecidas = await cliente._get_jwks()
+        cliente._jwks_expiracao = 0.0
+
+        renovacao = asyncio.create_task(cliente._get_jwks())
+        await asyncio.sleep(0)
+        assert len(consultas) == 2
+        assert await cliente._get_jwks() is conhecidas
+        assert len(consultas) == 2
+        liberar.set()
+        renovadas = await renovacao
+        assert renovadas is not conhecidas
+
+        cliente._jwks_expiracao = 0.0
+        assert await cliente._get_jwks() is renovadas
+        assert len(consultas) == 3
+        assert await cliente._get_jwks() is renovadas
+        assert len(consultas) == 3
+
+    asyncio.run(cenario())